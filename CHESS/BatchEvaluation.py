@@ -0,0 +1,125 @@
+"""
+Evaluation of many positions at once with NumPy, for offline tools such as tuning or labelling datasets.
+The positions are converted to an int8 array of shape (N, 64) holding a piece code per square (square = row * 8 +
+col, code 0 for an empty square), and scored with a single vectorised lookup of every code on its square in the
+pieceSquareValues of Evaluation, which combine pieceScore and the piecePositionScores tables.
+The scores are the same centipawn scores as the GameState's evalScore, from White's point of view.
+
+This module needs NumPy, which the rest of the engine doesn't: the search keeps its incremental evaluation, which
+costs less per position than handing single leaves to NumPy.
+
+Usage:
+    python BatchEvaluation.py positions.epd             Score every FEN / EPD line of a file, and report the speed
+    python BatchEvaluation.py positions.epd --check     Also compare every score with the GameState's evaluation
+"""
+
+import argparse
+import itertools
+import time
+
+import numpy as np
+
+import ChessEngineAdvanced
+from Evaluation import pieceSquareValues
+
+PIECES = ('--', 'wp', 'wN', 'wB', 'wR', 'wQ', 'wK', 'bp', 'bN', 'bB', 'bR', 'bQ', 'bK')
+PIECE_CODES = {piece: code for code, piece in enumerate(PIECES)}
+CHUNK_SIZE = 100000  # Lines of a file scored at once
+
+# pieceSquareTable[code, square]: centipawn value of the piece with that code on the square
+pieceSquareTable = np.zeros((len(PIECES), 64), dtype=np.int32)
+for _code, _piece in enumerate(PIECES[1:], 1):
+    pieceSquareTable[_code] = pieceSquareValues[_piece]
+squareIndices = np.arange(64)
+
+# FEN piece placement to codes: every digit is expanded to that many 1s (1 empty square each), and every character
+# is translated to its code. '/' is kept to check the rows, any other character becomes INVALID_CODE.
+INVALID_CODE = 255
+fenCodes = bytearray([INVALID_CODE] * 256)
+for _code, _char in enumerate(b'1PNBRQKpnbrqk'):
+    fenCodes[_char] = _code
+fenCodes[ord('/')] = ord('/')
+fenCodes = bytes(fenCodes)
+
+
+"""
+Returns the int8 (N, 64) piece codes of a list of boards (GameState.board lists).
+"""
+def encodeBoards(boards):
+    return np.fromiter((PIECE_CODES[piece] for board in boards for row in board for piece in row),
+                       dtype=np.int8, count=64 * len(boards)).reshape(len(boards), 64)
+
+
+"""
+Returns the int8 (N, 64) piece codes of a list of FEN (or EPD) strings. Only the piece placement is read.
+Raises ValueError naming the first FEN whose placement has an unknown character or not 8 rows of 8 squares.
+"""
+def encodeFENs(fens):
+    if len(fens) == 0:
+        return np.zeros((0, 64), dtype=np.int8)
+    # All the placements are converted as one string, with bytes operations, which is much faster than one by one.
+    # With a '/' after every placement, each one takes 72 bytes: 8 rows of 8 squares, each followed by a '/'.
+    placements = ('/'.join([fen.split(None, 1)[0] for fen in fens]) + '/').encode()
+    for n in range(2, 9):
+        placements = placements.replace(str(n).encode(), b'1' * n)
+    placements = placements.translate(fenCodes)
+    if len(placements) != 72 * len(fens):
+        for fen in fens[:-1]:
+            encodeFENs([fen])  # Raises on the first FEN with a wrong number of squares
+        raise ValueError('Invalid FEN piece placement: ' + fens[-1].strip())
+    rows = np.frombuffer(placements, dtype=np.uint8).reshape(len(fens), 8, 9)
+    codes = rows[:, :, :8].reshape(len(fens), 64)
+    invalid = (rows[:, :, 8] != ord('/')).any(axis=1) | (codes >= len(PIECES)).any(axis=1)
+    if invalid.any():
+        raise ValueError('Invalid FEN piece placement: ' + fens[int(np.argmax(invalid))].strip())
+    return codes.astype(np.int8)
+
+
+"""
+Returns the int32 (N,) scores of the positions of an (N, 64) array of piece codes, in centipawns from White's
+point of view.
+"""
+def evaluateBatch(codes):
+    return pieceSquareTable[codes, squareIndices].sum(axis=1)
+
+
+"""
+Returns the scores of a list of GameStates, like their evalScore but computed from their boards.
+"""
+def evaluateGameStates(gameStates):
+    return evaluateBatch(encodeBoards([gs.board for gs in gameStates]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Score the positions of a FEN / EPD file with NumPy.')
+    parser.add_argument('positions', help='File with a FEN or EPD per line')
+    parser.add_argument('--check', action='store_true', help="Compare every score with the GameState's")
+    args = parser.parse_args()
+
+    positions = mismatches = 0
+    elapsed = 0.0
+    with open(args.positions) as positionsFile:
+        while True:
+            chunk = list(itertools.islice(positionsFile, CHUNK_SIZE))
+            if not chunk:
+                break
+            lines = [line for line in chunk if line.strip()]
+            startTime = time.perf_counter()
+            scores = evaluateBatch(encodeFENs(lines))
+            elapsed += time.perf_counter() - startTime
+            positions += len(lines)
+            if args.check:
+                for line, score in zip(lines, scores):
+                    gs = ChessEngineAdvanced.GameState()
+                    gs.loadEPD(line)
+                    if gs.evalScore != score:
+                        mismatches += 1
+                        print('Mismatch: {} scores {}, the GameState {}'.format(line.strip(), score, gs.evalScore))
+    print('{} positions in {:.3f}s, {:.0f} positions per second'.format(
+        positions, elapsed, positions / elapsed if elapsed > 0 else 0))
+    if args.check:
+        print(str(mismatches) + ' mismatches')
+
+
+if __name__ == "__main__":
+    main()
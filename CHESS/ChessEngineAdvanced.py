@@ -5,6 +5,78 @@ It will also be responsible for determining the valid moves at the current state
 It will also keep a move log.
 """
 
+import random
+import re
+
+from Evaluation import pieceSquareValues
+
+# Zobrist keys: one random 64-bit number per piece on every square, for the side to move, every castling right and
+# every en-passant file. A position's key is the XOR of the numbers describing it, so a move only has to XOR out what
+# changed. The generator is seeded so keys are identical in every process and every run (e.g. for opening books).
+zobristRandom = random.Random(2021)
+zobristPieceKeys = {piece: [zobristRandom.getrandbits(64) for _ in range(64)]
+                    for piece in ('wp', 'wN', 'wB', 'wR', 'wQ', 'wK', 'bp', 'bN', 'bB', 'bR', 'bQ', 'bK')}
+zobristBlackToMoveKey = zobristRandom.getrandbits(64)
+zobristCastleKeys = {right: zobristRandom.getrandbits(64) for right in ('wks', 'wqs', 'bks', 'bqs')}
+zobristEnpassantKeys = [zobristRandom.getrandbits(64) for _ in range(8)]
+
+STARTING_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+FEN_CASTLING_PATTERN = re.compile(r'-|K?Q?k?q?')
+FEN_ENPASSANT_PATTERN = re.compile(r'-|[a-h][36]')
+# (row, col) of the King and of the Rook every castling right of a FEN needs
+CASTLING_SQUARES = {'K': ((7, 4), (7, 7)), 'Q': ((7, 4), (7, 0)), 'k': ((0, 4), (0, 7)), 'q': ((0, 4), (0, 0))}
+# An EPD operation runs up to the next ';' outside quotes, its tokens are words or quoted strings
+EPD_OPERATION_PATTERN = re.compile(r'(?:[^;"]|"[^"]*")+')
+EPD_TOKEN_PATTERN = re.compile(r'"[^"]*"|[^\s"]+')
+
+# (row, col) offsets of the piece movements
+rookDirections = ((-1, 0), (0, -1), (1, 0), (0, 1))
+bishopDirections = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+knightJumps = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+kingSteps = ((0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1), (-1, 0), (-1, 1))
+
+
+"""
+Returns the squares from (r, c) in direction d up to the edge of the board, nearest first.
+"""
+def buildRay(r, c, d):
+    ray = []
+    endRow = r + d[0]
+    endCol = c + d[1]
+    while 0 <= endRow <= 7 and 0 <= endCol <= 7:
+        ray.append((endRow, endCol))
+        endRow += d[0]
+        endCol += d[1]
+    return tuple(ray)
+
+
+# Lookup tables of the piece movements, built once at import, so the move generators don't compute offsets and
+# check the edges of the board. They are indexed by square = row * 8 + col and hold (row, col) target squares.
+# knightTargets / kingTargets: every square the piece reaches from the square.
+# rookRays / bishopRays / queenRays: a (direction, ray) pair per direction, the ray from buildRay.
+# The queenRays have the 4 Rook directions first, then the 4 Bishop ones.
+# betweenSquares[sq1][sq2]: the squares strictly between two squares on one line, () if they aren't on one line.
+knightTargets = []
+kingTargets = []
+rookRays = []
+bishopRays = []
+queenRays = []
+betweenSquares = []
+for _r in range(8):
+    for _c in range(8):
+        knightTargets.append(tuple((_r + d[0], _c + d[1]) for d in knightJumps
+                                   if 0 <= _r + d[0] <= 7 and 0 <= _c + d[1] <= 7))
+        kingTargets.append(tuple((_r + d[0], _c + d[1]) for d in kingSteps
+                                 if 0 <= _r + d[0] <= 7 and 0 <= _c + d[1] <= 7))
+        rookRays.append(tuple((d, buildRay(_r, _c, d)) for d in rookDirections))
+        bishopRays.append(tuple((d, buildRay(_r, _c, d)) for d in bishopDirections))
+        queenRays.append(rookRays[-1] + bishopRays[-1])
+        _between = [()] * 64
+        for _d, _ray in queenRays[-1]:
+            for _i in range(len(_ray)):
+                _between[_ray[_i][0] * 8 + _ray[_i][1]] = _ray[:_i]
+        betweenSquares.append(_between)
+
 
 class GameState:
     def __init__(self):
@@ -41,14 +113,165 @@ class GameState:
         self.inCheck = False
         self.pins = []
         self.checks = []
+        self.enemyAttacks = 0  # Bitmask (bit row * 8 + col) of the squares the opponent attacks
+
+        # Zobrist key of the current position, updated by every move.
+        self.zobristKey = self.computeZobristKey()
+        self.zobristKeyLog = [self.zobristKey]
+
+        # Material and position score of the pieces in centipawns (White's point of view), updated by every move.
+        self.evalScore = self.computeEvalScore()
+        self.evalScoreLog = [self.evalScore]
+
+        # Number of pieces (Kings and Pawns included) on the board, e.g. to know when the endgame tablebases apply.
+        self.pieceCount = sum(piece != '--' for row in self.board for piece in row)
+
+    """
+    Sets up the position described by a FEN string, forgetting the moves played so far.
+    The halfmove clock and move number fields are accepted but not used.
+    Raises ValueError on a FEN which isn't valid, leaving the GameState unchanged: e.g. an unknown piece, not one King
+    per side, a Pawn on the first or last rank, a castling right without the King and Rook on their squares, or an
+    en passant square on the wrong rank for the side to move.
+    """
+    def loadFEN(self, fen):
+        fields = fen.split()
+        if len(fields) < 2 or len(fields) > 6:
+            raise ValueError('Invalid FEN: ' + fen)
+        rows = fields[0].split('/')
+        castling = fields[2] if len(fields) > 2 else '-'
+        enpassant = fields[3] if len(fields) > 3 else '-'
+        if len(rows) != 8 or fields[1] not in ('w', 'b') or FEN_CASTLING_PATTERN.fullmatch(castling) is None or \
+                FEN_ENPASSANT_PATTERN.fullmatch(enpassant) is None:
+            raise ValueError('Invalid FEN: ' + fen)
+
+        board = []
+        kingLocations = {'wK': [], 'bK': []}
+        for r, row in enumerate(rows):
+            squares = []
+            for char in row:
+                if char in '12345678':
+                    squares.extend(['--'] * int(char))
+                elif char in 'PNBRQKpnbrqk':
+                    piece = ('w' if char.isupper() else 'b') + (char.upper() if char not in 'pP' else 'p')
+                    if piece in kingLocations:
+                        kingLocations[piece].append((r, len(squares)))
+                    squares.append(piece)
+                else:
+                    raise ValueError('Invalid FEN: ' + fen)
+            if len(squares) != 8:
+                raise ValueError('Invalid FEN: ' + fen)
+            board.append(squares)
+        if len(kingLocations['wK']) != 1 or len(kingLocations['bK']) != 1:
+            raise ValueError('Invalid FEN: ' + fen)
+        if 'wp' in board[0] + board[7] or 'bp' in board[0] + board[7]:
+            raise ValueError('Invalid FEN: ' + fen)
+        for right in castling.replace('-', ''):
+            kingSquare, rookSquare = CASTLING_SQUARES[right]
+            color = 'w' if right.isupper() else 'b'
+            if board[kingSquare[0]][kingSquare[1]] != color + 'K' or board[rookSquare[0]][rookSquare[1]] != color + 'R':
+                raise ValueError('Invalid FEN: ' + fen)
+        if enpassant != '-' and enpassant[1] != ('6' if fields[1] == 'w' else '3'):
+            raise ValueError('Invalid FEN: ' + fen)
+
+        self.board = board
+        self.whiteKingLocation = kingLocations['wK'][0]
+        self.blackKingLocation = kingLocations['bK'][0]
+        self.whiteToMove = fields[1] == 'w'
+        self.currentCastlingRight = CastleRights('K' in castling, 'k' in castling, 'Q' in castling, 'q' in castling)
+        self.castleRightsLog = [CastleRights(self.currentCastlingRight.wks, self.currentCastlingRight.bks,
+                                             self.currentCastlingRight.wqs, self.currentCastlingRight.bqs)]
+        if enpassant != '-':
+            self.enpassantPossible = (Move.ranksToRows[enpassant[1]], Move.filesToCols[enpassant[0]])
+        else:
+            self.enpassantPossible = ()
+        self.enpassantPossibleLog = [self.enpassantPossible]
+
+        self.moveLog = []
+        self.checkmate = False
+        self.stalemate = False
+        self.inCheck = False
+        self.pins = []
+        self.checks = []
+        self.enemyAttacks = 0  # Bitmask (bit row * 8 + col) of the squares the opponent attacks
+        self.zobristKey = self.computeZobristKey()
+        self.zobristKeyLog = [self.zobristKey]
+        self.evalScore = self.computeEvalScore()
+        self.evalScoreLog = [self.evalScore]
+        self.pieceCount = sum(piece != '--' for row in self.board for piece in row)
+
+    """
+    Returns the FEN string of the current position. The halfmove clock isn't tracked and is always 0, and the move
+    number counts the moves in the moveLog.
+    """
+    def getFEN(self):
+        rows = []
+        for row in self.board:
+            fenRow = ''
+            emptySquares = 0
+            for square in row:
+                if square == '--':
+                    emptySquares += 1
+                    continue
+                if emptySquares:
+                    fenRow += str(emptySquares)
+                    emptySquares = 0
+                fenRow += square[1].upper() if square[0] == 'w' else square[1].lower()
+            if emptySquares:
+                fenRow += str(emptySquares)
+            rows.append(fenRow)
+
+        castling = ('K' if self.currentCastlingRight.wks else '') + ('Q' if self.currentCastlingRight.wqs else '') + \
+                   ('k' if self.currentCastlingRight.bks else '') + ('q' if self.currentCastlingRight.bqs else '')
+        if self.enpassantPossible:
+            enpassant = Move.colsToFiles[self.enpassantPossible[1]] + Move.rowsToRanks[self.enpassantPossible[0]]
+        else:
+            enpassant = '-'
+        return ' '.join(['/'.join(rows), 'w' if self.whiteToMove else 'b', castling or '-', enpassant, '0',
+                         str(len(self.moveLog) // 2 + 1)])
+
+    """
+    Sets up the position of an EPD (Extended Position Description) line: the first 4 fields of a FEN, followed by
+    operations such as  bm Nf3 Qxe5;  or  id "WAC.001";  Returns the operations as a dictionary of opcode -> list
+    of operands, string operands without their quotes.
+    """
+    def loadEPD(self, epd):
+        fields = epd.split(None, 4)
+        if len(fields) < 4:
+            raise ValueError('Invalid EPD: ' + epd)
+        self.loadFEN(' '.join(fields[:4]))
+        operations = {}
+        for operation in EPD_OPERATION_PATTERN.findall(fields[4] if len(fields) > 4 else ''):
+            tokens = [token[1:-1] if token.startswith('"') else token
+                      for token in EPD_TOKEN_PATTERN.findall(operation)]
+            if tokens:
+                operations[tokens[0]] = tokens[1:]
+        return operations
+
+    """
+    Computes the Zobrist key of the current position from scratch.
+    """
+    def computeZobristKey(self):
+        key = 0
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece != '--':
+                    key ^= zobristPieceKeys[piece][r * 8 + c]
+        if not self.whiteToMove:
+            key ^= zobristBlackToMoveKey
+        for right in ('wks', 'wqs', 'bks', 'bqs'):
+            if getattr(self.currentCastlingRight, right):
+                key ^= zobristCastleKeys[right]
+        if self.enpassantPossible:
+            key ^= zobristEnpassantKeys[self.enpassantPossible[1]]
+        return key
 
     """
     Takes a move as a parameter and executes it.
     The functioning of Castling is not available in this.
     """
     def makeMove(self, move):
-        self.board[move.startRow][move.startCol] = '--'
-        self.board[move.endRow][move.endCol] = move.pieceMoved
+        self.movePieces(move)
         self.moveLog.append(move)  # Log the move that occurred in game. It is also used to undo move.
         self.whiteToMove = not self.whiteToMove  # Make next Turn
         # Update Kings' Location if they moved
@@ -62,6 +285,24 @@ class GameState:
             self.enpassantPossible = ((move.startRow + move.endRow)//2, move.endCol)
         else:  # Otherwise reset the variable.
             self.enpassantPossible = ()
+        self.enpassantPossibleLog.append(self.enpassantPossible)
+
+        # Update castling rights - whenever it is a rook or a King move
+        self.updateCastleRights(move)
+        self.castleRightsLog.append(CastleRights(self.currentCastlingRight.wks, self.currentCastlingRight.bks,
+                                                 self.currentCastlingRight.wqs, self.currentCastlingRight.bqs))
+
+        self.updateZobristKey(move)
+        if move.isCapture:
+            self.pieceCount -= 1
+        self.updateEvalScore(move)
+
+    """
+    Moves the pieces of a move on the board: the piece moved, and the pawn taken en passant or the Rook of a Castle.
+    """
+    def movePieces(self, move):
+        self.board[move.startRow][move.startCol] = '--'
+        self.board[move.endRow][move.endCol] = move.pieceMoved
 
         # En-passant Move
         if move.enPassant:
@@ -70,7 +311,7 @@ class GameState:
         # Pawn Promotion
         if move.isPawnPromotion:
             # promotedPiece = input("Promote to Q, R, B or N?: ")  # Ask user to choose which piece to Promote.
-            promotedPiece = 'Q'
+            promotedPiece = move.promotionPiece
             self.board[move.endRow][move.endCol] = move.pieceMoved[0] + promotedPiece
 
         # Castle move
@@ -84,12 +325,96 @@ class GameState:
                 self.board[move.endRow][move.endCol+1] = self.board[move.endRow][move.endCol-2]
                 self.board[move.endRow][move.endCol-2] = '--'  # Remove Rook from old square
 
-        self.enpassantPossibleLog.append(self.enpassantPossible)
+    """
+    Takes the pieces of a move back on the board, the reverse of movePieces.
+    """
+    def unmovePieces(self, move):
+        self.board[move.startRow][move.startCol] = move.pieceMoved
+        self.board[move.endRow][move.endCol] = move.pieceCaptured
 
-        # Update castling rights - whenever it is a rook or a King move
-        self.updateCastleRights(move)
-        self.castleRightsLog.append(CastleRights(self.currentCastlingRight.wks, self.currentCastlingRight.bks,
-                                                 self.currentCastlingRight.wqs, self.currentCastlingRight.bqs))
+        # Undo an enpassant move
+        if move.enPassant:
+            self.board[move.endRow][move.endCol] = '--'  # Leave the landing square blank
+            self.board[move.startRow][move.endCol] = move.pieceCaptured
+
+        # Undo the Castle Move
+        if move.castle:
+            if move.endCol - move.startCol == 2:  # King side Castle
+                self.board[move.endRow][move.endCol + 1] = self.board[move.endRow][move.endCol - 1]
+                self.board[move.endRow][move.endCol - 1] = '--'
+            else:  # Queen side Castle
+                self.board[move.endRow][move.endCol - 2] = self.board[move.endRow][move.endCol + 1]
+                self.board[move.endRow][move.endCol + 1] = '--'
+
+    """
+    Computes the material and position score of the current position from scratch.
+    """
+    def computeEvalScore(self):
+        score = 0
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece != '--':
+                    score += pieceSquareValues[piece][r * 8 + c]
+        return score
+
+    """
+    Adds the change in material and position score made by the move (which has just been made), and logs the score.
+    """
+    def updateEvalScore(self, move):
+        endSq = move.endRow * 8 + move.endCol
+        score = self.evalScore - pieceSquareValues[move.pieceMoved][move.startRow * 8 + move.startCol]
+        score += pieceSquareValues[move.getEndPiece()][endSq]
+        if move.isCapture:
+            captureSq = move.startRow * 8 + move.endCol if move.enPassant else endSq
+            score -= pieceSquareValues[move.pieceCaptured][captureSq]
+        if move.castle:
+            rookValues = pieceSquareValues[move.pieceMoved[0] + 'R']
+            if move.endCol - move.startCol == 2:  # King side Castle
+                score += rookValues[endSq - 1] - rookValues[endSq + 1]
+            else:  # Queen side Castle
+                score += rookValues[endSq + 1] - rookValues[endSq - 2]
+        self.evalScore = score
+        self.evalScoreLog.append(score)
+
+    """
+    XORs the changes made by the move (which has just been made) into the Zobrist key, and logs the new key.
+    """
+    def updateZobristKey(self, move):
+        key = self.zobristKey ^ zobristBlackToMoveKey
+        startSq = move.startRow * 8 + move.startCol
+        endSq = move.endRow * 8 + move.endCol
+        key ^= zobristPieceKeys[move.pieceMoved][startSq]
+        key ^= zobristPieceKeys[move.getEndPiece()][endSq]
+        if move.isCapture:
+            captureSq = move.startRow * 8 + move.endCol if move.enPassant else endSq
+            key ^= zobristPieceKeys[move.pieceCaptured][captureSq]
+        if move.castle:
+            rook = move.pieceMoved[0] + 'R'
+            if move.endCol - move.startCol == 2:  # King side Castle
+                key ^= zobristPieceKeys[rook][endSq + 1] ^ zobristPieceKeys[rook][endSq - 1]
+            else:  # Queen side Castle
+                key ^= zobristPieceKeys[rook][endSq - 2] ^ zobristPieceKeys[rook][endSq + 1]
+
+        previousEnpassant = self.enpassantPossibleLog[-2]
+        if previousEnpassant:
+            key ^= zobristEnpassantKeys[previousEnpassant[1]]
+        if self.enpassantPossible:
+            key ^= zobristEnpassantKeys[self.enpassantPossible[1]]
+
+        oldRights = self.castleRightsLog[-2]
+        newRights = self.currentCastlingRight
+        if oldRights.wks != newRights.wks:
+            key ^= zobristCastleKeys['wks']
+        if oldRights.wqs != newRights.wqs:
+            key ^= zobristCastleKeys['wqs']
+        if oldRights.bks != newRights.bks:
+            key ^= zobristCastleKeys['bks']
+        if oldRights.bqs != newRights.bqs:
+            key ^= zobristCastleKeys['bqs']
+
+        self.zobristKey = key
+        self.zobristKeyLog.append(key)
 
     """
     Undo the last move in the Move Log.
@@ -97,8 +422,7 @@ class GameState:
     def undoMove(self):
         if len(self.moveLog) != 0:
             move = self.moveLog.pop()
-            self.board[move.startRow][move.startCol] = move.pieceMoved
-            self.board[move.endRow][move.endCol] = move.pieceCaptured
+            self.unmovePieces(move)
             self.whiteToMove = not self.whiteToMove  # Switch turns back
 
             # Update Kings' Location if they moved
@@ -107,11 +431,6 @@ class GameState:
             elif move.pieceMoved == 'bK':
                 self.blackKingLocation = (move.startRow, move.startCol)
 
-            # Undo an enpassant move
-            if move.enPassant:
-                self.board[move.endRow][move.endCol] = '--'  # Leave the landing square blank
-                self.board[move.startRow][move.endCol] = move.pieceCaptured
-
             # Undo enpassant possiblilty from it's log.
             self.enpassantPossibleLog.pop()
             self.enpassantPossible = self.enpassantPossibleLog[-1]
@@ -121,14 +440,13 @@ class GameState:
             newRights = self.castleRightsLog[-1]  # Set the previous castle rights as current.
             self.currentCastlingRight = CastleRights(newRights.wks, newRights.bks, newRights.wqs, newRights.bqs)
 
-            # Undo the Castle Move
-            if move.castle:
-                if move.endCol - move.startCol == 2:  # King side Castle
-                    self.board[move.endRow][move.endCol + 1] = self.board[move.endRow][move.endCol - 1]
-                    self.board[move.endRow][move.endCol - 1] = '--'
-                else:  # Queen side Castle
-                    self.board[move.endRow][move.endCol - 2] = self.board[move.endRow][move.endCol + 1]
-                    self.board[move.endRow][move.endCol + 1] = '--'
+            # Undo the Zobrist key and the score
+            self.zobristKeyLog.pop()
+            self.zobristKey = self.zobristKeyLog[-1]
+            self.evalScoreLog.pop()
+            self.evalScore = self.evalScoreLog[-1]
+            if move.isCapture:
+                self.pieceCount += 1
 
         # This resets the flags after undo move is called.
         # (Undo is called not only by the player but also the AI Algorithms too)
@@ -141,6 +459,7 @@ class GameState:
     def getValidMoves(self):
         moves = []
         self.inCheck, self.pins, self.checks = self.checkForPinsAndChecks()
+        self.enemyAttacks = self.getEnemyAttacks()
         if self.whiteToMove:
             kingRow = self.whiteKingLocation[0]
             kingCol = self.whiteKingLocation[1]
@@ -154,24 +473,15 @@ class GameState:
                 check = self.checks[0]  # Check info
                 checkRow = check[0]
                 checkCol = check[1]
-                pieceChecking = self.board[checkRow][checkCol]  # The attacking piece
-                validSquares = []  # The list of squares the piece can move to block Check
-
-                # If attacking piece is a Knight, either capture it or move the King, other pieces can be blocked
-                if pieceChecking[1] == 'N':
-                    validSquares = [(checkRow, checkCol)]
-                else:
-                    for i in range(1, 8):
-                        # check[2] and check[3] are check directions
-                        validSquare = (kingRow + check[2] * i, kingCol + check[3] * i)
-                        validSquares.append(validSquare)
-                        # Once you get to piece and checks
-                        if validSquare[0] == checkRow and validSquare[1] == checkCol:
-                            break
+                # The checking piece can be captured, and unless it is a Knight or a Pawn it can be blocked on the
+                # squares between it and the King (there are none for a Knight or a Pawn)
+                validSquares = betweenSquares[kingRow * 8 + kingCol][checkRow * 8 + checkCol] + ((checkRow, checkCol),)
 
                 # Remove the moves that don't block the check or move the King
                 for i in range(len(moves) - 1, -1, -1):  # Going through the list backwards
-                    if moves[i].pieceMoved[1] != 'K':  # King doesn't move so it must block check or capture enemy piece
+                    # King doesn't move so it must block check or capture enemy piece.
+                    # En-passant captures were already tried on the board in getPawnMoves.
+                    if moves[i].pieceMoved[1] != 'K' and not moves[i].enPassant:
                         if not (moves[i].endRow, moves[i].endCol) in validSquares:  # Move isn't block or capture
                             moves.remove(moves[i])
             else:  # Double check, King has to move
@@ -197,6 +507,18 @@ class GameState:
 
         return moves
 
+    """
+    Only the captures and promotions among the valid moves, for the quiescence search. No moves at all are generated
+    for the quiet moves, so this is a lot cheaper than filtering getValidMoves.
+    When the player is in check all valid moves are returned instead, since every way out of check has to be searched.
+    """
+    def getCaptureMoves(self):
+        self.inCheck, self.pins, self.checks = self.checkForPinsAndChecks()
+        if self.inCheck:
+            return self.getValidMoves()
+        self.enemyAttacks = self.getEnemyAttacks()
+        return self.getAllPossiblesMoves(capturesOnly=True)
+
     """
     Determine if the current player is in Check or not.
     """
@@ -208,34 +530,60 @@ class GameState:
 
     """
     Determine if the enemy can attack the square (r, c) in focus or not.
+    Looks outward from the square for the pieces which could attack it, so no moves are generated.
     """
     def squareUnderAttack(self, r, c):
-        self.whiteToMove = not self.whiteToMove  # Switch to opponent's POV
-        oppMoves = self.getAllPossiblesMoves()
-        self.whiteToMove = not self.whiteToMove  # Switch the turns back
-        for move in oppMoves:
-            if move.endRow == r and move.endCol == c:
+        enemyColor = 'b' if self.whiteToMove else 'w'
+        board = self.board
+
+        # Pawns attack diagonally forward, so an enemy pawn has to be one row closer to its own side.
+        pawnRow = r - 1 if self.whiteToMove else r + 1
+        if 0 <= pawnRow <= 7:
+            enemyPawn = enemyColor + 'p'
+            if (c - 1 >= 0 and board[pawnRow][c - 1] == enemyPawn) or \
+                    (c + 1 <= 7 and board[pawnRow][c + 1] == enemyPawn):
+                return True
+
+        sq = r * 8 + c
+        enemyKnight = enemyColor + 'N'
+        for endRow, endCol in knightTargets[sq]:
+            if board[endRow][endCol] == enemyKnight:
+                return True
+
+        enemyKing = enemyColor + 'K'
+        for endRow, endCol in kingTargets[sq]:
+            if board[endRow][endCol] == enemyKing:
                 return True
+
+        # Rooks and Queens along the ranks and files, Bishops and Queens along the diagonals.
+        for rays, sliders in ((rookRays[sq], 'RQ'), (bishopRays[sq], 'BQ')):
+            for d, ray in rays:
+                for endRow, endCol in ray:
+                    endPiece = board[endRow][endCol]
+                    if endPiece != '--':
+                        if endPiece[0] == enemyColor and endPiece[1] in sliders:
+                            return True
+                        break  # The first piece on the ray blocks everything behind it
         return False
 
     """
-    All moves without considering checks.
+    All moves without considering checks. With capturesOnly, just the captures and promotions.
     """
-    def getAllPossiblesMoves(self):
+    def getAllPossiblesMoves(self, capturesOnly=False):
         moves = []
         for r in range(len(self.board)):
             for c in range(len(self.board[r])):
                 turn = self.board[r][c][0]
                 if (turn == 'b' and not self.whiteToMove) or (turn == 'w' and self.whiteToMove):
                     piece = self.board[r][c][1]
-                    self.moveFunctions[piece](r, c, moves)
+                    self.moveFunctions[piece](r, c, moves, capturesOnly)
 
         return moves
 
     """
     Get all the Pawn moves for a Pawn located at given row, col and add these moves to the list.
     """
-    def getPawnMoves(self, r, c, moves):
+    def getPawnMoves(self, r, c, moves, capturesOnly=False):
         piecePinned = False
         pinDirection = ()
         for i in range(len(self.pins)-1, -1, -1):
@@ -250,78 +598,59 @@ class GameState:
             moveAmount = -1
             startRow = 6
             enemyColor = 'b'
-            kingRow, kingCol = self.whiteKingLocation
         else:
             moveAmount = 1
             startRow = 1
             enemyColor = 'w'
-            kingRow, kingCol = self.blackKingLocation
 
-        # 1 square pawn advance
-        if self.board[r + moveAmount][c] == '--':
+        # 1 square pawn advance (only a promotion, if capturesOnly)
+        if self.board[r + moveAmount][c] == '--' and (not capturesOnly or r + moveAmount in (0, 7)):
             if not piecePinned or pinDirection == (moveAmount, 0):
-                moves.append(Move((r, c), (r + moveAmount, c), self.board))
+                self.addPawnMove((r, c), (r + moveAmount, c), moves)
                 # 2 square pawn advance from the starting position
-                if r == startRow and self.board[r + 2 * moveAmount][c] == '--':
+                if r == startRow and self.board[r + 2 * moveAmount][c] == '--' and not capturesOnly:
                     moves.append(Move((r, c), (r + 2 * moveAmount, c), self.board))
-        # Captures to the left
-        if c-1 >= 0:
-            if not piecePinned or pinDirection == (moveAmount, -1):
-                if self.board[r + moveAmount][c - 1][0] == enemyColor:  # Enemy piece to capture
-                    moves.append(Move((r, c), (r + moveAmount, c-1), self.board))
-                if (r + moveAmount, c - 1) == self.enpassantPossible:
-                    attackingPiece = blockingPiece = False
-                    if kingRow == r:
-                        if kingCol < c:  # King is to left of pawn
-                            # Inside between King and pawn; outside range between pawn and border
-                            insideRange = range(kingCol + 1, c - 1)
-                            outsideRange = range(c + 1, 8)
-                        else:
-                            insideRange = range(kingCol - 1, c, -1)
-                            outsideRange = range(c - 2, -1, -1)
-
-                        for i in insideRange:
-                            if self.board[r][i] != '--':  # Some other piece besides en-passant pawns blocks
-                                blockingPiece = True
-                        for i in outsideRange:
-                            square = self.board[r][i]
-                            if square[0] == enemyColor and square[1] in ['R', 'Q']:
-                                    attackingPiece = True
-                            elif square != '--':
-                                blockingPiece = True
-                    if not attackingPiece or blockingPiece:
-                        moves.append(Move((r, c), (r + moveAmount, c - 1), self.board, enPassant=True))
-        # Captures to the right
-        if c+1 <= 7:
-            if not piecePinned or pinDirection == (-1, 1):
-                if self.board[r + moveAmount][c + 1][0] == enemyColor:
-                    moves.append(Move((r, c), (r + moveAmount, c + 1), self.board))
-                if (r + moveAmount, c+1) == self.enpassantPossible:
-                    attackingPiece = blockingPiece = False
-                    if kingRow == r:
-                        if kingCol < c:  # King is to left of pawn
-                            # Inside between King and pawn; outside range between pawn and border
-                            insideRange = range(kingCol + 1, c)
-                            outsideRange = range(c + 2, 8)
-                        else:
-                            insideRange = range(kingCol - 1, c + 1, -1)
-                            outsideRange = range(c - 1, -1, -1)
-
-                        for i in insideRange:
-                            if self.board[r][i] != '--':  # Some other piece besides en-passant pawns blocks
-                                blockingPiece = True
-                        for i in outsideRange:
-                            square = self.board[r][i]
-                            if square[0] == enemyColor and square[1] in ['R', 'Q']:
-                                    attackingPiece = True
-                            elif square != '--':
-                                blockingPiece = True
-                    if not attackingPiece or blockingPiece:
-                        moves.append(Move((r, c), (r + moveAmount, c - 1), self.board, enPassant=True))
+        # Captures to the left (colDirection -1) and to the right (colDirection 1)
+        for colDirection in (-1, 1):
+            endCol = c + colDirection
+            if 0 <= endCol <= 7:
+                if not piecePinned or pinDirection == (moveAmount, colDirection):
+                    if self.board[r + moveAmount][endCol][0] == enemyColor:  # Enemy piece to capture
+                        self.addPawnMove((r, c), (r + moveAmount, endCol), moves)
+                    if (r + moveAmount, endCol) == self.enpassantPossible and \
+                            self.enpassantIsLegal(r, c, r + moveAmount, endCol):
+                        moves.append(Move((r, c), (r + moveAmount, endCol), self.board, enPassant=True))
+
+    """
+    Adds a pawn move to the list. A pawn reaching the last rank adds one move for every piece it can promote to.
+    """
+    def addPawnMove(self, startSq, endSq, moves):
+        if endSq[0] == 0 or endSq[0] == 7:
+            for promotionPiece in ('Q', 'R', 'B', 'N'):
+                moves.append(Move(startSq, endSq, self.board, promotionPiece=promotionPiece))
+        else:
+            moves.append(Move(startSq, endSq, self.board))
+
+    """
+    En-passant removes two pawns from the same rank at once, which can expose the King in ways the pins don't show
+    (or, when the pawn which just moved is giving check, take the check away). So the capture is tried on the board.
+    """
+    def enpassantIsLegal(self, r, c, endRow, endCol):
+        pawn = self.board[r][c]
+        capturedPawn = self.board[r][endCol]
+        self.board[r][c] = '--'
+        self.board[r][endCol] = '--'
+        self.board[endRow][endCol] = pawn
+        inCheck = self.checkForPinsAndChecks()[0]
+        self.board[r][c] = pawn
+        self.board[r][endCol] = capturedPawn
+        self.board[endRow][endCol] = '--'
+        return not inCheck
+
     """
     Get all the Rook moves for a Rook located at given row, col and add these moves to the list.
     """
-    def getRookMoves(self, r, c, moves):
+    def getRookMoves(self, r, c, moves, capturesOnly=False):
         piecePinned = False
         pinDirection = ()
         for i in range(len(self.pins)-1, -1, -1):
@@ -332,52 +661,46 @@ class GameState:
                     self.pins.remove(self.pins[i])
                 break
 
-        directions = ((-1, 0), (0, -1), (1, 0), (0, 1))
-        # allyColor = 'w' if self.whiteToMove else 'b'
         enemyColor = 'b' if self.whiteToMove else 'w'
-        for d in directions:
-            for i in range(1, 8):
-                endRow = r + d[0] * i
-                endCol = c + d[1] * i
-                if 0 <= endRow < 8 and 0 <= endCol < 8:
-                    # If the piece is pinned, it can still move towards or away from the attacker keeping the pin.
-                    if not piecePinned or pinDirection == d or pinDirection == (-d[0], -d[1]):
-                        endPiece = self.board[endRow][endCol]
-                        if endPiece[0] == '-':
-                            moves.append(Move((r, c), (endRow, endCol), self.board))
-                        elif endPiece[0] == enemyColor:
-                            moves.append(Move((r, c), (endRow, endCol), self.board))
-                            break
-                        else:
-                            break
-                else:
-                    break
+        board = self.board
+        for d, ray in rookRays[r * 8 + c]:
+            # If the piece is pinned, it can still move towards or away from the attacker keeping the pin.
+            if not piecePinned or pinDirection == d or pinDirection == (-d[0], -d[1]):
+                for endSq in ray:
+                    endPiece = board[endSq[0]][endSq[1]]
+                    if endPiece[0] == '-':
+                        if not capturesOnly:
+                            moves.append(Move((r, c), endSq, board))
+                    elif endPiece[0] == enemyColor:
+                        moves.append(Move((r, c), endSq, board))
+                        break
+                    else:
+                        break
 
     """
     Get all the Knight moves for a Knight located at given row, col and add these moves to the list.
     """
-    def getKnightMoves(self, r, c, moves):
+    def getKnightMoves(self, r, c, moves, capturesOnly=False):
         piecePinned = False
         for i in range(len(self.pins)-1, -1, -1):
             if self.pins[i][0] == r and self.pins[i][1] == c:
                 piecePinned = True
                 self.pins.remove(self.pins[i])
                 break
+        if piecePinned:  # A pinned Knight can never move along the pin
+            return
 
-        possibleJumps = ((r-1, c+2), (r+1, c+2), (r+2, c-1), (r+2, c+1), (r-1, c-2), (r+1, c-2), (r-2, c-1), (r-2, c+1))
         allyColor = 'w' if self.whiteToMove else 'b'
-        for jump in possibleJumps:
-            nrow = jump[0]
-            ncol = jump[1]
-            if 0 <= nrow <= 7 and 0 <= ncol <= 7:
-                if not piecePinned:
-                    if self.board[nrow][ncol][0] != allyColor:
-                        moves.append(Move((r, c), (nrow, ncol), self.board))
+        board = self.board
+        for endSq in knightTargets[r * 8 + c]:
+            endPiece = board[endSq[0]][endSq[1]]
+            if endPiece[0] != allyColor and (not capturesOnly or endPiece != '--'):
+                moves.append(Move((r, c), endSq, board))
 
     """
     Get all the Bishop moves for a Bishop located at given row, col and add these moves to the list.
     """
-    def getBishopMoves(self, r, c, moves):
+    def getBishopMoves(self, r, c, moves, capturesOnly=False):
         piecePinned = False
         pinDirection = ()
         for i in range(len(self.pins)-1, -1, -1):
@@ -387,69 +710,47 @@ class GameState:
                 self.pins.remove(self.pins[i])
                 break
 
-        directions = ((-1, -1), (1, -1), (-1, 1), (1, 1))
-        # allyColor = 'w' if self.whiteToMove else 'b'
         enemyColor = 'b' if self.whiteToMove else 'w'
-        for d in directions:
-            for i in range(1, 8):
-                endRow = r + d[0] * i
-                endCol = c + d[1] * i
-                if 0 <= endRow < 8 and 0 <= endCol < 8:
-                    if not piecePinned or pinDirection == d or pinDirection == (-d[0], -d[1]):
-                        endPiece = self.board[endRow][endCol]
-                        if endPiece[0] == '-':
-                            moves.append(Move((r, c), (endRow, endCol), self.board))
-                        elif endPiece[0] == enemyColor:
-                            moves.append(Move((r, c), (endRow, endCol), self.board))
-                            break
-                        else:  # Ally piece
-                            break
-                else:  # Off the board
-                    break
+        board = self.board
+        for d, ray in bishopRays[r * 8 + c]:
+            if not piecePinned or pinDirection == d or pinDirection == (-d[0], -d[1]):
+                for endSq in ray:
+                    endPiece = board[endSq[0]][endSq[1]]
+                    if endPiece[0] == '-':
+                        if not capturesOnly:
+                            moves.append(Move((r, c), endSq, board))
+                    elif endPiece[0] == enemyColor:
+                        moves.append(Move((r, c), endSq, board))
+                        break
+                    else:  # Ally piece
+                        break
 
     """
     Get all the Queen moves for a Queen located at given row, col and add these moves to the list.
     """
-    def getQueenMoves(self, r, c, moves):
-        self.getBishopMoves(r, c, moves)
-        self.getRookMoves(r, c, moves)
+    def getQueenMoves(self, r, c, moves, capturesOnly=False):
+        # Rook moves first: getRookMoves keeps a pinned Queen in the pins, getBishopMoves removes it.
+        self.getRookMoves(r, c, moves, capturesOnly)
+        self.getBishopMoves(r, c, moves, capturesOnly)
 
     """
     Get all the King moves for a King located at given row, col and add these moves to the list.
     """
-    def getKingMoves(self, r, c, moves):
-        possibleMoves = [(0, 1), (1, 1), (1, 0), (1, -1),
-                         (0, -1), (-1, -1), (-1, 0), (-1, 1)]
+    def getKingMoves(self, r, c, moves, capturesOnly=False):
         allyColor = 'w' if self.whiteToMove else 'b'
-        for move in possibleMoves:
-            endRow = r + move[0]
-            endCol = c + move[1]
-            if 0 <= endRow <= 7 and 0 <= endCol <= 7:
-                endPiece = self.board[endRow][endCol]
-                if endPiece[0] != allyColor:  # Empty or enemy piece
-                    # Put King on a square and then see if it's in check.
-                    if allyColor == 'w':
-                        self.whiteKingLocation = (endRow, endCol)
-                    else:
-                        self.blackKingLocation = (endRow, endCol)
-
-                    inCheck, pins, checks = self.checkForPinsAndChecks()
-
-                    # If not, then append the move onto the list of moves.
-                    if not inCheck:
-                        moves.append(Move((r, c), (endRow, endCol), self.board))
-
-                    # Else, do nothing and revert the King position back to original.
-                    if allyColor == 'w':
-                        self.whiteKingLocation = (r, c)
-                    else:
-                        self.blackKingLocation = (r, c)
+        board = self.board
+        for endRow, endCol in kingTargets[r * 8 + c]:
+            endPiece = board[endRow][endCol]
+            if endPiece[0] != allyColor and (not capturesOnly or endPiece != '--'):  # Empty or enemy piece
+                # The King can't move onto a square the enemy attacks.
+                if not self.enemyAttacks >> (endRow * 8 + endCol) & 1:
+                    moves.append(Move((r, c), (endRow, endCol), board))
 
     """
     Generate all valid castle moves for the King, and add them to the list of Moves
     """
     def getCastleMoves(self, r, c, moves, allyColor):
-        if self.squareUnderAttack(r, c):
+        if self.inCheck:
             return  # Can't castle when we are in check
         if (self.whiteToMove and self.currentCastlingRight.wks) or \
                 (not self.whiteToMove and self.currentCastlingRight.bks):
@@ -460,14 +761,63 @@ class GameState:
 
     def getKingsideCastleMoves(self, r, c, moves, allyColor):
         if self.board[r][c+1] == '--' and self.board[r][c+2] == '--' and \
-                not self.squareUnderAttack(r, c+1) and not self.squareUnderAttack(r, c+2):
+                not self.enemyAttacks >> (r * 8 + c + 1) & 3:  # Neither of the 2 squares the King crosses
             moves.append(Move((r, c), (r, c+2), self.board, castle=True))
 
     def getQueensideCastleMoves(self, r, c, moves, allyColor):
         if self.board[r][c - 1] == '--' and self.board[r][c - 2] == '--' and self.board[r][c - 3] == '--' and \
-                not self.squareUnderAttack(r, c - 1) and not self.squareUnderAttack(r, c - 2):
+                not self.enemyAttacks >> (r * 8 + c - 2) & 3:
             moves.append(Move((r, c), (r, c - 2), self.board, castle=True))
 
+    """
+    Returns the squares attacked by the opponent as a bitmask, bit row * 8 + col, computed once per position for
+    the King moves and castling.
+    The player's King is taken off the board, so it can't step back along the line of a checking Rook, Bishop or Queen.
+    """
+    def getEnemyAttacks(self):
+        if self.whiteToMove:
+            enemyColor, pawnDirection = 'b', 1
+            kingRow, kingCol = self.whiteKingLocation
+        else:
+            enemyColor, pawnDirection = 'w', -1
+            kingRow, kingCol = self.blackKingLocation
+        board = self.board
+        king = board[kingRow][kingCol]
+        board[kingRow][kingCol] = '--'
+
+        attacks = 0
+        for r in range(8):
+            for c in range(8):
+                piece = board[r][c]
+                if piece[0] != enemyColor:
+                    continue
+                pieceType = piece[1]
+                if pieceType == 'p':
+                    endRow = r + pawnDirection
+                    if 0 <= endRow <= 7:
+                        if c - 1 >= 0:
+                            attacks |= 1 << (endRow * 8 + c - 1)
+                        if c + 1 <= 7:
+                            attacks |= 1 << (endRow * 8 + c + 1)
+                elif pieceType == 'N' or pieceType == 'K':
+                    for endRow, endCol in (knightTargets if pieceType == 'N' else kingTargets)[r * 8 + c]:
+                        attacks |= 1 << (endRow * 8 + endCol)
+                else:
+                    if pieceType == 'R':
+                        rays = rookRays[r * 8 + c]
+                    elif pieceType == 'B':
+                        rays = bishopRays[r * 8 + c]
+                    else:
+                        rays = queenRays[r * 8 + c]
+                    for d, ray in rays:
+                        for endRow, endCol in ray:
+                            attacks |= 1 << (endRow * 8 + endCol)
+                            if board[endRow][endCol] != '--':  # The attack includes the first piece on the ray
+                                break
+
+        board[kingRow][kingCol] = king
+        return attacks
+
     """
     Returns if the player is in check, a list of pins, and a list of checks
     """
@@ -489,54 +839,48 @@ class GameState:
             startCol = self.blackKingLocation[1]
 
         # Check outward from King for pins and checks, keep track of pins
-        directions = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
-        for j in range(len(directions)):
-            d = directions[j]
+        # The directions are ordered as the queenRays: 0-3 orthogonal, 4-7 diagonal ((-1, -1), (-1, 1), (1, -1), (1, 1))
+        board = self.board
+        kingRays = queenRays[startRow * 8 + startCol]
+        for j in range(8):
+            d, ray = kingRays[j]
             possiblePin = ()  # Reset possible pin
-            for i in range(1, 8):
-                endRow = startRow + d[0] * i
-                endCol = startCol + d[1] * i
-                if 0 <= endRow < 8 and 0 <= endCol < 8:
-                    endPiece = self.board[endRow][endCol]
-                    if endPiece[0] == allyColor and endPiece[1] != 'K':
-                        if possiblePin == ():  # 1st allied piece could be pinned
-                            possiblePin = (endRow, endCol, d[0], d[1])
-                        else:  # 2nd allied piece, so no pin or check possible in this direction
+            for i in range(1, len(ray) + 1):  # i is the distance from the King
+                endRow, endCol = ray[i - 1]
+                endPiece = board[endRow][endCol]
+                if endPiece[0] == allyColor and endPiece[1] != 'K':
+                    if possiblePin == ():  # 1st allied piece could be pinned
+                        possiblePin = (endRow, endCol, d[0], d[1])
+                    else:  # 2nd allied piece, so no pin or check possible in this direction
+                        break
+                elif endPiece[0] == enemyColor:
+                    piece_type = endPiece[1]
+                    # There are 5 enemy pieces which could attack King (except Knight)
+                    # 1. Rook attacks orthogonally
+                    # 2. Bishop attacks diagonally
+                    # 3. Pawn attacks from one square diagonally
+                    # 4. Queen attacks from both lines and diagonals
+                    # 5. Enemy King attacks from one square away in all directions
+                    if (0 <= j <= 3 and piece_type == 'R') or \
+                            (4 <= j <= 7 and piece_type == 'B') or \
+                            (i == 1 and piece_type == 'p' and ((enemyColor == 'w' and 6 <= j <= 7) or
+                                                               (enemyColor == 'b' and 4 <= j <= 5))) or \
+                            (piece_type == 'Q') or (i == 1 and piece_type == 'K'):
+                        if possiblePin == ():  # No piece blocking, so it's a check
+                            inCheck = True
+                            checks.append((endRow, endCol, d[0], d[1]))
                             break
-                    elif endPiece[0] == enemyColor:
-                        piece_type = endPiece[1]
-                        # There are 5 enemy pieces which could attack King (except Knight)
-                        # 1. Rook attacks orthogonally
-                        # 2. Bishop attacks diagonally
-                        # 3. Pawn attacks from one square diagonally
-                        # 4. Queen attacks from both lines and diagonals
-                        # 5. Enemy King attacks from one square away in all directions
-                        if (0 <= j <= 3 and piece_type == 'R') or \
-                                (4 <= j <= 7 and piece_type == 'B') or \
-                                (i == 1 and piece_type == 'p' and ((enemyColor == 'w' and 6 <= j <= 7) or
-                                                                   (enemyColor == 'b' and 4 <= j <= 6))) or \
-                                (piece_type == 'Q') or (i == 1 and piece_type == 'K'):
-                            if possiblePin == ():  # No piece blocking, so it's a check
-                                inCheck = True
-                                checks.append((endRow, endCol, d[0], d[1]))
-                                break
-                            else:  # A piece is blocking attack so it's a pin
-                                pins.append(possiblePin)
-                        else:  # Enemy piece not attacking King
-                            break
-                else:
-                    break  # Off board
+                        else:  # A piece is blocking attack so it's a pin
+                            pins.append(possiblePin)
+                    else:  # Enemy piece not attacking King
+                        break
 
         # Determine if a Knight is giving check
-        knightMoves = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
-        for m in knightMoves:
-            endRow = startRow + m[0]
-            endCol = startCol + m[1]
-            if 0 <= endRow < 8 and 0 <= endCol < 8:  # On the board
-                endPiece = self.board[endRow][endCol]
-                if endPiece[0] == enemyColor and endPiece[1] == 'N':
-                    inCheck = True
-                    checks.append((endRow, endCol, m[0], m[1]))
+        enemyKnight = enemyColor + 'N'
+        for endRow, endCol in knightTargets[startRow * 8 + startCol]:
+            if board[endRow][endCol] == enemyKnight:
+                inCheck = True
+                checks.append((endRow, endCol, endRow - startRow, endCol - startCol))
 
         return inCheck, pins, checks
 
@@ -561,23 +905,23 @@ class GameState:
         elif move.pieceMoved == 'bR':
             if move.startRow == 0:
                 if move.startCol == 0:  # Left Rook moved
-                    self.currentCastlingRight.wqs = False
+                    self.currentCastlingRight.bqs = False
                 elif move.startCol == 7:  # Right Rook moved
-                    self.currentCastlingRight.wks = False
+                    self.currentCastlingRight.bks = False
 
         # If a Rook is captured, remove castling rights on that side
         if move.pieceCaptured == 'wR':
             if move.endRow == 7:
                 if move.endCol == 0:
-                    self.currentCastlingRight.wks = False
-                elif move.endCol == 0:
                     self.currentCastlingRight.wqs = False
+                elif move.endCol == 7:
+                    self.currentCastlingRight.wks = False
         elif move.pieceCaptured == 'bR':
             if move.endRow == 0:
                 if move.endCol == 0:
-                    self.currentCastlingRight.bks = False
-                elif move.endCol == 7:
                     self.currentCastlingRight.bqs = False
+                elif move.endCol == 7:
+                    self.currentCastlingRight.bks = False
 
 
 class CastleRights:
@@ -588,26 +932,60 @@ class CastleRights:
         self.bqs = bqs
 
 
+"""
+A move is identified by its moveID, packed into 14 bits: the start square in bits 0-5, the end square in bits 6-11
+(both as row * 8 + col) and the promotion piece in bits 12-13, as an index into PROMOTION_PIECES.
+A Queen promotion (and every other move) has 0 there, so a move made by clicking on the board matches it.
+The Transposition Table and the killer moves keep only this integer, and these helpers decode it.
+"""
+PROMOTION_PIECES = 'QRBN'
+
+
+def getMoveStartSquare(moveID):
+    return divmod(moveID & 63, 8)
+
+
+def getMoveEndSquare(moveID):
+    return divmod(moveID >> 6 & 63, 8)
+
+
+def getMovePromotionPiece(moveID):
+    return PROMOTION_PIECES[moveID >> 12]
+
+
+"""
+Millions of moves are created during a search, most of them never made, so the class has __slots__:
+no attribute dict is allocated per move.
+"""
 class Move:
+    __slots__ = ('startRow', 'startCol', 'endRow', 'endCol', 'pieceMoved', 'pieceCaptured', 'castle',
+                 'isPawnPromotion', 'promotionPiece', 'enPassant', 'isCapture', 'moveID')
+
     ranksToRows = {'1': 7, '2': 6, '3': 5, '4': 4, '5': 3, '6': 2, '7': 1, '8': 0}
     rowsToRanks = {v: k for k, v in ranksToRows.items()}
 
     filesToCols = {'a': 0, 'b': 1, 'c': 2, 'd': 3, 'e': 4, 'f': 5, 'g': 6, 'h': 7}
     colsToFiles = {v: k for k, v in filesToCols.items()}
 
-    def __init__(self, startSq, endSq, board, enPassant=False, castle=False):
+    def __init__(self, startSq, endSq, board, enPassant=False, castle=False, promotionPiece='Q', pieceMoved=None,
+                 pieceCaptured='--'):
         self.startRow = startSq[0]
         self.startCol = startSq[1]
         self.endRow = endSq[0]
         self.endCol = endSq[1]
-        self.pieceMoved = board[self.startRow][self.startCol]
-        self.pieceCaptured = board[self.endRow][self.endCol]
+        if board is not None:
+            self.pieceMoved = board[self.startRow][self.startCol]
+            self.pieceCaptured = board[self.endRow][self.endCol]
+        else:  # The pieces are given by a move generator which doesn't keep the board
+            self.pieceMoved = pieceMoved
+            self.pieceCaptured = pieceCaptured
 
         # Castle Move
         self.castle = castle
 
         # Pawn Promotion Move
         self.isPawnPromotion = self.pieceMoved[1] == 'p' and (self.endRow == 0 or self.endRow == 7)
+        self.promotionPiece = promotionPiece
 
         # En-passant Move
         self.enPassant = enPassant
@@ -615,7 +993,15 @@ class Move:
             self.pieceCaptured = 'wp' if self.pieceMoved == 'bp' else 'bp'
 
         self.isCapture = self.pieceCaptured != '--'
-        self.moveID = self.startRow * 1000 + self.startCol * 100 + self.endRow * 10 + self.endCol
+        self.moveID = self.startRow * 8 + self.startCol | (self.endRow * 8 + self.endCol) << 6
+        if self.isPawnPromotion and promotionPiece != 'Q':
+            self.moveID |= PROMOTION_PIECES.index(promotionPiece) << 12
+
+    """
+    Returns the piece standing on the end square after the move, which differs from pieceMoved on a promotion.
+    """
+    def getEndPiece(self):
+        return self.pieceMoved[0] + self.promotionPiece if self.isPawnPromotion else self.pieceMoved
 
     def getRankFile(self, r, c):
         return self.colsToFiles[c] + self.rowsToRanks[r]
@@ -632,6 +1018,9 @@ class Move:
             return self.moveID == other.moveID
         return False
 
+    def __hash__(self):
+        return self.moveID
+
     """
     Overriding the str() function"""
     def __str__(self):
@@ -643,11 +1032,11 @@ class Move:
         # Pawn Moves
         if self.pieceMoved[1] == 'p':
             if self.isCapture:
-                return self.colsToFiles[self.startCol] + 'x' + endSquare
-            else:
-                return endSquare
+                endSquare = self.colsToFiles[self.startCol] + 'x' + endSquare
+            if self.isPawnPromotion:
+                endSquare += '=' + self.promotionPiece
+            return endSquare
             # These notations are not available in this method.
-            # Pawn promotions are to be added.
             # Declaring file or rank of a piece moved, if the other same type of piece can move to that square
             # Adding a + sign if check was given, and a # sign if checkmate was given
 
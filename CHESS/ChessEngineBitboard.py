@@ -0,0 +1,411 @@
+"""
+[NOTE] - This is an alternative to ChessEngineAdvanced which keeps the position in 64-bit integer bitboards, one for
+every piece type and colour, instead of the string board. Making and undoing a move only flips bits; the rest of the
+state (logs, Zobrist key, score, castling rights, ...) is kept by ChessEngineAdvanced.GameState as usual. The string
+board is built from the bitboards when it is asked for (e.g. by the GUI, getFEN or the tablebases), so ChessMain and
+SmartMoveFinder can use either class without any other change.
+The legal move generation is replaced too: instead of walking the board square by square, the attacks of a piece are
+looked up in tables built once at import and combined with the occupancy bitboards.
+
+Squares are numbered the same way as the board is indexed: square = row * 8 + col, so a8 is 0 and h1 is 63.
+"""
+
+import ChessEngineAdvanced
+from ChessEngineAdvanced import Move
+
+FULL_BOARD = (1 << 64) - 1
+FILE_A = sum(1 << (r * 8) for r in range(8))
+FILE_H = FILE_A << 7
+PROMOTION_ROWS = 0xFF | (0xFF << 56)
+
+PIECES = ('wp', 'wN', 'wB', 'wR', 'wQ', 'wK', 'bp', 'bN', 'bB', 'bR', 'bQ', 'bK')
+COLOR_PIECES = {'w': PIECES[:6], 'b': PIECES[6:]}
+
+# Ray directions as (row step, col step). A direction is "positive" if it walks towards higher square numbers.
+ROOK_DIRECTIONS = ((-1, 0), (0, -1), (1, 0), (0, 1))
+BISHOP_DIRECTIONS = ((-1, -1), (-1, 1), (1, 1), (1, -1))
+
+
+"""
+Returns a table with the bitboard of the squares a leaping piece (Knight or King) attacks from every square.
+"""
+def buildLeaperAttacks(offsets):
+    table = []
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        attacks = 0
+        for dr, dc in offsets:
+            if 0 <= r + dr < 8 and 0 <= c + dc < 8:
+                attacks |= 1 << ((r + dr) * 8 + c + dc)
+        table.append(attacks)
+    return table
+
+
+"""
+Returns a table with the bitboard of the ray starting next to every square and running to the edge of the board.
+"""
+def buildRay(direction):
+    dr, dc = direction
+    table = []
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        ray = 0
+        r, c = r + dr, c + dc
+        while 0 <= r < 8 and 0 <= c < 8:
+            ray |= 1 << (r * 8 + c)
+            r, c = r + dr, c + dc
+        table.append(ray)
+    return table
+
+
+# (row, col) of every square, so generation doesn't have to divmod each target.
+SQUARES = tuple(divmod(sq, 8) for sq in range(64))
+
+KNIGHT_ATTACKS = buildLeaperAttacks(((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)))
+KING_ATTACKS = buildLeaperAttacks(((0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1), (-1, 0), (-1, 1)))
+# Squares attacked by a pawn of the given colour standing on a square.
+PAWN_ATTACKS = {'w': buildLeaperAttacks(((-1, -1), (-1, 1))), 'b': buildLeaperAttacks(((1, -1), (1, 1)))}
+
+# Each entry is (ray table, positive). On a positive ray the nearest blocker is the lowest set bit, otherwise highest.
+ROOK_RAYS = tuple((buildRay(d), d[0] > 0 or (d[0] == 0 and d[1] > 0)) for d in ROOK_DIRECTIONS)
+BISHOP_RAYS = tuple((buildRay(d), d[0] > 0) for d in BISHOP_DIRECTIONS)
+
+# BETWEEN[a][b] holds the squares strictly between a and b, LINE[a][b] the whole line through both of them.
+# Both are empty if the squares don't share a rank, file or diagonal.
+BETWEEN = [[0] * 64 for _ in range(64)]
+LINE = [[0] * 64 for _ in range(64)]
+for _rays in (ROOK_RAYS, BISHOP_RAYS):
+    for _d in range(4):  # Opposite directions are two apart in both direction tuples
+        _ray, _opposite = _rays[_d][0], _rays[(_d + 2) % 4][0]
+        for _a in range(64):
+            _bits = _ray[_a]
+            while _bits:
+                _b = (_bits & -_bits).bit_length() - 1
+                _bits &= _bits - 1
+                BETWEEN[_a][_b] = _ray[_a] & _opposite[_b]
+                LINE[_a][_b] = _ray[_a] | _opposite[_a] | (1 << _a)
+
+
+"""
+Returns the squares attacked along the given rays from a square, stopping at (and including) the first blocker.
+"""
+def slidingAttacks(sq, occupied, rays):
+    attacks = 0
+    for ray, positive in rays:
+        rayAttacks = ray[sq]
+        blockers = rayAttacks & occupied
+        if blockers:
+            if positive:
+                blocker = (blockers & -blockers).bit_length() - 1
+            else:
+                blocker = blockers.bit_length() - 1
+            rayAttacks ^= ray[blocker]
+        attacks |= rayAttacks
+    return attacks
+
+
+def rookAttacks(sq, occupied):
+    return slidingAttacks(sq, occupied, ROOK_RAYS)
+
+
+def bishopAttacks(sq, occupied):
+    return slidingAttacks(sq, occupied, BISHOP_RAYS)
+
+
+def queenAttacks(sq, occupied):
+    return slidingAttacks(sq, occupied, ROOK_RAYS) | slidingAttacks(sq, occupied, BISHOP_RAYS)
+
+
+"""
+Yields the index of every set bit of a bitboard, lowest first.
+"""
+def squares(bitboard):
+    while bitboard:
+        bit = bitboard & -bitboard
+        yield bit.bit_length() - 1
+        bitboard ^= bit
+
+
+class GameState(ChessEngineAdvanced.GameState):
+    def __init__(self):
+        # One bitboard per piece, plus the occupancy of each colour under the keys 'w' and 'b'.
+        self.bitboards = {}
+        # The string board, built from the bitboards when it is asked for and dropped by every move.
+        self.boardCache = None
+        super().__init__()  # Sets the board, which loads the bitboards
+
+    """
+    The board as a list of rows of strings, like ChessEngineAdvanced's. It is built from the bitboards, so it is only
+    a copy: setting the board sets up the position, but changing its squares does not.
+    """
+    @property
+    def board(self):
+        if self.boardCache is None:
+            board = [['--'] * 8 for _ in range(8)]
+            for piece in PIECES:
+                for sq in squares(self.bitboards[piece]):
+                    board[sq >> 3][sq & 7] = piece
+            self.boardCache = board
+        return self.boardCache
+
+    @board.setter
+    def board(self, board):
+        self.boardCache = board
+        self.loadBitboards()
+
+    """
+    Builds the bitboards from scratch out of the string board.
+    """
+    def loadBitboards(self):
+        self.bitboards = dict.fromkeys(PIECES + ('w', 'b'), 0)
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece != '--':
+                    self.bitboards[piece] |= 1 << (r * 8 + c)
+                    self.bitboards[piece[0]] |= 1 << (r * 8 + c)
+
+    """
+    Moves the pieces of a move on the bitboards, flipping the bits it changes in place. Every change is an XOR, so the
+    same function takes the move back as unmovePieces.
+    """
+    def movePieces(self, move):
+        self.boardCache = None
+        bb = self.bitboards
+        pieceMoved = move.pieceMoved
+        color = pieceMoved[0]
+        start = move.startRow * 8 + move.startCol
+        end = move.endRow * 8 + move.endCol
+        moveMask = (1 << start) | (1 << end)
+        bb[pieceMoved] ^= moveMask
+        bb[color] ^= moveMask
+
+        if move.isCapture:
+            captureSq = move.startRow * 8 + move.endCol if move.enPassant else end
+            bb[move.pieceCaptured] ^= 1 << captureSq
+            bb[move.pieceCaptured[0]] ^= 1 << captureSq
+
+        if move.isPawnPromotion:
+            bb[pieceMoved] ^= 1 << end
+            bb[color + move.promotionPiece] ^= 1 << end
+
+        if move.castle:
+            if move.endCol - move.startCol == 2:  # King side Castle
+                rookMask = (1 << (end + 1)) | (1 << (end - 1))
+            else:  # Queen side Castle
+                rookMask = (1 << (end - 2)) | (1 << (end + 1))
+            bb[color + 'R'] ^= rookMask
+            bb[color] ^= rookMask
+
+    unmovePieces = movePieces
+
+    """
+    Returns the piece of the given colour standing on square sq, which has to hold one.
+    """
+    def getPieceAt(self, sq, color):
+        bb = self.bitboards
+        for piece in COLOR_PIECES[color]:
+            if bb[piece] >> sq & 1:
+                return piece
+
+    """
+    Returns the bitboard of the pieces of the given colour attacking square sq, with the given occupancy.
+    """
+    def attackersTo(self, sq, color, occupied):
+        bb = self.bitboards
+        enemyColor = 'b' if color == 'w' else 'w'
+        return (KNIGHT_ATTACKS[sq] & bb[color + 'N']) | \
+               (KING_ATTACKS[sq] & bb[color + 'K']) | \
+               (PAWN_ATTACKS[enemyColor][sq] & bb[color + 'p']) | \
+               (rookAttacks(sq, occupied) & (bb[color + 'R'] | bb[color + 'Q'])) | \
+               (bishopAttacks(sq, occupied) & (bb[color + 'B'] | bb[color + 'Q']))
+
+    """
+    Returns the bitboard of every square attacked by the pieces of the given colour, with the given occupancy.
+    """
+    def attackedSquares(self, color, occupied):
+        bb = self.bitboards
+        pawns = bb[color + 'p']
+        if color == 'w':
+            attacks = ((pawns & ~FILE_A) >> 9) | ((pawns & ~FILE_H) >> 7)
+        else:
+            attacks = (((pawns & ~FILE_A) << 7) | ((pawns & ~FILE_H) << 9)) & FULL_BOARD
+        for sq in squares(bb[color + 'N']):
+            attacks |= KNIGHT_ATTACKS[sq]
+        for sq in squares(bb[color + 'B'] | bb[color + 'Q']):
+            attacks |= bishopAttacks(sq, occupied)
+        for sq in squares(bb[color + 'R'] | bb[color + 'Q']):
+            attacks |= rookAttacks(sq, occupied)
+        return attacks | KING_ATTACKS[bb[color + 'K'].bit_length() - 1]
+
+    """
+    Determine if the enemy can attack the square (r, c) in focus or not.
+    """
+    def squareUnderAttack(self, r, c):
+        bb = self.bitboards
+        return self.attackersTo(r * 8 + c, 'b' if self.whiteToMove else 'w', bb['w'] | bb['b']) != 0
+
+    """
+    All moves considering checks.
+    """
+    def getValidMoves(self):
+        moves = self.generateMoves(False)
+
+        # Check for check_mate or stale_mate
+        if len(moves) == 0:
+            if self.inCheck:
+                self.checkmate = True
+            else:
+                self.stalemate = True
+        else:
+            self.checkmate = False
+            self.stalemate = False
+
+        return moves
+
+    """
+    Only the captures and promotions among the valid moves, for the quiescence search.
+    When the player is in check all valid moves are returned instead, since every way out of check has to be searched.
+    """
+    def getCaptureMoves(self):
+        return self.generateMoves(True)
+
+    """
+    Generates the legal moves of the side to move: all of them, or only captures and promotions if capturesOnly.
+    Sets inCheck, but not checkmate and stalemate.
+    """
+    def generateMoves(self, capturesOnly):
+        moves = []
+        bb = self.bitboards
+        if self.whiteToMove:
+            allyColor, enemyColor = 'w', 'b'
+            moveAmount, startRow = -8, 6
+        else:
+            allyColor, enemyColor = 'b', 'w'
+            moveAmount, startRow = 8, 1
+        allies = bb[allyColor]
+        enemies = bb[enemyColor]
+        occupied = allies | enemies
+        kingBit = bb[allyColor + 'K']
+        kingSq = kingBit.bit_length() - 1
+        kingRow, kingCol = SQUARES[kingSq]
+
+        checkers = self.attackersTo(kingSq, enemyColor, occupied)
+        self.inCheck = checkers != 0
+        if checkers:
+            capturesOnly = False
+        # Squares the pieces may move to: anywhere, or only onto enemy pieces (or promote, for pawns) if capturesOnly
+        captureMask = enemies if capturesOnly else FULL_BOARD
+
+        # The King can't step onto attacked squares. It is taken off the board so it can't hide behind itself.
+        enemyAttacks = self.attackedSquares(enemyColor, occupied ^ kingBit)
+        # (square, piece, target squares) of the pieces which can move, other than the pawns
+        pieceTargets = [(kingSq, allyColor + 'K', KING_ATTACKS[kingSq] & ~allies & ~enemyAttacks & captureMask)]
+
+        if not checkers & (checkers - 1):  # With a double check only the King can move
+            if checkers:  # Capture the checking piece or block it
+                evasionTargets = checkers | BETWEEN[kingSq][checkers.bit_length() - 1]
+            else:
+                evasionTargets = FULL_BOARD
+            targets = evasionTargets & captureMask & ~allies
+            pushTargets = evasionTargets & (PROMOTION_ROWS if capturesOnly else FULL_BOARD)
+
+            # A piece between the King and an enemy slider is pinned: it may only move along that line.
+            pinned = 0
+            snipers = (rookAttacks(kingSq, enemies) & (bb[enemyColor + 'R'] | bb[enemyColor + 'Q'])) | \
+                      (bishopAttacks(kingSq, enemies) & (bb[enemyColor + 'B'] | bb[enemyColor + 'Q']))
+            for sq in squares(snipers):
+                blockers = BETWEEN[kingSq][sq] & occupied
+                if blockers & (blockers - 1) == 0 and blockers & allies:
+                    pinned |= blockers
+
+            knight = allyColor + 'N'
+            for sq in squares(bb[knight] & ~pinned):  # A pinned Knight can never move
+                pieceTargets.append((sq, knight, KNIGHT_ATTACKS[sq] & targets))
+            for piece, pieceAttacks in ((allyColor + 'B', bishopAttacks), (allyColor + 'R', rookAttacks),
+                                        (allyColor + 'Q', queenAttacks)):
+                for sq in squares(bb[piece]):
+                    attacks = pieceAttacks(sq, occupied) & targets
+                    if pinned >> sq & 1:
+                        attacks &= LINE[kingSq][sq]
+                    pieceTargets.append((sq, piece, attacks))
+
+            pawn = allyColor + 'p'
+            empty = ~occupied & FULL_BOARD
+            if self.enpassantPossible:
+                enpassantSq = self.enpassantPossible[0] * 8 + self.enpassantPossible[1]
+                enpassantBit = 1 << enpassantSq
+            else:
+                enpassantSq = enpassantBit = 0
+            for sq in squares(bb[pawn]):
+                pawnTargets = targets
+                pawnPushTargets = pushTargets
+                if pinned >> sq & 1:
+                    pawnTargets &= LINE[kingSq][sq]
+                    pawnPushTargets &= LINE[kingSq][sq]
+                startSq = SQUARES[sq]
+                end = sq + moveAmount
+                if empty >> end & 1:
+                    if pawnPushTargets >> end & 1:
+                        self.addPawnMove(startSq, SQUARES[end], moves, pawn)
+                    # 2 square pawn advance from the starting position
+                    if startSq[0] == startRow and empty >> (end + moveAmount) & 1 and \
+                            pawnPushTargets >> (end + moveAmount) & 1:
+                        moves.append(Move(startSq, SQUARES[end + moveAmount], None, False, False, 'Q', pawn))
+                for end in squares(PAWN_ATTACKS[allyColor][sq] & enemies & pawnTargets):
+                    self.addPawnMove(startSq, SQUARES[end], moves, pawn, self.getPieceAt(end, enemyColor))
+
+                if PAWN_ATTACKS[allyColor][sq] & enpassantBit:
+                    # Both pawns leave their rank at once, so try the capture on the occupancy and look for checks.
+                    capturedSq = startSq[0] * 8 + enpassantSq % 8
+                    occupiedAfter = (occupied ^ (1 << sq) ^ (1 << capturedSq)) | (1 << enpassantSq)
+                    if not self.attackersTo(kingSq, enemyColor, occupiedAfter) & ~(1 << capturedSq):
+                        moves.append(Move(startSq, SQUARES[enpassantSq], None, enPassant=True, pieceMoved=pawn))
+
+            if not checkers and not capturesOnly:
+                self.getCastleMoves(kingRow, kingCol, moves, occupied, enemyAttacks)
+
+        # The pieces are passed to Move positionally, which is quicker than by keyword
+        enemyPieces = COLOR_PIECES[enemyColor]
+        for sq, piece, attacks in pieceTargets:
+            if not attacks:
+                continue
+            startSq = SQUARES[sq]
+            for end in squares(attacks & enemies):
+                for captured in enemyPieces:
+                    if bb[captured] >> end & 1:
+                        break
+                moves.append(Move(startSq, SQUARES[end], None, False, False, 'Q', piece, captured))
+            for end in squares(attacks & ~enemies):
+                moves.append(Move(startSq, SQUARES[end], None, False, False, 'Q', piece))
+
+        return moves
+
+    """
+    Adds a pawn move to the list. A pawn reaching the last rank adds one move for every piece it can promote to.
+    The pawn and the piece it captures are given, since there is no board to find them on.
+    """
+    def addPawnMove(self, startSq, endSq, moves, pawn, pieceCaptured='--'):
+        if endSq[0] == 0 or endSq[0] == 7:
+            for promotionPiece in ('Q', 'R', 'B', 'N'):
+                moves.append(Move(startSq, endSq, None, False, False, promotionPiece, pawn, pieceCaptured))
+        else:
+            moves.append(Move(startSq, endSq, None, False, False, 'Q', pawn, pieceCaptured))
+
+    """
+    Generate all valid castle moves for the King, and add them to the list of Moves.
+    The King must not be in check, which generateMoves already knows.
+    """
+    def getCastleMoves(self, r, c, moves, occupied, enemyAttacks):
+        kingSq = r * 8 + c
+        king = 'wK' if self.whiteToMove else 'bK'
+        if (self.whiteToMove and self.currentCastlingRight.wks) or \
+                (not self.whiteToMove and self.currentCastlingRight.bks):
+            path = (1 << (kingSq + 1)) | (1 << (kingSq + 2))
+            if not path & occupied and not path & enemyAttacks:
+                moves.append(Move((r, c), (r, c + 2), None, castle=True, pieceMoved=king))
+        if (self.whiteToMove and self.currentCastlingRight.wqs) or \
+                (not self.whiteToMove and self.currentCastlingRight.bqs):
+            path = (1 << (kingSq - 1)) | (1 << (kingSq - 2))
+            if not (path | (1 << (kingSq - 3))) & occupied and not path & enemyAttacks:
+                moves.append(Move((r, c), (r, c - 2), None, castle=True, pieceMoved=king))
@@ -7,8 +7,9 @@ import pygame as p
 # import pygame.event
 
 import ChessEngineAdvanced
+import ChessEngineBitboard
 import SmartMoveFinder
-from multiprocessing import Process, Queue
+from EngineWorker import EngineWorker
 
 # Dimension of the playing board. Choose 400 for shorter board. For bigger board, choose 640 or 768
 BOARD_WIDTH = BOARD_HEIGHT = 512
@@ -16,11 +17,25 @@ BOARD_WIDTH = BOARD_HEIGHT = 512
 # Dimension of the Move log showing all the moves played beside the board.
 MOVE_LOG_PANEL_WIDTH = 250
 MOVE_LOG_PANEL_HEIGHT = BOARD_HEIGHT
+MOVES_PER_LINE = 3  # Full moves (a White and a Black move) per line of the Move log
+MOVE_LOG_SCROLL_LINES = 3  # Lines the Move log scrolls per turn of the mouse wheel
 
 DIMENSION = 8
 SQ_SIZE = BOARD_WIDTH // DIMENSION
 MAX_FPS = 15  # For animations later on
 IMAGES = {}
+
+# Set to True to play on the bitboard GameState. It makes and undoes moves on the bitboards alone, and with its move
+# generation perft runs about 1.2x and the AI's search about 1.6x as fast as on the string board.
+USE_BITBOARDS = False
+GameState = ChessEngineBitboard.GameState if USE_BITBOARDS else ChessEngineAdvanced.GameState
+
+# Number of processes the AI searches with. Above 1 it searches to SmartMoveFinder.DEPTH with the root moves spread
+# over the processes, instead of for SmartMoveFinder.TIME_LIMIT seconds.
+AI_PROCESSES = 1
+# Let the AI think about its reply while the human is thinking, so a predicted move is answered at once.
+PONDER = True
+
 """
 Initialises a global dictionary of Images of Chess pieces. This will be called only once in the Main.
 """
@@ -40,9 +55,10 @@ def main():
     clock = p.time.Clock()
     screen.fill(p.Color('white'))
 
-    gs = ChessEngineAdvanced.GameState()
+    gs = GameState()
 
     moveLogFont = p.font.SysFont('consolas', 12)
+    renderer = Renderer(screen, moveLogFont)
 
     validMoves = gs.getValidMoves()
     moveMade = False  # Flag that checks if a move has been made
@@ -59,10 +75,11 @@ def main():
     playerOne = True  # Alias for White pieces
     playerTwo = False  # Alias for Black pieces
 
-    # These flags corresponds to the multiprocessing functionality of the AI and Code
+    # The AI searches in a separate process, which lives for the whole game so its caches stay warm.
+    # After an undo the AI waits for the human to move, instead of replaying the undone move at once.
+    engine = EngineWorker(GameState, AI_PROCESSES)
     AIThinking = False
-    moveFinderProcess = None
-    moveUndone = True
+    moveUndone = False
 
     running = True
     while running:
@@ -70,6 +87,12 @@ def main():
         for e in p.event.get():
             if e.type == p.QUIT:
                 running = False
+            # The window was uncovered, and has to be drawn again
+            elif e.type == p.VIDEOEXPOSE:
+                renderer.invalidate()
+            # The mouse wheel scrolls the Move log
+            elif e.type == p.MOUSEBUTTONDOWN and e.button in (4, 5):
+                renderer.moveLogPanel.scroll(-MOVE_LOG_SCROLL_LINES if e.button == 4 else MOVE_LOG_SCROLL_LINES)
             # Mouse Handler
             elif e.type == p.MOUSEBUTTONDOWN:
                 if not gameOver:
@@ -93,48 +116,58 @@ def main():
                                 gs.makeMove(validMoves[i])
                                 moveMade = True
                                 animate = True
+                                moveUndone = False
+                                if engine.opponentMoved(validMoves[i].moveID):
+                                    AIThinking = True  # Ponder hit: the AI is already searching its reply
                                 sqSelected = ()
                                 playerClicks = []
                         if not moveMade:
                             playerClicks = [sqSelected]
             # Key Handler
             elif e.type == p.KEYDOWN:
+                # Scroll the Move log a page with the "Page Up" and "Page Down" keys
+                if e.key in (p.K_PAGEUP, p.K_PAGEDOWN):
+                    pageLines = renderer.moveLogPanel.visibleLines
+                    renderer.moveLogPanel.scroll(-pageLines if e.key == p.K_PAGEUP else pageLines)
                 # Undo a move when "z" key is pressed
                 if e.key == p.K_z:
                     gs.undoMove()
                     moveMade = True
                     animate = False
                     gameOver = False
-                    if AIThinking:
-                        moveFinderProcess.terminate()
-                        AIThinking = False
+                    engine.stop()  # Also stops pondering on the undone position
+                    AIThinking = False
                     moveUndone = True
                 # Reset the board when "r" key is pressed
                 if e.key == p.K_r:
-                    gs = ChessEngineAdvanced.GameState()
+                    gs = GameState()
                     validMoves = gs.getValidMoves()
                     sqSelected = ()
                     playerClicks = []
                     moveMade = False
                     animate = False
                     gameOver = False
-                    if AIThinking:
-                        moveFinderProcess.terminate()
-                        AIThinking = False
-                    moveUndone = True
+                    engine.newGame()
+                    AIThinking = False
+                    moveUndone = False
 
-        # AI Move Finder
-        if not gameOver and not humanTurn and not moveUndone:
+        # Pondering on the human's time, when the AI plays the other side
+        humanTurn = (gs.whiteToMove and playerOne) or (not gs.whiteToMove and playerTwo)
+        if PONDER and not gameOver and humanTurn and playerOne != playerTwo and not engine.searching:
+            engine.startPonder(gs)
+
+        # AI Move Finder, once validMoves is that of the position after the move made (a ponder hit may answer at once)
+        if not gameOver and not humanTurn and not moveUndone and not moveMade:
             if not AIThinking:
-                AIThinking =True
+                AIThinking = True
                 print('Thinking for a good move....')
-                returnQueue = Queue()  # This is used to pass data between threads
-                moveFinderProcess = Process(target=SmartMoveFinder.findBestMove, args=(gs, validMoves, returnQueue))
-                moveFinderProcess.start()  # Call findBestMove(gs, validMoves, returnQueue)
-                # AIMove = SmartMoveFinder.findBestMove(gs, validMoves)
-            if not moveFinderProcess.is_alive():
+                engine.startSearch(gs)  # The worker runs findBestMove on its copy of the position
+            if engine.poll():
                 print("I made a really smart Move.")
-                AIMove = returnQueue.get()
+                AIMove = None
+                for move in validMoves:
+                    if move.moveID == engine.bestMoveID:
+                        AIMove = move
                 AIMove = AIMove if AIMove is not None else SmartMoveFinder.findRandomMove(validMoves)
                 gs.makeMove(AIMove)
                 moveMade = True
@@ -144,143 +177,266 @@ def main():
         # This code animates a move made by Players
         if moveMade:
             if animate:
-                animateMove(gs.moveLog[-1], screen, gs.board, clock)
+                renderer.invalidate(animateMove(gs.moveLog[-1], screen, gs.board, clock, renderer.background))
             validMoves = gs.getValidMoves()
             moveMade = False
-        drawGameState(screen, gs, validMoves, sqSelected, moveLogFont)
 
         # Check whether checkmate or stalemate has occurred and end the game
+        endGameText = None
         if gs.stalemate or gs.checkmate:
             gameOver = True
-            drawEndGameText(screen, 'STALEMATE' if gs.stalemate else 'Black wins by Checkmate' if gs.whiteToMove else 'White wins by Checkmate')
+            endGameText = 'STALEMATE' if gs.stalemate else 'Black wins by Checkmate' if gs.whiteToMove else 'White wins by Checkmate'
 
+        # Only what changed is drawn and updated on the display
+        renderer.draw(gs, validMoves, sqSelected, endGameText)
         clock.tick(MAX_FPS)
-        p.display.flip()
+
+    engine.close()
 
 
 """
-Responsible for all graphics within the current GameState
+Draws the GameState on the screen with dirty rectangles: the squares are drawn from a cached background of the
+empty board, and only the squares whose piece or highlight changed since the last draw are drawn again, together
+with the move log when it changed. Only those parts of the display are updated, so an idle position costs nothing
+to draw.
 """
-def drawGameState(screen, gs, validMoves, sqSelected, moveLogFont):
-    drawBoard(screen)  # This function will draw squares on the board
-    # This function will highlight the selected Square and the possible valid moves with selected piece
-    highlightSquares(screen, gs, validMoves, sqSelected)
-    drawPieces(screen, gs.board)  # This function will draw the pieces on top of the squares
-    drawMoveLog(screen, gs, moveLogFont)  # This function will write the moves on the side of the board
+class Renderer:
+    def __init__(self, screen, moveLogFont):
+        self.screen = screen
+        self.moveLogPanel = MoveLogPanel(moveLogFont)
+        self.background = drawBoard()
+        self.highlights = {}
+        for highlight in ('cornflowerblue', 'darkslategray1'):
+            self.highlights[highlight] = p.Surface((SQ_SIZE, SQ_SIZE))
+            self.highlights[highlight].set_alpha(100)  # Transparency Value
+            self.highlights[highlight].fill(p.Color(highlight))
+        self.invalidate()
+
+    """
+    Forgets what the screen shows inside area (everywhere by default), so it is drawn again on the next draw. Called
+    when something else drew there, e.g. animateMove.
+    """
+    def invalidate(self, area=None):
+        if area is None:
+            self.drawnSquares = [None] * (DIMENSION * DIMENSION)  # (piece, highlight) drawn on every square
+            self.moveLogPanel.dirty = True
+            self.drawnEndGameText = None
+            return
+        for r in range(DIMENSION):
+            for c in range(DIMENSION):
+                if area.colliderect(getSquareRect(r, c)):
+                    self.drawnSquares[r * DIMENSION + c] = None
+
+    """
+    Draws what changed since the last draw, and updates those parts of the display.
+    """
+    def draw(self, gs, validMoves, sqSelected, endGameText=None):
+        dirtyRects = []
+        if self.drawnEndGameText is not None and endGameText != self.drawnEndGameText:
+            self.invalidate(self.endGameTextRect)  # Uncover the squares under the old text
+
+        highlights = getHighlights(gs, validMoves, sqSelected)
+        for r in range(DIMENSION):
+            for c in range(DIMENSION):
+                state = (gs.board[r][c], highlights.get((r, c)))
+                if state != self.drawnSquares[r * DIMENSION + c]:
+                    self.drawnSquares[r * DIMENSION + c] = state
+                    dirtyRects.append(self.drawSquare(r, c, *state))
+
+        # The text is drawn over the squares, so again whenever a square under it was drawn
+        if endGameText is not None and (endGameText != self.drawnEndGameText or dirtyRects):
+            self.endGameTextRect = drawEndGameText(self.screen, endGameText)
+            dirtyRects.append(self.endGameTextRect)
+        self.drawnEndGameText = endGameText
+
+        self.moveLogPanel.update(gs.moveLog)
+        if self.moveLogPanel.dirty:
+            dirtyRects.append(self.moveLogPanel.draw(self.screen))
+
+        if dirtyRects:
+            p.display.update(dirtyRects)
+
+    def drawSquare(self, r, c, piece, highlight):
+        square = getSquareRect(r, c)
+        self.screen.blit(self.background, square, square)
+        if highlight is not None:
+            self.screen.blit(self.highlights[highlight], square)
+        if piece != '--':
+            self.screen.blit(IMAGES[piece], square)
+        return square
+
+
+def getSquareRect(r, c):
+    return p.Rect(c * SQ_SIZE, r * SQ_SIZE, SQ_SIZE, SQ_SIZE)
 
 
 """
-Draws the squares up on the screen. The top left square in the board is always light colored.  
+Draws the squares of the empty board on a surface, which the Renderer and animateMove copy squares from.
+The top left square in the board is always light colored.
 [HINT] You can change color theme of the board from here...
 """
-def drawBoard(screen):
+def drawBoard():
     global colors
     colors = [p.Color('light gray'), p.Color('dark green')]
+    background = p.Surface((BOARD_WIDTH, BOARD_HEIGHT))
     for r in range(DIMENSION):
         for c in range(DIMENSION):
             color = colors[((r+c) % 2)]
-            p.draw.rect(screen, color, p.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE))
+            p.draw.rect(background, color, getSquareRect(r, c))
+    return background
 
 
 """
-Highlighs Square Selected and possible moves for the Piece on that Square
+Returns the highlight colors of the squares: the selected Square and the possible moves for the Piece on it.
 """
-def highlightSquares(screen, gs, validMoves, sqSelected):
+def getHighlights(gs, validMoves, sqSelected):
+    highlights = {}
     if sqSelected != ():
         r, c = sqSelected
         if gs.board[r][c][0] == ('w' if gs.whiteToMove else 'b'):  # Selected Piece is a piece that can be Moved
-
-            # Highlight selected square
-            s = p.Surface((SQ_SIZE, SQ_SIZE))
-            s.set_alpha(100)  # Transparency Value
-            s.fill(p.Color('cornflowerblue'))
-            screen.blit(s, (c * SQ_SIZE, r * SQ_SIZE))
-
-            # Highlight Valid Moves
-            s.fill(p.Color('darkslategray1'))
+            highlights[(r, c)] = 'cornflowerblue'
             for move in validMoves:
                 if move.startRow == r and move.startCol == c:
-                    screen.blit(s, (move.endCol * SQ_SIZE, move.endRow * SQ_SIZE))
+                    highlights[(move.endRow, move.endCol)] = 'darkslategray1'
+    return highlights
 
 
 """
-Draws the pieces on the board using the current GameState.board
+Draws the pieces on the board using the current GameState.board, on the squares inside area.
 [HINT] This is a separate function so that we can implement piece highlighting and Piece Animation too.
 """
-def drawPieces(screen, board):
+def drawPieces(screen, board, area):
     for r in range(DIMENSION):
         for c in range(DIMENSION):
             piece = board[r][c]
-            if piece != '--':
-                screen.blit(IMAGES[piece], p.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE))
+            if piece != '--' and area.colliderect(getSquareRect(r, c)):
+                screen.blit(IMAGES[piece], getSquareRect(r, c))
 
 
 """
-Draws the move log on the side of the board.
+The move log on the side of the board. The rendered lines are cached: when moves are played only the last line is
+rendered again (and new lines added), and an undo only renders again the lines from the undone moves on. Once the
+lines overflow the panel it scrolls, and it follows the last line unless the user scrolled up.
+"""
+class MoveLogPanel:
+    def __init__(self, font):
+        self.font = font
+        self.rect = p.Rect(BOARD_WIDTH, 0, MOVE_LOG_PANEL_WIDTH, MOVE_LOG_PANEL_HEIGHT)
+        self.padding = 5
+        self.lineHeight = font.get_height() + self.padding
+        self.visibleLines = max((MOVE_LOG_PANEL_HEIGHT - self.padding) // self.lineHeight, 1)
+        self.moves = []  # The moves the lines show
+        self.lines = []  # Rendered text of every line
+        self.firstLine = 0  # The line at the top of the panel
+        self.dirty = True  # The panel has to be drawn
+
+    """
+    Brings the lines up to the GameState's move log, rendering only the lines of the moves which changed.
+    """
+    def update(self, moveLog):
+        if len(moveLog) == len(self.moves) and (not moveLog or moveLog[-1] is self.moves[-1]):
+            return
+        # The moves kept are those up to the last move the panel and the move log have in common
+        keptMoves = min(len(moveLog), len(self.moves))
+        while keptMoves > 0 and moveLog[keptMoves - 1] is not self.moves[keptMoves - 1]:
+            keptMoves -= 1
+
+        following = self.firstLine >= self.getLastFirstLine()
+        self.moves = list(moveLog)
+        movesPerLine = MOVES_PER_LINE * 2
+        firstChangedLine = keptMoves // movesPerLine
+        del self.lines[firstChangedLine:]
+        for i in range(firstChangedLine * movesPerLine, len(moveLog), movesPerLine):
+            self.lines.append(self.font.render(getMoveLogLine(moveLog, i, movesPerLine), True, p.Color('black')))
+        self.firstLine = self.getLastFirstLine() if following else min(self.firstLine, self.getLastFirstLine())
+        self.dirty = True
+
+    def getLastFirstLine(self):
+        return max(len(self.lines) - self.visibleLines, 0)
+
+    """
+    Scrolls the panel by a number of lines, down if positive.
+    """
+    def scroll(self, lines):
+        firstLine = min(max(self.firstLine + lines, 0), self.getLastFirstLine())
+        if firstLine != self.firstLine:
+            self.firstLine = firstLine
+            self.dirty = True
+
+    """
+    Draws the visible lines, and a scroll bar when the lines overflow the panel. Returns the rectangle of the panel.
+    """
+    def draw(self, screen):
+        p.draw.rect(screen, p.Color("ivory2"), self.rect)
+        for i, textObject in enumerate(self.lines[self.firstLine:self.firstLine + self.visibleLines]):
+            screen.blit(textObject, self.rect.move(self.padding, self.padding + i * self.lineHeight))
+        if len(self.lines) > self.visibleLines:
+            barHeight = max(self.rect.height * self.visibleLines // len(self.lines), self.padding)
+            barTop = (self.rect.height - barHeight) * self.firstLine // self.getLastFirstLine()
+            p.draw.rect(screen, p.Color('gray60'), p.Rect(self.rect.right - 4, barTop, 3, barHeight))
+        self.dirty = False
+        return self.rect
+
+
 """
-def drawMoveLog(screen, gs, font):
-    moveLogRect = p.Rect(BOARD_WIDTH, 0, MOVE_LOG_PANEL_WIDTH, MOVE_LOG_PANEL_HEIGHT)
-    p.draw.rect(screen, p.Color("ivory2"), moveLogRect)
-    moveLog = gs.moveLog
-    moveTexts = []
-    for i in range(0, len(moveLog), 2):
-        moveString = str(i//2 + 1) + "." + str(moveLog[i]) + " "
+Returns the text of the move log line starting with the move at index start (a White move): up to movesPerLine
+moves, numbered per full move.
+"""
+def getMoveLogLine(moveLog, start, movesPerLine):
+    text = ""
+    for i in range(start, min(start + movesPerLine, len(moveLog)), 2):
+        text += " " + str(i//2 + 1) + "." + str(moveLog[i]) + " "
         if i + 1 < len(moveLog):
-            moveString += str(moveLog[i+1])
-        moveTexts.append(moveString)
-
-    movesPerRow = 3
-    spacing = padding = 5
-    for i in range(0, len(moveTexts), movesPerRow):
-        text = ""
-        for j in range(movesPerRow):
-            if i + j < len(moveTexts):
-                text += " " + moveTexts[i+j]
-        textObject = font.render(text, True, p.Color('black'))
-        textLocation = moveLogRect.move(padding, spacing)
-        screen.blit(textObject, textLocation)
-        spacing += textObject.get_height() + padding
+            text += str(moveLog[i+1])
+    return text
 
 
 """
-Animating a Move
+Animating a Move. Only the squares between the start and the end square are drawn and updated.
+Returns the rectangle drawn in.
 """
-def animateMove(move, screen, board, clock):
+def animateMove(move, screen, board, clock, background):
     global colors
     dR = move.endRow - move.startRow
     dC = move.endCol - move.startCol
     framesPerSquare = 8
     frameCount = (abs(dR) + abs(dC)) * framesPerSquare
+    endSquare = getSquareRect(move.endRow, move.endCol)
+    area = getSquareRect(move.startRow, move.startCol).union(endSquare)  # Holds the en passant square too
     for frame in range(frameCount+1):
         r, c = (move.startRow + dR * frame/frameCount, move.startCol + dC * frame/frameCount)
-        drawBoard(screen)
-        drawPieces(screen, board)
+        screen.blit(background, area, area)
+        drawPieces(screen, board, area)
         # Erase piece moved from it's ending square
-        color = colors[(move.endRow + move.endCol) % 2]
-        endSquare = p.Rect(move.endCol * SQ_SIZE, move.endRow * SQ_SIZE, SQ_SIZE, SQ_SIZE)
-        p.draw.rect(screen, color, endSquare)
+        screen.blit(background, endSquare, endSquare)
         # Draw captured piece at every frame until the moving piece gets there
         if move.pieceCaptured != '--':
+            capturedSquare = endSquare
             # En-passant move animation correction.
             if move.enPassant:
                 enPassantRow = move.endRow + 1 if move.pieceCaptured[0] == 'b' else move.endRow - 1
-                endSquare = p.Rect(move.endCol * SQ_SIZE, enPassantRow * SQ_SIZE, SQ_SIZE, SQ_SIZE)
+                capturedSquare = getSquareRect(enPassantRow, move.endCol)
 
-            screen.blit(IMAGES[move.pieceCaptured], endSquare)
+            screen.blit(IMAGES[move.pieceCaptured], capturedSquare)
 
         # Draw the moving piece
         screen.blit(IMAGES[move.pieceMoved], p.Rect(c * SQ_SIZE, r * SQ_SIZE, SQ_SIZE, SQ_SIZE))
-        p.display.flip()
+        p.display.update(area)
         clock.tick(60)
+    return area
 
 
+"""
+Draws the text in the middle of the board. Returns the rectangle drawn in.
+"""
 def drawEndGameText(screen, text):
     font = p.font.SysFont('Helvetica', 36, True)
     msg = font.render(text, False, p.Color('gray69'))
-    msgbox = p.Rect(0, 0, BOARD_WIDTH, BOARD_HEIGHT).move((BOARD_WIDTH - msg.get_width()) / 2, (BOARD_HEIGHT - msg.get_height()) / 2)
+    msgbox = msg.get_rect(center=(BOARD_WIDTH // 2, BOARD_HEIGHT // 2))
     screen.blit(msg, msgbox)
     msg_shadow = font.render(text, False, p.Color('black'))
     screen.blit(msg_shadow, msgbox.move(2, -2))
+    return msgbox.union(msgbox.move(2, -2))
 
 
 if __name__ == "__main__":
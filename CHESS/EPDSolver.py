@@ -0,0 +1,158 @@
+"""
+Runs EPD test suites (e.g. Win At Chess) against the engine: every position is searched with a time or node limit,
+and is solved when the engine plays one of its best moves (bm) and none of its avoid moves (am).
+A position without bm or am is only searched. bm and am moves are in SAN, coordinate notation is accepted too.
+
+The file is read as a stream, and its positions are spread over a pool of processes, so a suite's size doesn't
+matter and it runs about as many times faster as there are processes. Every result is written to the output file
+(a JSON line per position) as soon as it is known, in the order of the suite.
+Every position is searched with an empty Transposition Table and empty move ordering tables, so the results are
+the same from run to run (with a node limit; with a time limit they depend on the machine's speed).
+
+Usage:
+    python EPDSolver.py wac.epd                     1 second per position, on every CPU
+    python EPDSolver.py wac.epd -n 20000 -j 4       20000 nodes per position, on 4 processes
+    python EPDSolver.py wac.epd -t 5 -o wac.jsonl   5 seconds per position, results written to wac.jsonl
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from multiprocessing import Pool
+
+import ChessEngineAdvanced
+import ChessEngineBitboard
+import SmartMoveFinder
+from PGN import getSAN, parseSAN
+
+POSITION_WINDOW = 4  # Positions per process read ahead of the results, so the file is never read at once
+
+
+def initSolverWorker():
+    SmartMoveFinder.PRINT_ROOT_MOVES = False
+
+
+"""
+Returns the valid moves of gs written in the notations (SAN or coordinate notation). Raises ValueError on a
+notation which is no valid move.
+"""
+def parseMoves(gs, notations, validMoves):
+    moves = []
+    for notation in notations:
+        coordinateMoves = [move for move in validMoves if move.getChessNotation() == notation[:4] and
+                           (not move.isPawnPromotion or move.promotionPiece == (notation[4:].upper() or 'Q'))]
+        moves.append(coordinateMoves[0] if coordinateMoves else parseSAN(gs, notation, validMoves))
+    return moves
+
+
+"""
+Task of a pool process: searches the position of an EPD line. Returns its result as a dictionary with the line
+number, the position's id, the expected best and avoid moves, the move played (in SAN), whether it was solved
+(None without bm and am), the depth reached, the nodes searched and the time taken, or an error.
+"""
+def solvePosition(lineNumber, epd, timeLimit, nodeLimit, gameStateClass):
+    gs = gameStateClass()
+    result = {'line': lineNumber}
+    try:
+        operations = gs.loadEPD(epd)
+        validMoves = gs.getValidMoves()
+        bestMoves = parseMoves(gs, operations.get('bm', []), validMoves)
+        avoidMoves = parseMoves(gs, operations.get('am', []), validMoves)
+    except ValueError as error:
+        result['error'] = str(error)
+        return result
+    result['id'] = ' '.join(operations.get('id', [])) or str(lineNumber)
+    result['bm'] = operations.get('bm', [])
+    result['am'] = operations.get('am', [])
+    if len(validMoves) == 0:
+        result['error'] = 'No valid moves'
+        return result
+
+    depthReached = 0
+
+    def reportIteration(depth, score, bestMove):
+        nonlocal depthReached
+        depthReached = depth
+
+    SmartMoveFinder.clearSearchMemory()
+    startTime = time.perf_counter()
+    move = SmartMoveFinder.findBestMove(gs, validMoves, timeLimit=timeLimit, nodeLimit=nodeLimit, useBook=False,
+                                        reportIteration=reportIteration)
+    result['time'] = time.perf_counter() - startTime
+    result['nodes'] = SmartMoveFinder.nodesSearched
+    result['depth'] = depthReached
+    result['move'] = getSAN(gs, move, validMoves)
+    if bestMoves or avoidMoves:
+        result['solved'] = (not bestMoves or move in bestMoves) and move not in avoidMoves
+    else:
+        result['solved'] = None
+    return result
+
+
+def printResult(result):
+    if 'error' in result:
+        print('line {}: {}'.format(result['line'], result['error']))
+        return
+    status = {True: 'solved', False: 'unsolved', None: ''}[result['solved']]
+    expected = ' '.join((['bm'] + result['bm'] if result['bm'] else []) +
+                        (['am'] + result['am'] if result['am'] else []))
+    print('{:<16} {:<8} {:<9} {:<16} depth {:2d}  nodes {:9d}  {:6.2f}s'.format(
+        result['id'], result['move'], status, expected, result['depth'], result['nodes'], result['time']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run an EPD test suite against the engine.')
+    parser.add_argument('epd', help='EPD file')
+    parser.add_argument('-t', '--time', type=float, help='Seconds per position (default 1, unless --nodes is given)')
+    parser.add_argument('-n', '--nodes', type=int, help='Nodes per position')
+    parser.add_argument('-j', '--processes', type=int, default=os.cpu_count(), help='Number of worker processes')
+    parser.add_argument('-o', '--output', help='Write the results to this file, a JSON line per position')
+    parser.add_argument('--bitboards', action='store_true', help='Use the bitboard GameState')
+    args = parser.parse_args()
+
+    timeLimit = args.time if args.time is not None or args.nodes is not None else 1.0
+    gameStateClass = ChessEngineBitboard.GameState if args.bitboards else ChessEngineAdvanced.GameState
+    output = open(args.output, 'w') if args.output else None
+    results = []
+
+    def finish(result):
+        results.append(result)
+        printResult(result)
+        if output is not None:
+            output.write(json.dumps(result) + '\n')
+            output.flush()
+
+    # The results are taken in the order of the file, while up to a window of positions is being searched
+    startTime = time.perf_counter()
+    window = max(args.processes, 1) * POSITION_WINDOW
+    pending = deque()
+    with Pool(args.processes, initializer=initSolverWorker) as pool, open(args.epd) as epdFile:
+        for lineNumber, line in enumerate(epdFile, 1):
+            if not line.strip() or line.startswith('#'):
+                continue
+            pending.append(pool.apply_async(solvePosition, (lineNumber, line.strip(), timeLimit, args.nodes,
+                                                             gameStateClass)))
+            while len(pending) >= window or (pending and pending[0].ready()):
+                finish(pending.popleft().get())
+        while pending:
+            finish(pending.popleft().get())
+    elapsed = time.perf_counter() - startTime
+    if output is not None:
+        output.close()
+
+    searched = [result for result in results if 'error' not in result]
+    graded = [result for result in searched if result['solved'] is not None]
+    nodes = sum(result['nodes'] for result in searched)
+    searchTime = sum(result['time'] for result in searched)
+    print('Solved {} of {} ({} errors) in {:.1f}s'.format(
+        sum(result['solved'] for result in graded), len(graded), len(results) - len(searched), elapsed))
+    print('{} nodes, {:.0f} nps per process, {:.0f} nps in total'.format(
+        nodes, nodes / searchTime if searchTime > 0 else 0, nodes / elapsed if elapsed > 0 else 0))
+    sys.exit(1 if len(results) > len(searched) else 0)
+
+
+if __name__ == "__main__":
+    main()
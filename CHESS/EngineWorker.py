@@ -0,0 +1,232 @@
+"""
+A long lived AI process which ChessMain talks to over a Pipe.
+The process keeps its own GameState, and ChessMain only sends it the moves played since the last search, as moveIDs.
+Because the process lives as long as the game, SmartMoveFinder's Transposition Table and move ordering tables stay
+warm from one move to the next.
+
+Messages to the worker:
+    ('position', keepMoves, moveIDs)    Undo all but the first keepMoves moves, then play the moves in moveIDs
+    ('go', searchId, timeLimit)         Search the position, answer with ('bestmove', searchId, moveID)
+    ('ponder', searchId)                Predict the opponent's move, answer with ('pondermove', searchId, moveID), and
+                                        search the position after it until stopped or the ponder hit's deadline,
+                                        then answer with ('bestmove', searchId, moveID)
+    ('newgame',)                        Back to the starting position, and forget the Transposition Table
+    ('quit',)
+A search is stopped through a shared value holding the highest searchId to stop, so a stop request can never hit
+a later search by mistake. A ponder hit likewise sets the searchId it is meant for, and the deadline of that search.
+With more than 1 process, the worker searches to SmartMoveFinder.DEPTH with a ParallelSearch instead, whose
+processes share one Transposition Table. It can't be stopped: the answer of a stopped search arrives later and is
+ignored. It doesn't ponder either.
+"""
+
+import time
+from multiprocessing import Pipe, Process, Value
+
+import SmartMoveFinder
+
+
+"""
+The main loop of the worker process.
+"""
+def engineWorkerLoop(connection, stopSearchId, ponderHitId, ponderDeadline, gameStateClass, processes):
+    gs = gameStateClass()
+    parallelSearch = None
+    if processes > 1:
+        parallelSearch = SmartMoveFinder.ParallelSearch(processes, sharedTableSize=SmartMoveFinder.TT_SIZE)
+    while True:
+        message = connection.recv()
+        command = message[0]
+        if command == 'position':
+            keepMoves, moveIDs = message[1], message[2]
+            while len(gs.moveLog) > keepMoves:
+                gs.undoMove()
+            for moveID in moveIDs:
+                gs.makeMove(findMoveByID(gs.getValidMoves(), moveID))
+        elif command == 'go':
+            searchId, timeLimit = message[1], message[2]
+            validMoves = gs.getValidMoves()
+            bestMove = None
+            if len(validMoves) > 0 and parallelSearch is not None:
+                bestMove = parallelSearch.findBestMove(gs, validMoves)
+            elif len(validMoves) > 0:
+                bestMove = SmartMoveFinder.findBestMove(gs, validMoves, timeLimit=timeLimit,
+                                                        shouldStop=lambda: stopSearchId.value >= searchId)
+            connection.send(('bestmove', searchId, bestMove.moveID if bestMove is not None else None))
+        elif command == 'ponder':
+            searchId = message[1]
+            # The predicted move is the best move the last search stored for this position, if there is one
+            validMoves = gs.getValidMoves()
+            entry = SmartMoveFinder.transpositionTable.probe(gs.zobristKey)
+            predictedMove = findMoveByID(validMoves, entry[4]) if entry is not None else None
+            if predictedMove is None and len(validMoves) > 0:
+                predictedMove = SmartMoveFinder.findBestMove(gs, validMoves, timeLimit=None, maxDepth=1)
+            if predictedMove is None:
+                connection.send(('bestmove', searchId, None))
+                continue
+            connection.send(('pondermove', searchId, predictedMove.moveID))
+
+            gs.makeMove(predictedMove)
+            validMoves = gs.getValidMoves()
+            bestMove = None
+            if len(validMoves) > 0:
+                bestMove = SmartMoveFinder.findBestMove(
+                    gs, validMoves, timeLimit=None,
+                    shouldStop=lambda: stopSearchId.value >= searchId or
+                    (ponderHitId.value == searchId and time.time() >= ponderDeadline.value))
+            gs.undoMove()
+            connection.send(('bestmove', searchId, bestMove.moveID if bestMove is not None else None))
+        elif command == 'newgame':
+            gs = gameStateClass()
+            SmartMoveFinder.transpositionTable.clear()
+        elif command == 'quit':
+            break
+    if parallelSearch is not None:
+        parallelSearch.close()
+
+
+"""
+Returns the move of the list with the given moveID, or None.
+"""
+def findMoveByID(moves, moveID):
+    for move in moves:
+        if move.moveID == moveID:
+            return move
+    return None
+
+
+"""
+The main process' handle of the worker process.
+"""
+class EngineWorker:
+    def __init__(self, gameStateClass, processes=1):
+        self.connection, workerConnection = Pipe()
+        self.stopSearchId = Value('i', 0)
+        self.ponderHitId = Value('i', 0)
+        self.ponderDeadline = Value('d', 0.0)
+        # A daemonic process isn't allowed to start the processes of a pool
+        self.process = Process(target=engineWorkerLoop,
+                               args=(workerConnection, self.stopSearchId, self.ponderHitId, self.ponderDeadline,
+                                     gameStateClass, processes),
+                               daemon=processes <= 1)
+        self.process.start()
+        self.processes = processes
+        self.searchId = 0
+        self.searching = False  # A search (or ponder search) is running, or its answer wasn't picked up yet
+        self.pondering = False  # The current search is a ponder search, and the opponent hasn't moved yet
+        self.finished = False  # The answer of the current search has arrived
+        self.bestMoveID = None
+        self.ponderMoveID = None  # The opponent's move the ponder search expects
+        self.ponderStartTime = 0
+        self.ponderTimeLimit = SmartMoveFinder.TIME_LIMIT
+        self.sentMoveIDs = []  # The moves the worker's GameState has played
+
+    """
+    Brings the worker's GameState up to the given one, sending only the moves which differ.
+    """
+    def setPosition(self, gs):
+        moveIDs = [move.moveID for move in gs.moveLog]
+        keepMoves = 0
+        while keepMoves < len(moveIDs) and keepMoves < len(self.sentMoveIDs) and \
+                moveIDs[keepMoves] == self.sentMoveIDs[keepMoves]:
+            keepMoves += 1
+        if keepMoves < len(self.sentMoveIDs) or keepMoves < len(moveIDs):
+            self.connection.send(('position', keepMoves, moveIDs[keepMoves:]))
+            self.sentMoveIDs = moveIDs
+
+    """
+    Starts searching the position of gs in the worker. The result is picked up with poll.
+    """
+    def startSearch(self, gs, timeLimit=SmartMoveFinder.TIME_LIMIT):
+        self.stop()
+        self.setPosition(gs)
+        self.searchId += 1
+        self.searching = True
+        self.pondering = False
+        self.finished = False
+        self.connection.send(('go', self.searchId, timeLimit))
+
+    """
+    Starts searching, on the opponent's time, the reply to the move the opponent is expected to play in the position
+    of gs. Once the opponent has moved, call opponentMoved. Does nothing with a parallel search.
+    timeLimit is the time the reply may take on a ponder hit, counted from now.
+    """
+    def startPonder(self, gs, timeLimit=SmartMoveFinder.TIME_LIMIT):
+        if self.processes > 1:
+            return
+        self.stop()
+        self.setPosition(gs)
+        self.searchId += 1
+        self.searching = True
+        self.pondering = True
+        self.finished = False
+        self.ponderMoveID = None
+        self.ponderStartTime = time.time()
+        self.ponderTimeLimit = timeLimit
+        self.connection.send(('ponder', self.searchId))
+
+    """
+    Tells a pondering worker the move the opponent played. Returns True on a ponder hit: the search goes on until
+    its time is up (counting the time it already pondered, so it may answer at once) and poll returns its move.
+    On a miss the ponder search is stopped, and a new search has to be started.
+    """
+    def opponentMoved(self, moveID):
+        if not self.pondering:
+            return False
+        self.readMessages()
+        if self.ponderMoveID is not None and self.ponderMoveID == moveID:
+            self.pondering = False
+            self.ponderDeadline.value = self.ponderStartTime + self.ponderTimeLimit
+            self.ponderHitId.value = self.searchId
+            return True
+        self.stop()
+        return False
+
+    """
+    Reads the answers of the worker which have arrived, without waiting.
+    Answers of stopped searches are thrown away.
+    """
+    def readMessages(self):
+        while self.connection.poll():
+            message = self.connection.recv()
+            if not self.searching or message[1] != self.searchId:
+                continue
+            if message[0] == 'pondermove':
+                self.ponderMoveID = message[2]
+            elif message[0] == 'bestmove':
+                self.bestMoveID = message[2]
+                self.finished = True
+
+    """
+    Returns True once the current search is done (a ponder search only after a ponder hit), with the moveID
+    it found (None if there was no move) in bestMoveID.
+    """
+    def poll(self):
+        self.readMessages()
+        if self.searching and self.finished and not self.pondering:
+            self.searching = False
+            return True
+        return False
+
+    """
+    Stops the current search or ponder search. Its answer is ignored.
+    """
+    def stop(self):
+        if self.searching:
+            self.stopSearchId.value = self.searchId
+            self.searching = False
+            self.pondering = False
+
+    """
+    Stops the current search and sets up a new game.
+    """
+    def newGame(self):
+        self.stop()
+        self.connection.send(('newgame',))
+        self.sentMoveIDs = []
+
+    def close(self):
+        self.stop()
+        self.connection.send(('quit',))
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.terminate()
@@ -0,0 +1,82 @@
+"""
+The evaluation tables shared by the GameState (which keeps a running evaluation of the position) and SmartMoveFinder.
+pieceScore is the material value of every piece in pawns, the weight tables give a positional bonus per square.
+"""
+
+pieceScore = {'K': 0, 'Q': 10, 'R': 5, 'B': 3, 'N': 3, 'p': 1}
+
+Kweights = [[1, 1, 1, 1, 1, 1, 1, 1],
+            [1, 2, 2, 2, 2, 2, 2, 1],
+            [1, 2, 3, 3, 3, 3, 2, 1],
+            [1, 2, 3, 4, 4, 3, 2, 1],
+            [1, 2, 3, 4, 4, 3, 2, 1],
+            [1, 2, 3, 3, 3, 3, 2, 1],
+            [1, 2, 2, 2, 2, 2, 2, 1],
+            [1, 1, 1, 1, 1, 1, 1, 1]]
+
+Bweights = [[4, 3, 2, 1, 1, 2, 3, 4],
+            [3, 4, 3, 2, 2, 3, 4, 3],
+            [2, 3, 4, 3, 3, 4, 3, 2],
+            [1, 2, 3, 4, 4, 3, 2, 1],
+            [1, 2, 3, 4, 4, 3, 2, 1],
+            [2, 3, 4, 3, 3, 4, 3, 2],
+            [3, 4, 3, 2, 2, 3, 4, 3],
+            [1, 1, 1, 1, 1, 1, 1, 1]]
+
+Qweights = [[1, 1, 1, 3, 1, 1, 1, 1],
+            [1, 2, 3, 3, 3, 1, 1, 1],
+            [1, 4, 3, 3, 3, 4, 2, 1],
+            [1, 2, 3, 3, 3, 2, 2, 1],
+            [1, 2, 3, 3, 3, 2, 2, 1],
+            [1, 4, 3, 3, 3, 4, 2, 1],
+            [1, 2, 3, 3, 3, 1, 1, 1],
+            [1, 1, 1, 1, 1, 1, 1, 1]]
+
+Rweights = [[4, 3, 4, 4, 4, 4, 3, 4],
+            [4, 4, 4, 4, 4, 4, 4, 4],
+            [1, 1, 2, 3, 3, 2, 1, 1],
+            [1, 2, 3, 4, 4, 3, 2, 1],
+            [1, 2, 3, 4, 4, 3, 2, 1],
+            [1, 1, 2, 3, 3, 2, 1, 1],
+            [4, 4, 4, 4, 4, 4, 4, 4],
+            [4, 3, 4, 4, 4, 4, 3, 4]]
+
+Wpweights = [[8, 8, 8, 8, 8, 8, 8, 8],
+            [8, 8, 8, 8, 8, 8, 8, 8],
+            [5, 6, 6, 7, 7, 6, 6, 5],
+            [2, 3, 3, 5, 5, 3, 3, 2],
+            [1, 2, 3, 4, 4, 3, 2, 1],
+            [1, 1, 2, 3, 3, 2, 1, 1],
+            [1, 1, 1, 0, 0, 1, 1, 1],
+            [0, 0, 0, 0, 0, 0, 0, 0]]
+
+Bpweights = [[0, 0, 0, 0, 0, 0, 0, 0],
+            [1, 1, 1, 0, 0, 1, 1, 1],
+            [1, 1, 2, 3, 3, 2, 1, 1],
+            [1, 2, 3, 4, 4, 3, 2, 1],
+            [2, 3, 3, 5, 5, 3, 3, 2],
+            [5, 6, 6, 7, 7, 6, 6, 5],
+            [8, 8, 8, 8, 8, 8, 8, 8],
+            [8, 8, 8, 8, 8, 8, 8, 8]]
+
+piecePositionScores = {'N': Kweights, 'Q': Qweights, 'R': Rweights, 'B': Bweights, 'wp': Wpweights, 'bp': Bpweights}
+
+# Scores are integers in centipawns: 100 per pawn of pieceScore and 10 per point of the weight tables.
+PAWN_VALUE = 100
+POSITION_WEIGHT_VALUE = 10
+
+"""
+Centipawn value of every piece on every square (square = row * 8 + col), from White's point of view:
+Black's pieces have negative values, so the evaluation of a position is the sum over its pieces.
+"""
+pieceSquareValues = {}
+for _piece in ('wp', 'wN', 'wB', 'wR', 'wQ', 'wK', 'bp', 'bN', 'bB', 'bR', 'bQ', 'bK'):
+    _sign = 1 if _piece[0] == 'w' else -1
+    if _piece[1] == 'K':  # No position table for a King, yet.
+        _weights = [[0] * 8 for _ in range(8)]
+    elif _piece[1] == 'p':  # For a pawn we need it's color also
+        _weights = piecePositionScores[_piece]
+    else:
+        _weights = piecePositionScores[_piece[1]]
+    pieceSquareValues[_piece] = [_sign * (pieceScore[_piece[1]] * PAWN_VALUE + _weights[r][c] * POSITION_WEIGHT_VALUE)
+                                 for r in range(8) for c in range(8)]
@@ -0,0 +1,168 @@
+"""
+Opening book: for a position, the moves worth playing and how often they are played.
+The book is a binary file of 12 byte records (Zobrist key, moveID, weight), big-endian and sorted by key, so the
+moves of a position are found by binary search. The file is memory mapped instead of read, which makes opening a
+book free, and only the pages the searches touch are ever loaded.
+
+Usage:
+    python OpeningBook.py                   Build book.bin from the lines in BOOK_LINES
+    python OpeningBook.py -o my.bin -p 12   Another file, keeping the first 12 plies of every line
+"""
+
+import argparse
+import mmap
+import os
+import random
+import struct
+
+import ChessEngineAdvanced
+
+BOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'book.bin')
+RECORD = struct.Struct('>QHH')  # Zobrist key, moveID, weight
+
+# Main lines of the common openings, in coordinate notation. A move is weighted by the number of lines playing it.
+BOOK_LINES = [
+    # Open games
+    'e2e4 e7e5 g1f3 b8c6 f1b5 a7a6 b5a4 g8f6 e1g1 f8e7 f1e1 b7b5 a4b3 d7d6 c2c3 e8g8',
+    'e2e4 e7e5 g1f3 b8c6 f1b5 a7a6 b5a4 g8f6 e1g1 f8e7 f1e1 b7b5 a4b3 e8g8 c2c3 d7d5',
+    'e2e4 e7e5 g1f3 b8c6 f1b5 g8f6 e1g1 f6e4 d2d4 e4d6 b5c6 d7c6 d4e5 d6f5',
+    'e2e4 e7e5 g1f3 b8c6 f1b5 a7a6 b5c6 d7c6 e1g1 f7f6 d2d4 e5d4',
+    'e2e4 e7e5 g1f3 b8c6 f1c4 f8c5 c2c3 g8f6 d2d3 d7d6 e1g1 e8g8',
+    'e2e4 e7e5 g1f3 b8c6 f1c4 g8f6 d2d3 f8e7 e1g1 e8g8 f1e1 d7d6',
+    'e2e4 e7e5 g1f3 b8c6 d2d4 e5d4 f3d4 g8f6 d4c6 b7c6 e4e5 d8e7',
+    'e2e4 e7e5 g1f3 g8f6 f3e5 d7d6 e5f3 f6e4 d2d4 d6d5 f1d3 b8c6',
+    'e2e4 e7e5 g1f3 d7d6 d2d4 g8f6 b1c3 b8d7 f1c4 f8e7 e1g1 e8g8',
+    # Sicilian
+    'e2e4 c7c5 g1f3 d7d6 d2d4 c5d4 f3d4 g8f6 b1c3 a7a6 c1e3 e7e5 d4b3 c8e6',
+    'e2e4 c7c5 g1f3 d7d6 d2d4 c5d4 f3d4 g8f6 b1c3 g7g6 c1e3 f8g7 f2f3 e8g8',
+    'e2e4 c7c5 g1f3 b8c6 d2d4 c5d4 f3d4 g8f6 b1c3 e7e5 d4b5 d7d6',
+    'e2e4 c7c5 g1f3 e7e6 d2d4 c5d4 f3d4 a7a6 f1d3 g8f6 e1g1 d8c7',
+    'e2e4 c7c5 g1f3 b8c6 f1b5 g7g6 e1g1 f8g7 f1e1 e7e5',
+    'e2e4 c7c5 c2c3 g8f6 e4e5 f6d5 d2d4 c5d4 g1f3 b8c6',
+    # French, Caro-Kann and others against 1.e4
+    'e2e4 e7e6 d2d4 d7d5 b1c3 g8f6 c1g5 f8e7 e4e5 f6d7 g5e7 d8e7',
+    'e2e4 e7e6 d2d4 d7d5 b1c3 f8b4 e4e5 c7c5 a2a3 b4c3 b2c3 g8e7',
+    'e2e4 e7e6 d2d4 d7d5 e4e5 c7c5 c2c3 b8c6 g1f3 d8b6',
+    'e2e4 c7c6 d2d4 d7d5 b1c3 d5e4 c3e4 c8f5 e4g3 f5g6 h2h4 h7h6',
+    'e2e4 c7c6 d2d4 d7d5 e4e5 c8f5 g1f3 e7e6 f1e2 c6c5',
+    'e2e4 d7d5 e4d5 d8d5 b1c3 d5a5 d2d4 g8f6 g1f3 c8f5',
+    'e2e4 g7g6 d2d4 f8g7 b1c3 d7d6 g1f3 g8f6 f1e2 e8g8 e1g1 c7c6',
+    # Queen's Gambit and Slav
+    'd2d4 d7d5 c2c4 e7e6 b1c3 g8f6 c1g5 f8e7 e2e3 e8g8 g1f3 h7h6 g5h4 b7b6',
+    'd2d4 d7d5 c2c4 e7e6 g1f3 g8f6 b1c3 f8e7 c1f4 e8g8 e2e3 c7c5',
+    'd2d4 d7d5 c2c4 c7c6 g1f3 g8f6 b1c3 d5c4 a2a4 c8f5 e2e3 e7e6',
+    'd2d4 d7d5 c2c4 c7c6 g1f3 g8f6 e2e3 c8f5 b1c3 e7e6 f3h4 f5g6',
+    'd2d4 d7d5 c2c4 d5c4 g1f3 g8f6 e2e3 e7e6 f1c4 c7c5 e1g1 a7a6',
+    'd2d4 d7d5 g1f3 g8f6 c1f4 e7e6 e2e3 c7c5 c2c3 b8c6',
+    # Indian defences
+    'd2d4 g8f6 c2c4 e7e6 b1c3 f8b4 e2e3 e8g8 f1d3 d7d5 g1f3 c7c5',
+    'd2d4 g8f6 c2c4 e7e6 b1c3 f8b4 d1c2 e8g8 a2a3 b4c3 c2c3 d7d5',
+    'd2d4 g8f6 c2c4 e7e6 g1f3 b7b6 g2g3 c8a6 b2b3 f8b4 c1d2 b4e7',
+    'd2d4 g8f6 c2c4 g7g6 b1c3 f8g7 e2e4 d7d6 g1f3 e8g8 f1e2 e7e5 e1g1 b8c6',
+    'd2d4 g8f6 c2c4 g7g6 b1c3 d7d5 c4d5 f6d5 e2e4 d5c3 b2c3 f8g7',
+    'd2d4 g8f6 c2c4 c7c5 d4d5 e7e6 b1c3 e6d5 c4d5 d7d6 e2e4 g7g6',
+    'd2d4 g8f6 g1f3 e7e6 c2c4 d7d5 b1c3 f8e7 c1g5 e8g8',
+    'd2d4 f7f5 g2g3 g8f6 f1g2 g7g6 g1f3 f8g7 e1g1 e8g8 c2c4 d7d6',
+    # Flank openings
+    'c2c4 e7e5 b1c3 g8f6 g1f3 b8c6 g2g3 d7d5 c4d5 f6d5 f1g2 d5b6',
+    'c2c4 g8f6 b1c3 e7e6 g1f3 d7d5 d2d4 f8e7',
+    'c2c4 c7c5 g1f3 g8f6 b1c3 b8c6 g2g3 g7g6 f1g2 f8g7 e1g1 e8g8',
+    'g1f3 d7d5 g2g3 g8f6 f1g2 g7g6 e1g1 f8g7 d2d3 e8g8',
+    'g1f3 g8f6 c2c4 g7g6 b1c3 f8g7 e2e4 d7d6 d2d4 e8g8',
+]
+
+
+"""
+A book file, probed through mmap. An empty or missing file gives an empty book.
+"""
+class OpeningBook:
+    def __init__(self, path=BOOK_PATH):
+        self.file = None
+        self.data = None
+        self.records = 0
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            self.file = open(path, 'rb')
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.records = len(self.data) // RECORD.size
+
+    """
+    Returns the (moveID, weight) of every book move of the position with the given Zobrist key.
+    """
+    def probe(self, key):
+        # Binary search for the first record with this key
+        low, high = 0, self.records
+        while low < high:
+            middle = (low + high) // 2
+            if RECORD.unpack_from(self.data, middle * RECORD.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        entries = []
+        while low < self.records:
+            recordKey, moveID, weight = RECORD.unpack_from(self.data, low * RECORD.size)
+            if recordKey != key:
+                break
+            entries.append((moveID, weight))
+            low += 1
+        return entries
+
+    """
+    Returns a book move for the position of gs, picked at random in proportion to the weights, or None if the
+    position isn't in the book. Only moves found in validMoves are played, which guards against key collisions.
+    """
+    def getBookMove(self, gs, validMoves, randomGenerator=random):
+        if self.records == 0:
+            return None
+        movesByID = {move.moveID: move for move in validMoves}
+        candidates = [(movesByID[moveID], weight) for moveID, weight in self.probe(gs.zobristKey)
+                      if moveID in movesByID]
+        if len(candidates) == 0:
+            return None
+        return randomGenerator.choices([move for move, _ in candidates],
+                                       weights=[weight for _, weight in candidates])[0]
+
+    def close(self):
+        if self.data is not None:
+            self.data.close()
+            self.file.close()
+            self.data = None
+            self.records = 0
+
+
+"""
+Plays through the lines (strings of moves in coordinate notation) and writes the book of every position they pass,
+up to maxPlies moves into each line. Raises ValueError on a move which isn't legal.
+"""
+def buildBook(lines, path=BOOK_PATH, maxPlies=None):
+    weights = {}  # (key, moveID) -> number of lines playing the move
+    for line in lines:
+        gs = ChessEngineAdvanced.GameState()
+        for notation in line.split()[:maxPlies]:
+            move = None
+            for validMove in gs.getValidMoves():
+                if validMove.getChessNotation() == notation and \
+                        (not validMove.isPawnPromotion or validMove.promotionPiece == 'Q'):
+                    move = validMove
+            if move is None:
+                raise ValueError('Illegal book move ' + notation + ' in line: ' + line)
+            entry = (gs.zobristKey, move.moveID)
+            weights[entry] = weights.get(entry, 0) + 1
+            gs.makeMove(move)
+
+    with open(path, 'wb') as bookFile:
+        for (key, moveID), weight in sorted(weights.items()):
+            bookFile.write(RECORD.pack(key, moveID, min(weight, 0xFFFF)))
+    return len(weights)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the binary opening book from BOOK_LINES.')
+    parser.add_argument('-o', '--output', default=BOOK_PATH, help='Book file (default book.bin next to this file)')
+    parser.add_argument('-p', '--plies', type=int, help='Number of moves of every line to keep (default: all)')
+    args = parser.parse_args()
+    records = buildBook(BOOK_LINES, args.output, args.plies)
+    print(str(records) + ' book moves written to ' + args.output)
+
+
+if __name__ == "__main__":
+    main()
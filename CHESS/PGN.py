@@ -0,0 +1,286 @@
+"""
+Reading and writing games in PGN (Portable Game Notation), with the moves in full SAN (Standard Algebraic Notation).
+The reader streams: it reads a file line by line and yields one game at a time, so the size of the file doesn't
+matter, only the size of the largest game.
+
+Usage:
+    python PGN.py games.pgn                 Replay every game of the file, counting games and moves
+    python PGN.py games.pgn -o out.pgn      Also write the replayed games back out, in this module's SAN
+    python PGN.py games.pgn --bitboards     Replay on the bitboard GameState
+"""
+
+import argparse
+import re
+import sys
+import time
+
+import ChessEngineAdvanced
+import ChessEngineBitboard
+
+SAN_PATTERN = re.compile(r'^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$')
+TAG_PATTERN = re.compile(r'^\[(\w+)\s+"(.*)"\]$')
+TAG_ESCAPE_PATTERN = re.compile(r'\\(.)')  # A backslash escapes the next character in a tag value
+TOKEN_PATTERN = re.compile(r'\{[^}]*\}|;[^\n]*|\(|\)|\$\d+|[^\s(){};]+')
+MOVE_NUMBER_PATTERN = re.compile(r'^\d+\.+')
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+# The Seven Tag Roster, which every exported game starts with, in this order.
+SEVEN_TAG_ROSTER = ('Event', 'Site', 'Date', 'Round', 'White', 'Black', 'Result')
+
+
+"""
+One game of a PGN file: its tags, its moves in SAN and its result.
+"""
+class PGNGame:
+    def __init__(self, tags, moves, result):
+        self.tags = tags
+        self.moves = moves
+        self.result = result
+
+    """
+    Returns a GameState with the moves of the game played (from the FEN tag's position, if there is one).
+    Raises ValueError on a move which can't be played.
+    """
+    def replay(self, gameStateClass=ChessEngineAdvanced.GameState):
+        gs = gameStateClass()
+        if 'FEN' in self.tags:
+            gs.loadFEN(self.tags['FEN'])
+        for san in self.moves:
+            gs.makeMove(parseSAN(gs, san))
+        return gs
+
+
+"""
+Returns the SAN of a move in the position of gs, before it is made: with the file and/or rank of the moving piece
+when another piece of the same type can move to the same square, and a + or # when it gives check or mate.
+validMoves are the valid moves of the position, if they are already known.
+"""
+def getSAN(gs, move, validMoves=None):
+    if validMoves is None:
+        validMoves = gs.getValidMoves()
+
+    if move.castle:
+        san = 'O-O' if move.endCol > move.startCol else 'O-O-O'
+    else:
+        endSquare = move.getRankFile(move.endRow, move.endCol)
+        pieceType = move.pieceMoved[1]
+        if pieceType == 'p':
+            san = (move.colsToFiles[move.startCol] + 'x' if move.isCapture else '') + endSquare
+            if move.isPawnPromotion:
+                san += '=' + move.promotionPiece
+        else:
+            # Other pieces of the same type which can move to the same square
+            rivals = [other for other in validMoves
+                      if other.pieceMoved == move.pieceMoved and other.endRow == move.endRow and
+                      other.endCol == move.endCol and (other.startRow, other.startCol) != (move.startRow, move.startCol)]
+            disambiguation = ''
+            if rivals:
+                if all(other.startCol != move.startCol for other in rivals):
+                    disambiguation = move.colsToFiles[move.startCol]
+                elif all(other.startRow != move.startRow for other in rivals):
+                    disambiguation = move.rowsToRanks[move.startRow]
+                else:
+                    disambiguation = move.getRankFile(move.startRow, move.startCol)
+            san = pieceType + disambiguation + ('x' if move.isCapture else '') + endSquare
+
+    gs.makeMove(move)
+    gs.getValidMoves()
+    if gs.checkmate:
+        san += '#'
+    elif gs.inCheck:
+        san += '+'
+    gs.undoMove()
+    return san
+
+
+"""
+Returns the valid move of the position of gs written as san. Check and annotation marks are ignored, and so are a
+missing 'x' or a missing '=' before the promotion piece. Raises ValueError if no move or more than one move fits.
+"""
+def parseSAN(gs, san, validMoves=None):
+    if validMoves is None:
+        validMoves = gs.getValidMoves()
+    text = san.rstrip('+#!?')
+
+    if text in ('O-O', '0-0', 'O-O-O', '0-0-0'):
+        kingside = len(text) == 3
+        for move in validMoves:
+            if move.castle and (move.endCol > move.startCol) == kingside:
+                return move
+        raise ValueError('Illegal move: ' + san)
+
+    match = SAN_PATTERN.match(text)
+    if match is None:
+        raise ValueError('Not a SAN move: ' + san)
+    pieceType, fromFile, fromRank, endSquare, promotionPiece = match.groups()
+    pieceType = pieceType or 'p'
+    endRow = ChessEngineAdvanced.Move.ranksToRows[endSquare[1]]
+    endCol = ChessEngineAdvanced.Move.filesToCols[endSquare[0]]
+
+    found = None
+    for move in validMoves:
+        if move.pieceMoved[1] != pieceType or move.endRow != endRow or move.endCol != endCol or move.castle:
+            continue
+        if fromFile is not None and move.colsToFiles[move.startCol] != fromFile:
+            continue
+        if fromRank is not None and move.rowsToRanks[move.startRow] != fromRank:
+            continue
+        if move.isPawnPromotion and move.promotionPiece != (promotionPiece or 'Q'):
+            continue
+        if found is not None:
+            raise ValueError('Ambiguous move: ' + san)
+        found = move
+    if found is None:
+        raise ValueError('Illegal move: ' + san)
+    return found
+
+
+"""
+Splits the movetext of a game into its moves in SAN and its result. Comments, variations, move numbers and
+NAGs are skipped.
+"""
+def parseMovetext(text):
+    moves = []
+    result = '*'
+    variationDepth = 0
+    for token in TOKEN_PATTERN.findall(text):
+        if token == '(':
+            variationDepth += 1
+        elif token == ')':
+            variationDepth = max(variationDepth - 1, 0)
+        elif variationDepth > 0 or token[0] in '{;$':
+            continue
+        elif token in RESULTS:
+            result = token
+        else:
+            token = MOVE_NUMBER_PATTERN.sub('', token)  # "1.e4" as well as "1." or "1..."
+            if token:
+                moves.append(token)
+    return moves, result
+
+
+"""
+Yields the games of a PGN file (any iterable of lines) one by one, as PGNGames.
+Only the lines of the current game are kept in memory.
+"""
+def readGames(pgnFile):
+    tags = {}
+    movetextLines = []
+    commentDepth = 0  # A { } comment may span lines, and may contain [ ] which are no tags
+    for line in pgnFile:
+        line = line.strip()
+        if line.startswith('%'):  # Escape line
+            continue
+        if commentDepth == 0 and line.startswith('['):
+            if movetextLines:  # The tags of the next game
+                yield PGNGame(tags, *parseMovetext('\n'.join(movetextLines)))
+                tags = {}
+                movetextLines = []
+            match = TAG_PATTERN.match(line)
+            if match is not None:
+                tags[match.group(1)] = TAG_ESCAPE_PATTERN.sub(r'\1', match.group(2))
+        elif line:
+            movetextLines.append(line)
+            commentDepth = max(commentDepth + line.count('{') - line.count('}'), 0)
+    if tags or movetextLines:
+        yield PGNGame(tags, *parseMovetext('\n'.join(movetextLines)))
+
+
+"""
+Returns the FEN of the position gs.moveLog starts from, and the moves of the moveLog in SAN.
+The moves are undone and made again to get there, so gs ends up unchanged.
+"""
+def getMoveLogSAN(gs):
+    moves = list(gs.moveLog)
+    for _ in moves:
+        gs.undoMove()
+    startFEN = gs.getFEN()
+    sanMoves = []
+    for move in moves:
+        sanMoves.append(getSAN(gs, move))
+        gs.makeMove(move)
+    gs.getValidMoves()  # Sets the checkmate and stalemate flags again
+    return startFEN, sanMoves
+
+
+"""
+Writes the game of gs (its moveLog, from the position the moveLog starts from) to a file as PGN.
+tags are added to the Seven Tag Roster, whose missing tags get the PGN placeholder values.
+"""
+def writeGame(pgnFile, gs, tags=None, result='*'):
+    startFEN, sanMoves = getMoveLogSAN(gs)
+    whiteStarts = startFEN.split()[1] == 'w'
+    tags = dict(tags or {})
+    tags['Result'] = result
+    defaults = {'Event': '?', 'Site': '?', 'Date': '????.??.??', 'Round': '?', 'White': '?', 'Black': '?'}
+
+    # A game which doesn't start from the standard position needs its FEN
+    if startFEN.split()[:4] != ChessEngineAdvanced.STARTING_FEN.split()[:4]:
+        tags['SetUp'] = '1'
+        tags['FEN'] = startFEN
+
+    lines = []
+    for name in SEVEN_TAG_ROSTER:
+        lines.append('[' + name + ' "' + escapeTag(tags.get(name, defaults.get(name, '?'))) + '"]')
+    for name, value in tags.items():
+        if name not in SEVEN_TAG_ROSTER:
+            lines.append('[' + name + ' "' + escapeTag(value) + '"]')
+    lines.append('')
+
+    # Movetext, wrapped before 80 characters
+    tokens = []
+    for i, san in enumerate(sanMoves):
+        whiteMove = (i % 2 == 0) == whiteStarts
+        moveNumber = (i + (0 if whiteStarts else 1)) // 2 + 1
+        if whiteMove:
+            tokens.append(str(moveNumber) + '.')
+        elif i == 0:
+            tokens.append(str(moveNumber) + '...')
+        tokens.append(san)
+    tokens.append(result)
+    line = ''
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > 79:
+            lines.append(line)
+            line = token
+        else:
+            line = line + ' ' + token if line else token
+    lines.append(line)
+    pgnFile.write('\n'.join(lines) + '\n\n')
+
+
+def escapeTag(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay (and optionally rewrite) the games of a PGN file.')
+    parser.add_argument('pgn', help='PGN file')
+    parser.add_argument('-o', '--output', help='Write the replayed games to this PGN file')
+    parser.add_argument('--bitboards', action='store_true', help='Use the bitboard GameState')
+    args = parser.parse_args()
+
+    gameStateClass = ChessEngineBitboard.GameState if args.bitboards else ChessEngineAdvanced.GameState
+    output = open(args.output, 'w') if args.output else None
+    games = moves = errors = 0
+    startTime = time.perf_counter()
+    with open(args.pgn, encoding='utf-8', errors='replace') as pgnFile:
+        for game in readGames(pgnFile):
+            games += 1
+            try:
+                gs = game.replay(gameStateClass)
+            except ValueError as error:
+                errors += 1
+                print('Game ' + str(games) + ': ' + str(error), file=sys.stderr)
+                continue
+            moves += len(gs.moveLog)
+            if output is not None:
+                writeGame(output, gs, game.tags, game.result)
+    if output is not None:
+        output.close()
+    elapsed = time.perf_counter() - startTime
+    print('{} games, {} moves, {} errors in {:.1f}s'.format(games, moves, errors, elapsed))
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
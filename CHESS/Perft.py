@@ -0,0 +1,154 @@
+"""
+Perft (performance test) of the move generator. It counts the leaf nodes of the tree of legal moves down to a given
+depth, and compares them with the well known results for the standard test positions.
+This makes it both the speed yardstick (nodes per second) and the correctness test of getValidMoves:
+any change to the move generation should leave every count unchanged.
+
+Usage:
+    python Perft.py                         Run every standard position to depth 3
+    python Perft.py -p kiwipete -d 4        Run one position
+    python Perft.py --fen "<FEN>" -d 3      Run any position (no expected counts)
+    python Perft.py -p start -d 5 --divide  Print the count below every root move
+    python Perft.py -d 5 -j 8               Split the root moves across 8 worker processes
+    python Perft.py --bitboards             Use the bitboard GameState instead of ChessEngineAdvanced
+"""
+
+import argparse
+import sys
+import time
+from multiprocessing import Pool
+
+import ChessEngineAdvanced
+import ChessEngineBitboard
+
+# Name: (FEN, node counts for depth 1, 2, 3, ...). The counts are the published perft results of these positions.
+POSITIONS = {
+    'start': (ChessEngineAdvanced.STARTING_FEN,
+              [20, 400, 8902, 197281, 4865609, 119060324]),
+    'kiwipete': ('r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+                 [48, 2039, 97862, 4085603, 193690690]),
+    'position3': ('8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+                  [14, 191, 2812, 43238, 674624, 11030083]),
+    'position4': ('r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+                  [6, 264, 9467, 422333, 15833292]),
+    'position5': ('rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+                  [44, 1486, 62379, 2103487, 89941194]),
+    'position6': ('r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10',
+                  [46, 2079, 89890, 3894594, 164075551]),
+}
+
+
+"""
+Returns the number of leaf nodes of the legal move tree, depth plies below the current position.
+"""
+def perft(gs, depth):
+    if depth == 0:
+        return 1
+    moves = gs.getValidMoves()
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        gs.makeMove(move)
+        nodes += perft(gs, depth - 1)
+        gs.undoMove()
+    return nodes
+
+
+"""
+Returns a list of (move, node count) for every root move, in generation order.
+"""
+def divide(gs, depth):
+    results = []
+    for move in gs.getValidMoves():
+        gs.makeMove(move)
+        results.append((move, perft(gs, depth - 1)))
+        gs.undoMove()
+    return results
+
+
+"""
+Worker of the process pool: sets up the position, plays the root move with the given index and counts below it.
+Root moves are identified by their index, as every process generates them in the same order.
+"""
+def perftRootMove(gameStateClass, fen, moveIndex, depth):
+    gs = gameStateClass()
+    gs.loadFEN(fen)
+    move = gs.getValidMoves()[moveIndex]
+    gs.makeMove(move)
+    return move.getChessNotation(), perft(gs, depth - 1)
+
+
+"""
+Same as divide, but the root moves are spread over a pool of worker processes.
+Returns a list of (move notation, node count).
+"""
+def divideParallel(gameStateClass, fen, depth, pool):
+    gs = gameStateClass()
+    gs.loadFEN(fen)
+    rootMoves = len(gs.getValidMoves())
+    return pool.starmap(perftRootMove, [(gameStateClass, fen, i, depth) for i in range(rootMoves)], chunksize=1)
+
+
+"""
+Runs perft on a position for every depth up to maxDepth, printing the counts, the speed and the comparison with
+the expected counts. Returns False if any count was wrong.
+"""
+def runPosition(name, fen, expected, maxDepth, gameStateClass, showDivide=False, pool=None):
+    print(name + ': ' + fen)
+    correct = True
+    for depth in range(1, maxDepth + 1):
+        gs = gameStateClass()
+        gs.loadFEN(fen)
+        startTime = time.perf_counter()
+        if pool is not None and depth > 1:
+            results = divideParallel(gameStateClass, fen, depth, pool)
+        else:
+            results = [(move.getChessNotation(), nodes) for move, nodes in divide(gs, depth)]
+        elapsed = time.perf_counter() - startTime
+        nodes = sum(count for _, count in results)
+
+        if depth <= len(expected):
+            status = 'OK' if nodes == expected[depth - 1] else 'FAIL (expected ' + str(expected[depth - 1]) + ')'
+            correct = correct and nodes == expected[depth - 1]
+        else:
+            status = ''
+        print('  depth {:2d}  nodes {:12d}  time {:8.2f}s  nps {:10.0f}  {}'.format(
+            depth, nodes, elapsed, nodes / elapsed if elapsed > 0 else 0, status))
+
+        if showDivide and depth == maxDepth:
+            for notation, count in results:
+                print('    ' + notation + ': ' + str(count))
+    return correct
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Count the leaf nodes of the legal move tree (perft).')
+    parser.add_argument('-d', '--depth', type=int, default=3, help='Maximum depth (default 3)')
+    parser.add_argument('-p', '--position', choices=sorted(POSITIONS), help='Standard position (default: all)')
+    parser.add_argument('--fen', help='Any position given as a FEN string')
+    parser.add_argument('--divide', action='store_true', help='Print the node count below every root move')
+    parser.add_argument('-j', '--processes', type=int, default=1, help='Worker processes for the root moves')
+    parser.add_argument('--bitboards', action='store_true', help='Use the bitboard GameState')
+    args = parser.parse_args()
+
+    gameStateClass = ChessEngineBitboard.GameState if args.bitboards else ChessEngineAdvanced.GameState
+    if args.fen:
+        positions = [('fen', args.fen, [])]
+    elif args.position:
+        positions = [(args.position,) + POSITIONS[args.position]]
+    else:
+        positions = [(name,) + POSITIONS[name] for name in POSITIONS]
+
+    pool = Pool(args.processes) if args.processes > 1 else None
+    correct = True
+    for name, fen, expected in positions:
+        correct = runPosition(name, fen, expected, args.depth, gameStateClass, args.divide, pool) and correct
+    if pool is not None:
+        pool.close()
+        pool.join()
+    sys.exit(0 if correct else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,66 +1,240 @@
 import random
-
-pieceScore = {'K': 0, 'Q': 10, 'R': 5, 'B': 3, 'N': 3, 'p': 1}
-
-Kweights = [[1, 1, 1, 1, 1, 1, 1, 1],
-            [1, 2, 2, 2, 2, 2, 2, 1],
-            [1, 2, 3, 3, 3, 3, 2, 1],
-            [1, 2, 3, 4, 4, 3, 2, 1],
-            [1, 2, 3, 4, 4, 3, 2, 1],
-            [1, 2, 3, 3, 3, 3, 2, 1],
-            [1, 2, 2, 2, 2, 2, 2, 1],
-            [1, 1, 1, 1, 1, 1, 1, 1]]
-
-Bweights = [[4, 3, 2, 1, 1, 2, 3, 4],
-            [3, 4, 3, 2, 2, 3, 4, 3],
-            [2, 3, 4, 3, 3, 4, 3, 2],
-            [1, 2, 3, 4, 4, 3, 2, 1],
-            [1, 2, 3, 4, 4, 3, 2, 1],
-            [2, 3, 4, 3, 3, 4, 3, 2],
-            [3, 4, 3, 2, 2, 3, 4, 3],
-            [1, 1, 1, 1, 1, 1, 1, 1]]
-
-Qweights = [[1, 1, 1, 3, 1, 1, 1, 1],
-            [1, 2, 3, 3, 3, 1, 1, 1],
-            [1, 4, 3, 3, 3, 4, 2, 1],
-            [1, 2, 3, 3, 3, 2, 2, 1],
-            [1, 2, 3, 3, 3, 2, 2, 1],
-            [1, 4, 3, 3, 3, 4, 2, 1],
-            [1, 2, 3, 3, 3, 1, 1, 1],
-            [1, 1, 1, 1, 1, 1, 1, 1]]
-
-Rweights = [[4, 3, 4, 4, 4, 4, 3, 4],
-            [4, 4, 4, 4, 4, 4, 4, 4],
-            [1, 1, 2, 3, 3, 2, 1, 1],
-            [1, 2, 3, 4, 4, 3, 2, 1],
-            [1, 2, 3, 4, 4, 3, 2, 1],
-            [1, 1, 2, 3, 3, 2, 1, 1],
-            [4, 4, 4, 4, 4, 4, 4, 4],
-            [4, 3, 4, 4, 4, 4, 3, 4]]
-
-Wpweights = [[8, 8, 8, 8, 8, 8, 8, 8],
-            [8, 8, 8, 8, 8, 8, 8, 8],
-            [5, 6, 6, 7, 7, 6, 6, 5],
-            [2, 3, 3, 5, 5, 3, 3, 2],
-            [1, 2, 3, 4, 4, 3, 2, 1],
-            [1, 1, 2, 3, 3, 2, 1, 1],
-            [1, 1, 1, 0, 0, 1, 1, 1],
-            [0, 0, 0, 0, 0, 0, 0, 0]]
-
-Bpweights = [[0, 0, 0, 0, 0, 0, 0, 0],
-            [1, 1, 1, 0, 0, 1, 1, 1],
-            [1, 1, 2, 3, 3, 2, 1, 1],
-            [1, 2, 3, 4, 4, 3, 2, 1],
-            [2, 3, 3, 5, 5, 3, 3, 2],
-            [5, 6, 6, 7, 7, 6, 6, 5],
-            [8, 8, 8, 8, 8, 8, 8, 8],
-            [8, 8, 8, 8, 8, 8, 8, 8]]
-
-piecePositionScores = {'N': Kweights, 'Q': Qweights, 'R': Rweights, 'B': Bweights, 'wp': Wpweights, 'bp': Bpweights}
-
-CHECKMATE = 1000
+import struct
+import time
+from multiprocessing import Pool, Value, shared_memory
+
+import Tablebase
+from Evaluation import pieceScore, PAWN_VALUE
+from OpeningBook import OpeningBook
+
+CHECKMATE = 100000  # Centipawns, far above any material balance
+# Score of a position the endgame tablebases know to be won, minus its distance to mate in plies. It is below the
+# CHECKMATE of a mate on the board and far above any material balance.
+TABLEBASE_WIN = CHECKMATE - 1000
 STALEMATE = 0
 DEPTH = 3
+TIME_LIMIT = 3  # Seconds findBestMove may spend on a move
+MAX_DEPTH = 20  # Iterative deepening stops at this depth even if there is time left
+PRINT_ROOT_MOVES = True  # Print every new best root move with its score (a UCI engine's stdout must stay clean)
+
+# Bound types of the scores stored in the Transposition Table.
+EXACT = 0
+LOWERBOUND = 1  # The search failed high, the real score is at least this.
+UPPERBOUND = 2  # The search failed low, the real score is at most this.
+TT_SIZE = 1 << 20  # Number of entries, must be a power of 2.
+MAX_PLY = 64  # Deepest ply the killer moves are kept for
+DELTA_MARGIN = 200  # Centipawns a capture may gain on top of the captured piece's value, e.g. by position
+
+
+"""
+A fixed size hash table of already searched positions, indexed by the GameState's Zobrist key.
+Every entry is a tuple (key, depth, bound, score, bestMoveID, age).
+Replacement policy: a slot is overwritten if it is empty, if it was stored during an older search,
+or if the new result was searched at least as deep as the stored one. Otherwise the deeper result is kept.
+"""
+class TranspositionTable:
+    def __init__(self, size=TT_SIZE):
+        self.mask = size - 1
+        self.entries = [None] * size
+        self.age = 0
+
+    """
+    Called at the start of every search, so the entries of previous searches can be replaced first.
+    """
+    def newSearch(self):
+        self.age += 1
+
+    def clear(self):
+        self.entries = [None] * (self.mask + 1)
+        self.age = 0
+
+    """
+    Returns the entry stored for the position with the given key, or None.
+    """
+    def probe(self, key):
+        entry = self.entries[key & self.mask]
+        if entry is not None and entry[0] == key:
+            return entry
+        return None
+
+    def store(self, key, depth, bound, score, bestMove):
+        index = key & self.mask
+        entry = self.entries[index]
+        if entry is None or entry[5] != self.age or depth >= entry[1]:
+            self.entries[index] = (key, depth, bound, score, bestMove.moveID if bestMove else None, self.age)
+
+
+"""
+A Transposition Table in shared memory (multiprocessing.shared_memory), which several search processes can use at
+the same time. It has the same interface and replacement policy as TranspositionTable.
+The process which creates it owns it: only that one advances the age and unlinks the memory in close. Other
+processes attach to it with the name of the owner's table.
+
+The memory starts with the age (8 bytes), followed by entries of 2 unsigned 64 bit words: key ^ data and data.
+data packs the score + 2^23 in bits 0-23, the depth in 24-31, the bound in 32-33, the age (mod 256) in 34-41 and
+bestMoveID + 1 (0 for None) in 42-56.
+There is no locking. If 2 processes write an entry at the same time, a reader can see one process' key word with
+the other's data word, but then key ^ data no longer gives the key back, so the torn entry is ignored like a miss.
+"""
+class SharedTranspositionTable:
+    entryFormat = struct.Struct('<QQ')
+
+    def __init__(self, size=TT_SIZE, name=None):
+        self.owner = name is None
+        if self.owner:
+            self.memory = shared_memory.SharedMemory(create=True, size=8 + size * self.entryFormat.size)
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+        self.name = self.memory.name
+        self.size = size
+        self.mask = size - 1
+        self.buffer = self.memory.buf
+        self.age = struct.unpack_from('<Q', self.buffer, 0)[0]
+
+    """
+    Called at the start of every search. Only the owner advances the age, the other processes read it.
+    """
+    def newSearch(self):
+        if self.owner:
+            struct.pack_into('<Q', self.buffer, 0, self.age + 1)
+        self.age = struct.unpack_from('<Q', self.buffer, 0)[0]
+
+    def clear(self):
+        self.buffer[:] = bytes(len(self.buffer))
+        self.age = 0
+
+    """
+    Returns the entry stored for the position with the given key, as a tuple like TranspositionTable's, or None.
+    """
+    def probe(self, key):
+        check, data = self.entryFormat.unpack_from(self.buffer, 8 + (key & self.mask) * self.entryFormat.size)
+        if data == 0 or check ^ data != key:
+            return None
+        bestMoveID = (data >> 42) - 1
+        return (key, data >> 24 & 255, data >> 32 & 3, (data & 0xFFFFFF) - (1 << 23),
+                bestMoveID if bestMoveID >= 0 else None, data >> 34 & 255)
+
+    def store(self, key, depth, bound, score, bestMove):
+        offset = 8 + (key & self.mask) * self.entryFormat.size
+        check, data = self.entryFormat.unpack_from(self.buffer, offset)
+        age = self.age & 255
+        if data == 0 or data >> 34 & 255 != age or depth >= data >> 24 & 255:
+            data = (score + (1 << 23)) | min(depth, 255) << 24 | bound << 32 | age << 34 | \
+                   (bestMove.moveID + 1 if bestMove else 0) << 42
+            self.entryFormat.pack_into(self.buffer, offset, key ^ data, data)
+
+    def close(self):
+        self.buffer.release()
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+transpositionTable = TranspositionTable()
+openingBook = OpeningBook()  # Memory mapped, so this costs nothing until it is probed
+
+
+"""
+Makes the search use the given table, e.g. a SharedTranspositionTable, instead of the current one.
+"""
+def useTranspositionTable(table):
+    global transpositionTable
+    transpositionTable = table
+
+
+# State of the current search, set up by findBestMove.
+nextMove = None
+searchDepth = DEPTH  # Depth of the current iteration, i.e. of the root node
+searchDeadline = None  # time.time() at which the search has to stop, or None
+searchNodeLimit = None  # Number of nodes after which the search has to stop, or None
+searchShouldStop = None  # Function returning True when the search has to stop (e.g. the user undid a move), or None
+nodesSearched = 0
+rootScores = {}  # moveID -> score of every root move in the current iteration
+# Result of the last completed iteration: its score, and the root moves sorted by their scores
+bestScore = 0
+orderedRootMoves = []
+searchStatistics = None  # SearchStatistics of the current / last search while statistics are enabled, or None
+
+
+"""
+Returns new, empty killer moves and history table.
+"""
+def newMoveOrderingTables():
+    return [[None, None] for _ in range(MAX_PLY)], \
+        {piece: [0] * 64 for piece in ('wp', 'wN', 'wB', 'wR', 'wQ', 'wK', 'bp', 'bN', 'bB', 'bR', 'bQ', 'bK')}
+
+
+# Move ordering heuristics. Killer moves are the (up to) 2 quiet moves per ply which last caused a beta cutoff,
+# the history table counts how often moving a piece to a square caused a cutoff anywhere in the tree.
+killerMoves, historyTable = newMoveOrderingTables()
+
+
+"""
+Makes the search use the given killer moves and history table (from newMoveOrderingTables) instead of the current
+ones, e.g. to give every engine of a match its own.
+"""
+def useMoveOrderingTables(killers, history):
+    global killerMoves, historyTable
+    killerMoves = killers
+    historyTable = history
+
+
+"""
+Sorts the moves so the ones most likely to cause a beta cutoff come first:
+1. the best move stored for this position in the Transposition Table
+2. captures, Most Valuable Victim first and among those the Least Valuable Attacker first
+3. the killer moves of this ply
+4. all other moves, by their history score
+"""
+def orderMoves(moves, ply, ttMoveID):
+    killers = killerMoves[ply] if ply < MAX_PLY else (None, None)
+
+    def moveOrderScore(move):
+        if move.moveID == ttMoveID:
+            return 1 << 40
+        if move.isCapture:
+            return (1 << 30) + pieceScore[move.pieceCaptured[1]] * 16 - pieceScore[move.pieceMoved[1]]
+        if move.moveID == killers[0]:
+            return (1 << 29) + 1
+        if move.moveID == killers[1]:
+            return 1 << 29
+        return historyTable[move.pieceMoved][move.endRow * 8 + move.endCol]
+
+    moves.sort(key=moveOrderScore, reverse=True)
+
+
+"""
+Remembers a quiet move which caused a beta cutoff, as a killer move of the ply and in the history table.
+"""
+def updateMoveOrdering(move, ply, depth):
+    if ply < MAX_PLY and killerMoves[ply][0] != move.moveID:
+        killerMoves[ply][1] = killerMoves[ply][0]
+        killerMoves[ply][0] = move.moveID
+    historyTable[move.pieceMoved][move.endRow * 8 + move.endCol] += depth * depth
+
+
+"""
+Forgets the killer moves of the previous search, and halves the history scores so recent cutoffs count most.
+"""
+def resetMoveOrdering():
+    for killers in killerMoves:
+        killers[0] = killers[1] = None
+    for scores in historyTable.values():
+        for sq in range(64):
+            scores[sq] //= 2
+
+
+"""
+Forgets all that earlier searches left behind, the Transposition Table and the move ordering tables, so the next
+search doesn't depend on them (e.g. for repeatable test suite runs).
+"""
+def clearSearchMemory():
+    transpositionTable.clear()
+    for killers in killerMoves:
+        killers[0] = killers[1] = None
+    for scores in historyTable.values():
+        scores[:] = [0] * 64
+
 
 """
 Returns a random move from a list of moves.
@@ -109,15 +283,394 @@ def findBestMoveOld(gs, validMoves):
 
 
 """
-Helper method to make the first recursive call
+Counters and timers of a search, for performance work. They are collected while statistics are enabled (see
+enableStatistics), and findBestMove starts them afresh on every search, so they can be read after a search, or during
+it from its reportIteration function. When statistics are disabled, the search only pays a check for None here and
+there.
+- nodesPerPly / leavesPerPly: alpha-beta nodes, and the ones the alpha-beta search went no deeper from (quiescence
+  search, checkmate or stalemate, Transposition Table or tablebase result), by ply from the root
+- quiescenceNodes: nodes of the quiescence search below those leaves
+- betaCutoffs, and firstMoveCutoffs: the cutoffs by the first move searched, i.e. how good the move ordering is
+- ttProbes, ttHits (an entry for the position) and ttCutoffs (the entry ended the search of the node)
+- tablebaseHits
+- phaseTimes: seconds spent in the GameState's move generation (getValidMoves, getCaptureMoves), in makeMove and
+  undoMove, and in scoreBoard, measured by wrapping those functions during the search. The leaves are scored with
+  the evalScore makeMove keeps up to date, so most of the evaluation is counted in makeMove.
+  Move generation includes the makeMove and undoMove calls it makes to test the moves' legality.
+- searchTime: seconds the search took in total
+The counts are summed over the iterations of the iterative deepening.
+The statistics are those of this process' searches: a ParallelSearch pool's processes keep their own.
 """
-def findBestMove(gs, validMoves, returnQueue):
-    global nextMove
-    nextMove = None
-    # findMoveMinMax(gs, validMoves, DEPTH, gs.whiteToMove)
-    findMoveNegaMax(gs, validMoves, DEPTH, 1 if gs.whiteToMove else -1)
-    # findMoveNegaMaxAlphaBeta(gs, validMoves, DEPTH, -CHECKMATE, CHECKMATE, 1 if gs.whiteToMove else -1)
-    returnQueue.put(nextMove)
+class SearchStatistics:
+    def __init__(self):
+        self.reset(MAX_DEPTH)
+
+    def reset(self, maxDepth):
+        self.nodesPerPly = [0] * (maxDepth + 1)
+        self.leavesPerPly = [0] * (maxDepth + 1)
+        self.quiescenceNodes = 0
+        self.betaCutoffs = 0
+        self.firstMoveCutoffs = 0
+        self.ttProbes = 0
+        self.ttHits = 0
+        self.ttCutoffs = 0
+        self.tablebaseHits = 0
+        self.phaseTimes = {'moveGeneration': 0.0, 'makeUndo': 0.0, 'scoreBoard': 0.0}
+        self.searchTime = 0.0
+        self.startTime = None
+        self.phaseRunning = [False]  # Shared by the timed functions
+
+    """
+    Called by findBestMove when a search starts: resets the statistics and starts timing the phases of the search.
+    """
+    def startSearch(self, gs, maxDepth):
+        global scoreBoard
+        self.reset(maxDepth)
+        self.startTime = time.perf_counter()
+        gs.getValidMoves = self.timePhase(gs.getValidMoves, 'moveGeneration')
+        gs.getCaptureMoves = self.timePhase(gs.getCaptureMoves, 'moveGeneration')
+        gs.makeMove = self.timePhase(gs.makeMove, 'makeUndo')
+        gs.undoMove = self.timePhase(gs.undoMove, 'makeUndo')
+        scoreBoard = self.timePhase(scoreBoard, 'scoreBoard')
+
+    """
+    Called by findBestMove when the search is over: stops timing and takes the time of the search.
+    """
+    def stopSearch(self, gs):
+        global scoreBoard
+        for name in ('getValidMoves', 'getCaptureMoves', 'makeMove', 'undoMove'):
+            delattr(gs, name)  # Back to the methods of the class
+        scoreBoard = scoreBoard.timedFunction
+        self.searchTime = time.perf_counter() - self.startTime
+
+    """
+    Returns function wrapped so the time of its calls is added to the phase. Calls from inside a timed call (e.g. the
+    makeMove calls of getValidMoves) count as part of that call's phase.
+    """
+    def timePhase(self, function, phase):
+        phaseTimes = self.phaseTimes
+        running = self.phaseRunning
+
+        def timedFunction(*args):
+            if running[0]:
+                return function(*args)
+            running[0] = True
+            startTime = time.perf_counter()
+            try:
+                return function(*args)
+            finally:
+                phaseTimes[phase] += time.perf_counter() - startTime
+                running[0] = False
+        timedFunction.timedFunction = function
+        return timedFunction
+
+    """
+    Counts a node of the alpha-beta search at the ply as a leaf (and as a node, if countNode).
+    """
+    def countLeaf(self, ply, countNode=False):
+        if countNode:
+            self.nodesPerPly[ply] += 1
+        self.leavesPerPly[ply] += 1
+
+    def countTTCutoff(self, ply):
+        self.ttCutoffs += 1
+        self.leavesPerPly[ply] += 1
+
+    def getNodes(self):
+        return sum(self.nodesPerPly) + self.quiescenceNodes
+
+    """
+    Returns the seconds the search took, or has been running for if it is still running.
+    """
+    def getElapsed(self):
+        if self.searchTime or self.startTime is None:
+            return self.searchTime
+        return time.perf_counter() - self.startTime
+
+    def getNPS(self):
+        elapsed = self.getElapsed()
+        return self.getNodes() / elapsed if elapsed > 0 else 0
+
+    def getFirstMoveCutoffRate(self):
+        return self.firstMoveCutoffs / self.betaCutoffs if self.betaCutoffs else 0
+
+    """
+    Returns the statistics as a dictionary, e.g. to write them out as JSON.
+    """
+    def getDictionary(self):
+        return {'nodes': self.getNodes(), 'nps': self.getNPS(), 'nodesPerPly': self.nodesPerPly,
+                'leavesPerPly': self.leavesPerPly, 'quiescenceNodes': self.quiescenceNodes,
+                'betaCutoffs': self.betaCutoffs, 'firstMoveCutoffRate': self.getFirstMoveCutoffRate(),
+                'ttProbes': self.ttProbes, 'ttHits': self.ttHits, 'ttCutoffs': self.ttCutoffs,
+                'tablebaseHits': self.tablebaseHits, 'phaseTimes': dict(self.phaseTimes),
+                'searchTime': self.getElapsed()}
+
+    """
+    Returns the statistics as lines of text.
+    """
+    def getReport(self):
+        lastPly = max([ply for ply, nodes in enumerate(self.nodesPerPly) if nodes] + [0])
+        lines = ['nodes {} ({} quiescence), {:.0f} nps'.format(self.getNodes(), self.quiescenceNodes, self.getNPS()),
+                 'nodes per ply  ' + ' '.join(str(nodes) for nodes in self.nodesPerPly[:lastPly + 1]),
+                 'leaves per ply ' + ' '.join(str(leaves) for leaves in self.leavesPerPly[:lastPly + 1]),
+                 'beta cutoffs {}, {:.1%} by the first move'.format(self.betaCutoffs, self.getFirstMoveCutoffRate()),
+                 'TT probes {}, hits {}, cutoffs {}, tablebase hits {}'.format(self.ttProbes, self.ttHits,
+                                                                              self.ttCutoffs, self.tablebaseHits)]
+        searchTime = self.getElapsed()
+        phases = ', '.join('{} {:.3f}s'.format(phase, seconds) for phase, seconds in self.phaseTimes.items())
+        lines.append('time {:.3f}s: {}, other {:.3f}s'.format(searchTime, phases,
+                                                             searchTime - sum(self.phaseTimes.values())))
+        return lines
+
+
+"""
+Turns the collection of SearchStatistics by the searches of this process on or off.
+Returns the SearchStatistics the searches fill in (None when turned off).
+"""
+def enableStatistics(enabled=True):
+    global searchStatistics
+    searchStatistics = SearchStatistics() if enabled else None
+    return searchStatistics
+
+
+"""
+Raised inside the search when the time or node budget of findBestMove runs out.
+"""
+class SearchTimeout(Exception):
+    pass
+
+
+"""
+Raised inside the search of a root move by a ParallelSearch pool process when another root move has raised the
+shared alpha above the one it is searching with, so it can start again with the narrower window.
+"""
+class AlphaRaised(Exception):
+    pass
+
+
+"""
+Counts a searched node, and raises SearchTimeout when the time or node budget of findBestMove has run out or the
+search was asked to stop. The time and the stop request are only looked at every 1024 nodes.
+The budget is only enforced after depth 1, so there is always a move to return.
+In a ParallelSearch pool process, the shared alpha is looked at every 1024 nodes as well, and AlphaRaised is raised
+when it has gone up.
+"""
+def countNode():
+    global nodesSearched
+    nodesSearched += 1
+    if searchDepth > 1 and searchNodeLimit is not None and nodesSearched >= searchNodeLimit:
+        raise SearchTimeout
+    if nodesSearched & 1023 == 0:
+        if searchDepth > 1 and ((searchDeadline is not None and time.time() >= searchDeadline) or
+                                (searchShouldStop is not None and searchShouldStop())):
+            raise SearchTimeout
+        if rootAlpha is not None and parallelAlpha.value - 1 > rootAlpha:
+            raise AlphaRaised
+
+
+"""
+Helper method to make the first recursive call.
+A position in the opening book gets its book move right away, without searching (unless useBook is False), and so
+does a position in the endgame tablebases.
+It uses iterative deepening: the position is searched to depth 1, 2, 3, ... until the time or node budget runs out,
+and the best move of the last completed iteration is returned (and put on the returnQueue, if one is given).
+shouldStop is an optional function, polled during the search, which ends it early by returning True.
+reportIteration is an optional function called after every completed iteration with its depth, score (from the
+point of view of the side to move) and best move.
+Each iteration searches the root moves in the order of the scores they got in the previous one, and the
+Transposition Table brings the best move of the previous iteration to the front in every other position.
+Without validMoves (checkmate or stalemate) there is no move, and None is returned.
+"""
+def findBestMove(gs, validMoves, returnQueue=None, timeLimit=TIME_LIMIT, nodeLimit=None, maxDepth=MAX_DEPTH,
+                 shouldStop=None, useBook=True, reportIteration=None):
+    global nextMove, searchDepth, searchDeadline, searchNodeLimit, searchShouldStop, nodesSearched, rootScores, \
+        bestScore, orderedRootMoves
+    nodesSearched = 0
+    if len(validMoves) == 0:
+        if returnQueue is not None:
+            returnQueue.put(None)
+        return None
+    if useBook:
+        bookMove = openingBook.getBookMove(gs, validMoves)
+        if bookMove is not None:
+            if returnQueue is not None:
+                returnQueue.put(bookMove)
+            return bookMove
+    tablebaseMove = Tablebase.getBestMove(gs, validMoves)
+    if tablebaseMove is not None:
+        if returnQueue is not None:
+            returnQueue.put(tablebaseMove)
+        return tablebaseMove
+
+    transpositionTable.newSearch()
+    resetMoveOrdering()
+    searchDeadline = time.time() + timeLimit if timeLimit is not None else None
+    searchNodeLimit = nodeLimit
+    searchShouldStop = shouldStop
+    movesMade = len(gs.moveLog)
+    turnMultiplier = 1 if gs.whiteToMove else -1
+    statistics = searchStatistics
+    if statistics is not None:
+        statistics.startSearch(gs, maxDepth)
+
+    try:
+        bestMove = None
+        rootMoves = list(validMoves)
+        orderMoves(rootMoves, 0, None)  # Only for the first iteration, the later ones sort by the previous scores
+        for depth in range(1, maxDepth + 1):
+            searchDepth = depth
+            nextMove = None
+            rootScores = {}
+            try:
+                score = findMoveNegaMaxAlphaBeta(gs, rootMoves, depth, -CHECKMATE, CHECKMATE, turnMultiplier)
+            except SearchTimeout:
+                # The aborted iteration left its moves on the board
+                while len(gs.moveLog) > movesMade:
+                    gs.undoMove()
+                break
+            # When every move gets mated none scores above -CHECKMATE and nextMove stays None, any move will do then
+            bestMove = nextMove if nextMove is not None else rootMoves[0]
+            bestScore = score
+            rootMoves.sort(key=lambda move: rootScores.get(move.moveID, -CHECKMATE), reverse=True)
+            orderedRootMoves = list(rootMoves)
+            if reportIteration is not None:
+                reportIteration(depth, score, bestMove)
+            if abs(score) >= CHECKMATE:  # Forced mate found, deeper searches won't change it
+                break
+    finally:
+        if statistics is not None:
+            statistics.stopSearch(gs)
+
+    if returnQueue is not None:
+        returnQueue.put(bestMove)
+    return bestMove
+
+
+# State of the processes of a ParallelSearch pool: the best root score found so far, shared by all of them, the
+# search their Transposition Table and move ordering were last set up for, and the alpha of the root move being
+# searched (None outside of searchRootMove).
+parallelAlpha = None
+parallelSearchNumber = None
+rootAlpha = None
+
+
+def initParallelWorker(sharedAlpha, sharedTableName, sharedTableSize):
+    global parallelAlpha
+    parallelAlpha = sharedAlpha
+    if sharedTableName is not None:
+        useTranspositionTable(SharedTranspositionTable(sharedTableSize, sharedTableName))
+
+
+"""
+Task of a ParallelSearch pool process: searches one root move to the given depth and returns its score, from the
+point of view of the player to move at the root, along with the number of nodes searched.
+Alpha is one below the best score the other root moves have reached so far, so a move which only ties with it is
+still scored exactly, and the tie can be broken like in the serial search. When the other root moves raise that
+score while the move is being searched, its search starts again with the higher alpha; the Transposition Table keeps
+what it had already searched. A move which fails low against it scores below a move searched exactly, so it can
+never be picked over that one.
+"""
+def searchRootMove(gameStateClass, fen, moveID, depth, searchNumber):
+    global searchDepth, searchDeadline, searchNodeLimit, searchShouldStop, nodesSearched, parallelSearchNumber, \
+        rootAlpha
+    if searchNumber != parallelSearchNumber:  # The first task of a new search in this process
+        parallelSearchNumber = searchNumber
+        transpositionTable.newSearch()
+        resetMoveOrdering()
+    searchDepth = depth
+    searchDeadline = searchNodeLimit = searchShouldStop = None
+    nodesSearched = 0
+
+    gs = gameStateClass()
+    gs.loadFEN(fen)
+    for move in gs.getValidMoves():
+        if move.moveID == moveID:
+            gs.makeMove(move)
+            break
+    turnMultiplier = 1 if gs.whiteToMove else -1
+    movesMade = len(gs.moveLog)
+    nextMoves = gs.getValidMoves() if depth > 1 else None
+    try:
+        while True:
+            rootAlpha = parallelAlpha.value - 1
+            try:
+                score = -findMoveNegaMaxAlphaBeta(gs, nextMoves, depth - 1, -CHECKMATE, -rootAlpha, turnMultiplier)
+                break
+            except AlphaRaised:
+                # The aborted search left its moves on the board
+                while len(gs.moveLog) > movesMade:
+                    gs.undoMove()
+    finally:
+        rootAlpha = None
+    with parallelAlpha.get_lock():
+        if score > parallelAlpha.value:
+            parallelAlpha.value = score
+    return score, nodesSearched
+
+
+"""
+Root-parallel search to a fixed depth, on a pool of processes which is kept for all the searches.
+The iterations up to depth - 1 run here, as in findBestMove, and order the root moves. The root moves of the last
+iteration are then spread over the pool: the first (most likely best) one alone, so the others start with its score
+as alpha, then all the others. The best move is the first one in that order with the best score, which is the
+move the serial findBestMove returns at the same depth.
+With sharedTableSize, this process and the pool share a SharedTranspositionTable of that size, so the processes
+reuse each other's results instead of each searching with a private table. The shared entries can come from deeper
+searches than a private table would hold, so the chosen move may then differ from the serial search's.
+"""
+class ParallelSearch:
+    def __init__(self, processes=None, sharedTableSize=None):
+        self.sharedAlpha = Value('i', -CHECKMATE)
+        self.sharedTable = None
+        if sharedTableSize is not None:
+            self.sharedTable = SharedTranspositionTable(sharedTableSize)
+            self.previousTable = transpositionTable
+            useTranspositionTable(self.sharedTable)
+        self.pool = Pool(processes, initializer=initParallelWorker,
+                         initargs=(self.sharedAlpha, self.sharedTable.name if self.sharedTable else None,
+                                   sharedTableSize))
+        self.searchNumber = 0
+
+    """
+    Searches the position to the given depth. Like the serial findBestMove, a book move is played without searching
+    unless useBook is False.
+    """
+    def findBestMove(self, gs, validMoves, depth=DEPTH, useBook=True):
+        global nodesSearched, bestScore
+        nodesSearched = 0
+        if useBook:
+            bookMove = openingBook.getBookMove(gs, validMoves)
+            if bookMove is not None:
+                return bookMove
+        tablebaseMove = Tablebase.getBestMove(gs, validMoves)
+        if tablebaseMove is not None:
+            return tablebaseMove
+        bestMove = findBestMove(gs, validMoves, timeLimit=None, maxDepth=max(depth - 1, 1), useBook=False)
+        if depth == 1 or abs(bestScore) >= CHECKMATE or len(validMoves) == 1:
+            return bestMove
+
+        self.searchNumber += 1
+        self.sharedAlpha.value = -CHECKMATE
+        rootMoves = orderedRootMoves
+        fen = gs.getFEN()
+        tasks = [(type(gs), fen, move.moveID, depth, self.searchNumber) for move in rootMoves]
+        results = [self.pool.apply(searchRootMove, tasks[0])]
+        results += self.pool.starmap(searchRootMove, tasks[1:], chunksize=1)
+
+        bestIndex = 0
+        for i in range(1, len(results)):
+            if results[i][0] > results[bestIndex][0]:
+                bestIndex = i
+        bestScore = results[bestIndex][0]
+        nodesSearched += sum(nodes for _, nodes in results)
+        return rootMoves[bestIndex]
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+        if self.sharedTable is not None:
+            useTranspositionTable(self.previousTable)
+            self.sharedTable.close()
 
 
 """
@@ -162,16 +715,26 @@ def findMoveNegaMax(gs, validMoves, depth, turnMultiplier):
     if depth == 0:
         return turnMultiplier * scoreBoard(gs)
 
+    # The scores stored here are exact, but the table is shared with the alpha-beta search, whose entries may only
+    # be bounds. Only an exact entry searched deep enough can be returned as it is.
+    entry = transpositionTable.probe(gs.zobristKey)
+    if entry is not None and entry[1] >= depth and entry[2] == EXACT and depth != DEPTH:
+        return entry[3]
+
     maxScore = -CHECKMATE
+    bestMove = None
     for move in validMoves:
         gs.makeMove(move)
         nextMoves = gs.getValidMoves()
         score = -findMoveNegaMax(gs, nextMoves, depth - 1, -turnMultiplier)
         if score > maxScore:
             maxScore = score
+            bestMove = move
             if depth == DEPTH:
                 nextMove = move
         gs.undoMove()
+
+    transpositionTable.store(gs.zobristKey, depth, EXACT, maxScore, bestMove)
     return maxScore
 
 
@@ -179,23 +742,75 @@ def findMoveNegaMax(gs, validMoves, depth, turnMultiplier):
 This is based on Alpha-Beta Pruning of the MinMax Tree.
 Improves the AI while decreasing the computing time of the next move.
 Takes two more variables known as Alpha(the max value) and Beta(the min value).
+The root of the search is the node with depth == searchDepth, which findBestMove sets for every iteration.
 """
 def findMoveNegaMaxAlphaBeta(gs, validMoves, depth, alpha, beta, turnMultiplier):
     global nextMove
-    if depth == 0:
+    statistics = searchStatistics
+    # Once few enough pieces are left, the tablebases know the exact result, if their table was generated
+    if gs.pieceCount <= Tablebase.MAX_PIECES and depth != searchDepth:
+        result = Tablebase.probe(gs)
+        if result is not None:
+            countNode()
+            if statistics is not None:
+                statistics.countLeaf(searchDepth - depth, countNode=True)
+                statistics.tablebaseHits += 1
+            return scoreTablebaseResult(result)
+
+    if depth == 0:  # The leaves are not generated with all their moves, see quiescenceSearch
+        if statistics is not None:
+            statistics.countLeaf(searchDepth, countNode=True)
+        return quiescenceSearch(gs, alpha, beta, turnMultiplier)
+
+    countNode()
+    if statistics is not None:
+        statistics.nodesPerPly[searchDepth - depth] += 1
+    if len(validMoves) == 0:  # No moves left means checkmate or stalemate, scoreBoard knows which
+        if statistics is not None:
+            statistics.countLeaf(searchDepth - depth)
         return turnMultiplier * scoreBoard(gs)
 
-    # Todo: Move ordering
+    # A stored score can end the search of this node, or narrow the window, if it was searched deep enough.
+    # At the root we always search, because nextMove has to be set.
+    alphaOriginal = alpha
+    entry = transpositionTable.probe(gs.zobristKey)
+    if statistics is not None:
+        statistics.ttProbes += 1
+        statistics.ttHits += entry is not None
+    if entry is not None and entry[1] >= depth and depth != searchDepth:
+        if entry[2] == EXACT:
+            if statistics is not None:
+                statistics.countTTCutoff(searchDepth - depth)
+            return entry[3]
+        elif entry[2] == LOWERBOUND:
+            alpha = max(alpha, entry[3])
+        else:
+            beta = min(beta, entry[3])
+        if alpha >= beta:
+            if statistics is not None:
+                statistics.countTTCutoff(searchDepth - depth)
+            return entry[3]
+
+    # The root moves are already in the order of the previous iteration's scores.
+    ply = searchDepth - depth
+    if depth != searchDepth:
+        orderMoves(validMoves, ply, entry[4] if entry is not None else None)
+
     maxScore = -CHECKMATE
+    bestMove = None
     for move in validMoves:
         gs.makeMove(move)
-        nextMoves = gs.getValidMoves()
+        nextMoves = gs.getValidMoves() if depth > 1 else None
         score = -findMoveNegaMaxAlphaBeta(gs, nextMoves, depth - 1, -beta, -alpha, -turnMultiplier)
+        if depth == searchDepth:
+            rootScores[move.moveID] = score
         if score > maxScore:
             maxScore = score
-            if depth == DEPTH:
+            bestMove = move
+            if depth == searchDepth:
                 nextMove = move
-                print(move, maxScore)
+                if PRINT_ROOT_MOVES:
+                    print(move, maxScore)
         gs.undoMove()
 
         # This code performs pruning.
@@ -204,13 +819,78 @@ def findMoveNegaMaxAlphaBeta(gs, validMoves, depth, alpha, beta, turnMultiplier)
 
         # This is the break case of the algorithm which decides whether we have the best move or not.
         if alpha >= beta:
+            if not move.isCapture:
+                updateMoveOrdering(move, ply, depth)
+            if statistics is not None:
+                statistics.betaCutoffs += 1
+                statistics.firstMoveCutoffs += move is validMoves[0]
             break
+
+    if maxScore <= alphaOriginal:
+        bound = UPPERBOUND
+    elif maxScore >= beta:
+        bound = LOWERBOUND
+    else:
+        bound = EXACT
+    transpositionTable.store(gs.zobristKey, depth, bound, maxScore, bestMove)
+    return maxScore
+
+
+"""
+Searches only the captures and promotions below the leaves of the alpha-beta search, until the position is quiet.
+Without it the search stops in the middle of exchanges, e.g. right after QxP when the pawn was defended.
+The side to move may always "stand pat", i.e. keep the static evaluation instead of capturing. In check there is
+no standing pat and all evasions are searched, so checkmates at the leaves are still found.
+Delta pruning skips captures which can't raise the score up to alpha even if the captured piece comes for free.
+Returns the score from the point of view of the side to move, like findMoveNegaMaxAlphaBeta.
+"""
+def quiescenceSearch(gs, alpha, beta, turnMultiplier):
+    countNode()
+    moves = gs.getCaptureMoves()
+    inCheck = gs.inCheck
+    if inCheck:
+        if len(moves) == 0:
+            return -CHECKMATE
+        maxScore = -CHECKMATE
+    else:
+        maxScore = turnMultiplier * gs.evalScore  # Stand pat
+        if maxScore >= beta:
+            return maxScore
+        if maxScore > alpha:
+            alpha = maxScore
+
+    orderMoves(moves, MAX_PLY, None)
+    for move in moves:
+        if not inCheck and move.isCapture and not move.isPawnPromotion and \
+                maxScore + pieceScore[move.pieceCaptured[1]] * PAWN_VALUE + DELTA_MARGIN <= alpha:
+            continue
+        gs.makeMove(move)
+        if searchStatistics is not None:
+            searchStatistics.quiescenceNodes += 1
+        score = -quiescenceSearch(gs, -beta, -alpha, -turnMultiplier)
+        gs.undoMove()
+        if score > maxScore:
+            maxScore = score
+            if score > alpha:
+                alpha = score
+                if alpha >= beta:
+                    break
     return maxScore
 
 
 """
-Returns a score based on white's convention.
+Returns the score of a tablebase result (outcome, plies) from the point of view of the side to move.
+Shorter wins score higher, and longer losses.
+"""
+def scoreTablebaseResult(result):
+    outcome, plies = result
+    return outcome * (TABLEBASE_WIN - plies)
+
+
+"""
+Returns a score based on white's convention, in centipawns.
 I.e. A positive score is better for white and bad for black and vice versa.
+The material and position score is kept up to date by the GameState on every move, so this takes constant time.
 """
 def scoreBoard(gs):
     if gs.checkmate:
@@ -221,23 +901,7 @@ def scoreBoard(gs):
     elif gs.stalemate:
         return STALEMATE
 
-    score = 0
-    for r, row in enumerate(gs.board):
-        for c, square in enumerate(row):
-            if square != '--':
-                piecePositionScore = 0
-                if square[1] != 'K':  # No position table for a King, yet.
-                    if square[1] == 'p':  # For a pawn we need it's color also
-                        piecePositionScore = piecePositionScores[square][r][c]
-                    else:  # For any other piece
-                        piecePositionScore = piecePositionScores[square[1]][r][c]
-
-                if square[0] == 'w':
-                    score += pieceScore[square[1]] + piecePositionScore * .1
-                elif square[0] == 'b':
-                    score -= pieceScore[square[1]] + piecePositionScore * .1
-
-    return score
+    return gs.evalScore
 
 
 """
@@ -0,0 +1,493 @@
+"""
+Endgame tablebases: the exact result (win, draw or loss) and distance to mate of every position of an ending with
+few pieces, built offline by retrograde analysis and looked up by the search.
+
+A table covers one material, named like 'KQKR': White's pieces, then Black's, each side starting with its King and
+the other pieces in the order QRBNP. A position with the colours the other way round (e.g. Black's Queen against
+White's Rook) is looked up in the same table with the board flipped. Positions with castling rights, or where an
+en passant capture is possible, are not covered.
+
+A table is a file of one byte per position, indexed by the squares (row * 8 + col) of its pieces, in the order of
+the name, and the side to move: index = ((sq0 * 64 + sq1) * 64 + ...) * 2 + (0 if White is to move else 1).
+A byte holds the result for the side to move:
+    0           draw
+    1 - 127     win, mate in that many plies
+    128 - 253   loss, mated in (byte - 128) plies (128 is checkmate on the board)
+    255         illegal position (two pieces on a square, the side not to move in check, a Pawn on rank 1 or 8)
+The files are memory mapped, so only the pages the searches touch are ever loaded.
+
+The generator starts from the checkmates and works backwards: a position is a win in n + 1 plies if a move leads to
+a position lost in n plies, and a loss once all its moves lead to positions won by the opponent. Captures and
+promotions leave the table, and are looked up in the smaller tables, which are generated first.
+Positions which are never resolved are draws. En passant and castling are ignored by the generator.
+3 piece tables have 2 * 64^3 positions and take some seconds to generate, 4 piece tables 2 * 64^4 (33.5 MB each)
+and take a long time in Python.
+
+Usage:
+    python Tablebase.py KQK KRK KPK         Generate these tables (and the smaller ones they need)
+    python Tablebase.py --all 3             Generate every table with up to 3 pieces
+    python Tablebase.py --fen FEN           Look up a position
+"""
+
+import argparse
+import itertools
+import mmap
+import os
+import time
+from array import array
+
+import ChessEngineAdvanced
+
+TABLEBASE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tablebases')
+MAX_PIECES = 4  # Most pieces (Kings included) of the tables the generator is meant for
+PIECE_ORDER = 'KQRBNP'
+PIECE_VALUES = {'K': 0, 'Q': 9, 'R': 5, 'B': 3, 'N': 3, 'P': 1}
+
+DRAW = 0
+LOSS = 128  # A loss in n plies is stored as LOSS + n
+UNKNOWN = 254  # Only while generating
+ILLEGAL = 255
+MAX_WIN_PLIES = 127
+MAX_LOSS_PLIES = UNKNOWN - 1 - LOSS
+
+# The move tables of ChessEngineAdvanced, with squares as row * 8 + col, and the same as bitmasks
+kingTargetSquares = [tuple(r * 8 + c for r, c in targets) for targets in ChessEngineAdvanced.kingTargets]
+knightTargetSquares = [tuple(r * 8 + c for r, c in targets) for targets in ChessEngineAdvanced.knightTargets]
+pieceRays = {'R': [tuple(tuple(r * 8 + c for r, c in ray) for _, ray in rays) for rays in ChessEngineAdvanced.rookRays],
+             'B': [tuple(tuple(r * 8 + c for r, c in ray) for _, ray in rays) for rays in ChessEngineAdvanced.bishopRays],
+             'Q': [tuple(tuple(r * 8 + c for r, c in ray) for _, ray in rays) for rays in ChessEngineAdvanced.queenRays]}
+betweenMasks = [[sum(1 << (r * 8 + c) for r, c in between) for between in row]
+                for row in ChessEngineAdvanced.betweenSquares]
+attackMasks = {'K': [sum(1 << sq for sq in targets) for targets in kingTargetSquares],
+               'N': [sum(1 << sq for sq in targets) for targets in knightTargetSquares]}
+attackMasks.update({piece: [sum(1 << sq for ray in rays for sq in ray) for rays in pieceRays[piece]]
+                    for piece in 'RBQ'})
+pawnAttackMasks = {'w': [sum(1 << (sq - 8 + dc) for dc in (-1, 1) if sq >= 8 and 0 <= sq % 8 + dc <= 7)
+                         for sq in range(64)],
+                   'b': [sum(1 << (sq + 8 + dc) for dc in (-1, 1) if sq < 56 and 0 <= sq % 8 + dc <= 7)
+                         for sq in range(64)]}
+
+tablebaseDirectory = TABLEBASE_DIRECTORY
+loadedTables = {}  # name -> memory mapped table, or None if there is no file
+
+
+"""
+Returns the pieces of a table name as (color, type) pairs, in the order of the name.
+"""
+def parseName(name):
+    blackStart = name.index('K', 1)
+    return [('w' if i < blackStart else 'b', piece) for i, piece in enumerate(name)]
+
+
+"""
+Returns the name of the table holding the material of the two sides (strings of piece letters, King first), and
+whether the colours have to be swapped to look it up. The stronger side is White in the table.
+"""
+def getTableName(whitePieces, blackPieces):
+    def strength(pieces):
+        return sum(PIECE_VALUES[piece] for piece in pieces), len(pieces), pieces
+    if strength(blackPieces) > strength(whitePieces):
+        return blackPieces + whitePieces, True
+    return whitePieces + blackPieces, False
+
+
+def sortPieces(pieces):
+    return 'K' + ''.join(sorted(pieces.replace('K', ''), key=PIECE_ORDER.index))
+
+
+"""
+Returns the names of all tables with the given number of pieces.
+"""
+def getTableNames(pieceCount):
+    names = []
+    for pieces in itertools.combinations_with_replacement([(color, piece) for color in 'wb' for piece in 'QRBNP'],
+                                                          pieceCount - 2):
+        name = getTableName(sortPieces('K' + ''.join(piece for color, piece in pieces if color == 'w')),
+                            sortPieces('K' + ''.join(piece for color, piece in pieces if color == 'b')))[0]
+        if name not in names:
+            names.append(name)
+    return names
+
+
+"""
+Returns the names of the tables a position of the table can reach by a capture or a promotion.
+"""
+def getSubtableNames(name):
+    pieces = parseName(name)
+    materials = []
+    for i, (color, piece) in enumerate(pieces):
+        if piece == 'K':
+            continue
+        materials.append([p for j, p in enumerate(pieces) if j != i])  # Captured
+        if piece == 'P':
+            for promoted in 'QRBN':
+                materials.append([p if j != i else (color, promoted) for j, p in enumerate(pieces)])
+                for k, (otherColor, otherPiece) in enumerate(pieces):  # Promotion by capturing
+                    if otherColor != color and otherPiece != 'K':
+                        materials.append([p if j != i else (color, promoted) for j, p in enumerate(pieces) if j != k])
+    names = []
+    for material in materials:
+        whitePieces = sortPieces(''.join(piece for color, piece in material if color == 'w'))
+        blackPieces = sortPieces(''.join(piece for color, piece in material if color == 'b'))
+        subName = getTableName(whitePieces, blackPieces)[0]
+        if subName != 'KK' and subName not in names:
+            names.append(subName)
+    return names
+
+
+"""
+Makes the lookups (and the generator) use the table files of another directory.
+"""
+def useDirectory(directory):
+    global tablebaseDirectory
+    tablebaseDirectory = directory
+    loadedTables.clear()
+
+
+def getTablePath(name):
+    return os.path.join(tablebaseDirectory, name + '.tb')
+
+
+"""
+Returns the table of the given name, memory mapped from its file, or None if it wasn't generated.
+"""
+def loadTable(name):
+    if name not in loadedTables:
+        table = None
+        path = getTablePath(name)
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, 'rb') as tableFile:
+                table = mmap.mmap(tableFile.fileno(), 0, access=mmap.ACCESS_READ)
+        loadedTables[name] = table
+    return loadedTables[name]
+
+
+"""
+Returns the byte stored for a position, given as (color, type, square) pieces and the side to move (0 for White),
+or None if there is no table for its material. Bare Kings are a draw without a table.
+"""
+def lookup(pieces, sideToMove):
+    whitePieces = sortPieces(''.join(piece for color, piece, _ in pieces if color == 'w'))
+    blackPieces = sortPieces(''.join(piece for color, piece, _ in pieces if color == 'b'))
+    name, flipped = getTableName(whitePieces, blackPieces)
+    if name == 'KK':
+        return DRAW
+    table = loadTable(name)
+    if table is None:
+        return None
+    if flipped:  # Swap the colours and mirror the ranks
+        pieces = [('b' if color == 'w' else 'w', piece, sq ^ 56) for color, piece, sq in pieces]
+        sideToMove = 1 - sideToMove
+    index = 0
+    for _, _, sq in sorted(pieces, key=lambda p: (p[0] == 'b', PIECE_ORDER.index(p[1]))):
+        index = index * 64 + sq
+    return table[index * 2 + sideToMove]
+
+
+"""
+Returns the result of the position of gs for the side to move as (outcome, plies), outcome being 1 for a win,
+0 for a draw and -1 for a loss, and plies the distance to mate (0 for a draw).
+Returns None if the position has too many pieces, isn't covered, or its table wasn't generated.
+"""
+def probe(gs):
+    if gs.pieceCount > MAX_PIECES:
+        return None
+    rights = gs.currentCastlingRight
+    if rights.wks or rights.wqs or rights.bks or rights.bqs:
+        return None
+    if gs.enpassantPossible:
+        r, c = gs.enpassantPossible
+        pawnRow = r + 1 if gs.whiteToMove else r - 1
+        pawn = 'wp' if gs.whiteToMove else 'bp'
+        if any(0 <= col <= 7 and gs.board[pawnRow][col] == pawn for col in (c - 1, c + 1)):
+            return None
+    pieces = [(piece[0], piece[1].upper(), r * 8 + c)
+              for r, row in enumerate(gs.board) for c, piece in enumerate(row) if piece != '--']
+    value = lookup(pieces, 0 if gs.whiteToMove else 1)
+    if value is None or value == ILLEGAL:
+        return None
+    if value == DRAW:
+        return 0, 0
+    if value < LOSS:
+        return 1, value
+    return -1, value - LOSS
+
+
+"""
+Returns the move of validMoves the tablebases rate best: the fastest win, else a draw, else the slowest loss.
+Returns None if the position or one of the positions after the moves isn't in the tablebases.
+"""
+def getBestMove(gs, validMoves):
+    if len(validMoves) == 0 or probe(gs) is None:
+        return None
+    bestMove = None
+    bestRank = None
+    for move in validMoves:
+        gs.makeMove(move)
+        result = probe(gs)  # From the opponent's point of view
+        gs.undoMove()
+        if result is None:
+            return None
+        outcome, plies = -result[0], result[1]
+        rank = (outcome, -plies if outcome == 1 else plies)
+        if bestRank is None or rank > bestRank:
+            bestRank = rank
+            bestMove = move
+    return bestMove
+
+
+"""
+Yields the moves of the side to move in the position (squares of the pieces of the table, occupied the bitmask of
+those squares) as (slot, endSquare, capturedSlot, promotion): the slot of the moving piece, the slot of the piece it
+captures or -1, and the piece a Pawn promotes to or None. Moves leaving the own King in check are included.
+"""
+def generatePieceMoves(pieces, squares, occupied, sideToMove):
+    color = 'wb'[sideToMove]
+    for slot, (pieceColor, piece) in enumerate(pieces):
+        if pieceColor != color:
+            continue
+        sq = squares[slot]
+        if piece == 'P':
+            step = -8 if color == 'w' else 8
+            lastRow = 0 if color == 'w' else 7
+            endSquares = []
+            if not occupied >> (sq + step) & 1:
+                endSquares.append(sq + step)
+                startRow = 6 if color == 'w' else 1
+                if sq // 8 == startRow and not occupied >> (sq + 2 * step) & 1:
+                    endSquares.append(sq + 2 * step)
+            targets = pawnAttackMasks[color][sq] & occupied
+            for endSq in endSquares + [s for s in squares if targets >> s & 1]:
+                captured = squares.index(endSq) if occupied >> endSq & 1 else -1
+                if captured != -1 and pieces[captured][0] == color:
+                    continue
+                if endSq // 8 == lastRow:
+                    for promoted in 'QRBN':
+                        yield slot, endSq, captured, promoted
+                else:
+                    yield slot, endSq, captured, None
+            continue
+        if piece == 'K' or piece == 'N':
+            endSquares = (kingTargetSquares if piece == 'K' else knightTargetSquares)[sq]
+        else:
+            endSquares = []
+            for ray in pieceRays[piece][sq]:
+                for endSq in ray:
+                    endSquares.append(endSq)
+                    if occupied >> endSq & 1:
+                        break
+        for endSq in endSquares:
+            if occupied >> endSq & 1:
+                captured = squares.index(endSq)
+                if pieces[captured][0] != color:
+                    yield slot, endSq, captured, None
+            else:
+                yield slot, endSq, -1, None
+
+
+"""
+Returns True if the piece on square target is attacked by a piece of the given color. skipSlot is a captured piece.
+"""
+def isAttacked(pieces, squares, occupied, target, color, skipSlot=-1):
+    for slot, (pieceColor, piece) in enumerate(pieces):
+        if pieceColor != color or slot == skipSlot:
+            continue
+        sq = squares[slot]
+        if piece == 'P':
+            if pawnAttackMasks[color][sq] >> target & 1:
+                return True
+        elif attackMasks[piece][sq] >> target & 1:
+            if piece == 'K' or piece == 'N' or not occupied & betweenMasks[sq][target]:
+                return True
+    return False
+
+
+"""
+Generates the table of the given material and writes it to its file, after generating the smaller tables it needs
+which don't exist yet. Returns the number of (legal) positions which are won, drawn and lost for the side to move.
+"""
+def generateTable(name, verbose=False):
+    for subName in getSubtableNames(name):
+        if loadTable(subName) is None:
+            generateTable(subName, verbose)
+
+    startTime = time.perf_counter()
+    pieces = parseName(name)
+    n = len(pieces)
+    kingSlots = (pieces.index(('w', 'K')), pieces.index(('b', 'K')))
+    weights = [64 ** (n - 1 - slot) for slot in range(n)]
+    size = 2 * 64 ** n
+    values = bytearray([UNKNOWN]) * size
+    remaining = bytearray(size)  # Moves staying in the table whose result isn't known yet
+    exitWin = bytearray(size)  # Fastest win (plies) by a capture or promotion, 0 if none
+    exitLoss = bytearray(size)  # Slowest loss (plies) by a capture or promotion
+    exitDraw = bytearray(size)  # 1 if a capture or promotion draws
+    resolved = [array('I') for _ in range(UNKNOWN)]  # plies -> positions whose result was found at that distance
+    pendingWins = [array('I') for _ in range(MAX_WIN_PLIES + 1)]  # plies -> positions winning by leaving the table
+
+    # Every position: legality, checkmates and stalemates, moves staying in the table, and results leaving it
+    for position, squares in enumerate(itertools.product(range(64), repeat=n)):
+        occupied = 0
+        for sq in squares:
+            occupied |= 1 << sq
+        if bin(occupied).count('1') < n or \
+                any(piece == 'P' and squares[slot] // 8 in (0, 7) for slot, (_, piece) in enumerate(pieces)):
+            values[2 * position] = values[2 * position + 1] = ILLEGAL
+            continue
+        for sideToMove in (0, 1):
+            index = 2 * position + sideToMove
+            enemy = 'bw'[sideToMove]
+            if isAttacked(pieces, squares, occupied, squares[kingSlots[1 - sideToMove]], 'wb'[sideToMove]):
+                values[index] = ILLEGAL
+                continue
+            legalMoves = 0
+            for slot, endSq, captured, promotion in generatePieceMoves(pieces, squares, occupied, sideToMove):
+                newSquares = list(squares)
+                newSquares[slot] = endSq
+                newOccupied = occupied & ~(1 << squares[slot]) | 1 << endSq
+                if isAttacked(pieces, newSquares, newOccupied, newSquares[kingSlots[sideToMove]], enemy, captured):
+                    continue
+                legalMoves += 1
+                if captured == -1 and promotion is None:
+                    remaining[index] += 1
+                    continue
+                child = [(color, promotion if j == slot and promotion else piece, newSquares[j])
+                         for j, (color, piece) in enumerate(pieces) if j != captured]
+                value = lookup(child, 1 - sideToMove)
+                if value == DRAW:
+                    exitDraw[index] = 1
+                elif value < LOSS:
+                    exitLoss[index] = max(exitLoss[index], value + 1)
+                elif exitWin[index] == 0 or value - LOSS + 1 < exitWin[index]:
+                    exitWin[index] = value - LOSS + 1
+
+            if legalMoves == 0:
+                inCheck = isAttacked(pieces, squares, occupied, squares[kingSlots[sideToMove]], enemy)
+                values[index] = LOSS if inCheck else DRAW  # Checkmate or stalemate
+                if inCheck:
+                    resolved[0].append(index)
+            elif exitWin[index]:
+                pendingWins[exitWin[index]].append(index)
+            elif remaining[index] == 0:  # Every move leaves the table
+                if exitDraw[index]:
+                    values[index] = DRAW
+                else:
+                    values[index] = LOSS + exitLoss[index]
+                    resolved[exitLoss[index]].append(index)
+
+    # Backwards from the checkmates, one ply at a time
+    for plies in range(UNKNOWN):
+        if plies <= MAX_WIN_PLIES:
+            for index in pendingWins[plies]:
+                if values[index] == UNKNOWN:
+                    values[index] = plies
+                    resolved[plies].append(index)
+        for index in resolved[plies]:
+            lost = values[index] >= LOSS
+            sideToMove = index & 1
+            position = index >> 1
+            squares = []
+            for slot in range(n):
+                squares.append(position // weights[slot] % 64)
+            occupied = 0
+            for sq in squares:
+                occupied |= 1 << sq
+
+            # The positions before the last move, i.e. the opponent's moves which don't capture or promote
+            mover = 'bw'[sideToMove]
+            for slot, (color, piece) in enumerate(pieces):
+                if color != mover:
+                    continue
+                sq = squares[slot]
+                if piece == 'P':
+                    step = 8 if color == 'w' else -8
+                    startSquares = []
+                    if 1 <= sq // 8 + step // 8 <= 6 and not occupied >> (sq + step) & 1:
+                        startSquares.append(sq + step)
+                        if sq // 8 == (4 if color == 'w' else 3) and not occupied >> (sq + 2 * step) & 1:
+                            startSquares.append(sq + 2 * step)
+                elif piece == 'K' or piece == 'N':
+                    startSquares = [s for s in (kingTargetSquares if piece == 'K' else knightTargetSquares)[sq]
+                                    if not occupied >> s & 1]
+                else:
+                    startSquares = []
+                    for ray in pieceRays[piece][sq]:
+                        for s in ray:
+                            if occupied >> s & 1:
+                                break
+                            startSquares.append(s)
+
+                for startSq in startSquares:
+                    parent = 2 * (position + (startSq - sq) * weights[slot]) + 1 - sideToMove
+                    if values[parent] != UNKNOWN:
+                        continue
+                    if lost:  # The parent moves into a lost position, it wins
+                        if plies + 1 > MAX_WIN_PLIES:
+                            raise ValueError(name + ': win longer than ' + str(MAX_WIN_PLIES) + ' plies')
+                        values[parent] = plies + 1
+                        resolved[plies + 1].append(parent)
+                        continue
+                    remaining[parent] -= 1
+                    if remaining[parent] == 0 and not exitDraw[parent] and not exitWin[parent]:
+                        lossPlies = max(plies + 1, exitLoss[parent])
+                        if lossPlies > MAX_LOSS_PLIES:
+                            raise ValueError(name + ': loss longer than ' + str(MAX_LOSS_PLIES) + ' plies')
+                        values[parent] = LOSS + lossPlies
+                        resolved[lossPlies].append(parent)
+        resolved[plies] = None  # Free the memory
+
+    wins = draws = losses = 0
+    for index in range(size):
+        value = values[index]
+        if value == UNKNOWN:
+            values[index] = DRAW
+            draws += 1
+        elif value == DRAW:
+            draws += 1
+        elif value < LOSS:
+            wins += 1
+        elif value != ILLEGAL:
+            losses += 1
+
+    os.makedirs(tablebaseDirectory, exist_ok=True)
+    with open(getTablePath(name), 'wb') as tableFile:
+        tableFile.write(values)
+    loadedTables.pop(name, None)
+    if verbose:
+        print('{}: {} wins, {} draws, {} losses in {:.1f}s'.format(name, wins, draws, losses,
+                                                                  time.perf_counter() - startTime))
+    return wins, draws, losses
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate endgame tablebases, or look up a position.')
+    parser.add_argument('tables', nargs='*', help='Names of the tables to generate, e.g. KQK KRK KQKR')
+    parser.add_argument('--all', type=int, metavar='PIECES', help='Generate every table with up to PIECES pieces')
+    parser.add_argument('--fen', help='Look up a position')
+    parser.add_argument('-d', '--directory', default=TABLEBASE_DIRECTORY, help='Directory of the table files')
+    args = parser.parse_args()
+
+    useDirectory(args.directory)
+    names = [getTableName(*(sortPieces('K' + side) for side in name.upper().split('K')[1:]))[0]
+             for name in args.tables]
+    if args.all is not None:
+        names += [name for count in range(3, args.all + 1) for name in getTableNames(count)]
+    for name in names:
+        if loadTable(name) is None:
+            generateTable(name, verbose=True)
+    if args.fen:
+        gs = ChessEngineAdvanced.GameState()
+        gs.loadFEN(args.fen)
+        result = probe(gs)
+        if result is None:
+            print('Not in the tablebases')
+        else:
+            outcome, plies = result
+            print(('Draw', 'Win in ' + str(plies) + ' plies', 'Loss in ' + str(plies) + ' plies')[outcome])
+            bestMove = getBestMove(gs, gs.getValidMoves())
+            if bestMove is not None:
+                print('Best move: ' + bestMove.getChessNotation())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+"""
+Headless self-play matches between two configurations of SmartMoveFinder, to check that a change makes the engine
+stronger (or at least not weaker) and how it changes its speed.
+
+A configuration is a set of search limits (depth, nodes, time in seconds) and overrides of SmartMoveFinder's module
+settings, written as key=value pairs, e.g. "nodes=5000" or "nodes=5000 DELTA_MARGIN=150". Both configurations
+run this tree's code, each with its own Transposition Table and move ordering tables. A configuration needs at
+least one search limit.
+The games are played in pairs from random openings: the first plies are picked at random from the opening book,
+and both engines play the opening once with White and once with Black.
+
+Every finished game is appended to the results file as a JSON line, right away, so a long run can be stopped and
+resumed: the games already in the file are counted and not played again. The first line holds the settings of the
+run, and a resumed run must use the same ones.
+
+The results are reported as the Elo difference of engine B against engine A with its 95% error, the SPRT
+(Sequential Probability Ratio Test) log likelihood ratio of the hypotheses Elo = elo0 against Elo = elo1, and the
+nodes per second and time per move of both engines. The run stops as soon as the SPRT accepts a hypothesis.
+
+Usage:
+    python Tournament.py -a "nodes=3000" -b "nodes=6000" -g 200 -j 4
+    python Tournament.py -a "depth=3" -b "depth=3 DELTA_MARGIN=100" -o results.jsonl      (run again to resume)
+    python Tournament.py -a "time=0.2" -b "time=0.2" --elo0 0 --elo1 10 --no-sprt-stop
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+from multiprocessing import Pool
+
+import ChessEngineAdvanced
+import ChessEngineBitboard
+import SmartMoveFinder
+
+SEARCH_LIMITS = ('depth', 'nodes', 'time')
+# Settings which only set the defaults of findBestMove's limits, which searchMove passes itself
+LIMIT_SETTINGS = ('DEPTH', 'MAX_DEPTH', 'TIME_LIMIT')
+MAX_PLIES = 300  # A game still going after this many plies is adjudicated a draw
+FIFTY_MOVE_PLIES = 100
+
+# Per worker process: the Transposition Table, killer moves and history table of each engine
+engineTables = None
+
+
+"""
+Returns the configuration described by a string of key=value pairs, as a dictionary. Search limits are numbers,
+the other keys must be settings of SmartMoveFinder and get the type of the setting (booleans are written 1 / 0,
+true / false or yes / no). Raises ValueError on an unknown key or a value which doesn't fit, or without any search
+limit, since the search would never end.
+"""
+def parseConfiguration(text):
+    configuration = {}
+    for pair in text.split():
+        key, _, value = pair.partition('=')
+        if key in SEARCH_LIMITS:
+            configuration[key] = float(value) if key == 'time' else int(value)
+        elif key in LIMIT_SETTINGS:
+            raise ValueError('Set the search limits with depth, nodes and time, not ' + key)
+        elif hasattr(SmartMoveFinder, key) and key.isupper() and isinstance(getattr(SmartMoveFinder, key), bool):
+            if value.lower() not in ('1', 'true', 'yes', '0', 'false', 'no'):
+                raise ValueError('Not a boolean: ' + pair)
+            configuration[key] = value.lower() in ('1', 'true', 'yes')
+        elif hasattr(SmartMoveFinder, key) and key.isupper():
+            configuration[key] = type(getattr(SmartMoveFinder, key))(value)
+        else:
+            raise ValueError('Unknown setting: ' + key)
+    if not any(key in configuration for key in SEARCH_LIMITS):
+        raise ValueError('No search limit (depth, nodes or time) in: ' + text)
+    return configuration
+
+
+def initTournamentWorker():
+    global engineTables
+    engineTables = [(SmartMoveFinder.TranspositionTable(),) + SmartMoveFinder.newMoveOrderingTables()
+                    for _ in range(2)]
+    SmartMoveFinder.PRINT_ROOT_MOVES = False
+
+
+"""
+Searches the position with the configuration (its limits, with its settings set in SmartMoveFinder meanwhile).
+Returns the best move and the nodes searched.
+"""
+def searchMove(gs, validMoves, configuration):
+    overrides = {key: value for key, value in configuration.items() if key not in SEARCH_LIMITS}
+    savedSettings = {key: getattr(SmartMoveFinder, key) for key in overrides}
+    for key, value in overrides.items():
+        setattr(SmartMoveFinder, key, value)
+    try:
+        move = SmartMoveFinder.findBestMove(gs, validMoves, timeLimit=configuration.get('time'),
+                                            nodeLimit=configuration.get('nodes'),
+                                            maxDepth=configuration.get('depth', SmartMoveFinder.MAX_DEPTH),
+                                            useBook=False)
+    finally:
+        for key, value in savedSettings.items():
+            setattr(SmartMoveFinder, key, value)
+    return move, SmartMoveFinder.nodesSearched
+
+
+"""
+Returns the opening of a game pair: up to plies random book moves from the starting position, in coordinate notation.
+"""
+def getOpening(pairIndex, plies, seed):
+    randomGenerator = random.Random(seed * 1000003 + pairIndex)
+    gs = ChessEngineAdvanced.GameState()
+    opening = []
+    for _ in range(plies):
+        move = SmartMoveFinder.openingBook.getBookMove(gs, gs.getValidMoves(), randomGenerator)
+        if move is None:
+            break
+        opening.append(move.getChessNotation())
+        gs.makeMove(move)
+    return opening
+
+
+"""
+Returns the reason the game of gs is over ('checkmate', 'stalemate', 'repetition', 'fifty moves', 'material'), or
+None. validMoves are the valid moves of the position.
+"""
+def getGameOver(gs, validMoves):
+    if len(validMoves) == 0:
+        return 'checkmate' if gs.inCheck else 'stalemate'
+    if gs.zobristKeyLog.count(gs.zobristKey) >= 3:
+        return 'repetition'
+    reversiblePlies = 0
+    for move in reversed(gs.moveLog):
+        if move.isCapture or move.pieceMoved[1] == 'p':
+            break
+        reversiblePlies += 1
+    if reversiblePlies >= FIFTY_MOVE_PLIES:
+        return 'fifty moves'
+    pieces = [piece[1] for row in gs.board for piece in row if piece != '--' and piece[1] != 'K']
+    if len(pieces) == 0 or (len(pieces) == 1 and pieces[0] in 'BN'):
+        return 'material'
+    return None
+
+
+"""
+Task of a pool process: plays one game, engine A with White in even games and engine B in odd ones.
+Returns the game's record: its result from White's point of view, how it ended, its moves, and every engine's
+moves, nodes and search time.
+"""
+def playGame(gameIndex, configurations, opening, gameStateClass):
+    gs = gameStateClass()
+    for notation in opening:
+        gs.makeMove(next(move for move in gs.getValidMoves() if move.getChessNotation() == notation and
+                         (not move.isPawnPromotion or move.promotionPiece == 'Q')))
+    for engine in range(2):  # Every game starts with empty tables
+        engineTables[engine][0].clear()
+        engineTables[engine] = (engineTables[engine][0],) + SmartMoveFinder.newMoveOrderingTables()
+    whiteEngine = gameIndex % 2  # 0 is engine A
+    statistics = [{'moves': 0, 'nodes': 0, 'time': 0.0}, {'moves': 0, 'nodes': 0, 'time': 0.0}]
+    moves = []
+
+    result = '1/2-1/2'
+    while len(gs.moveLog) < MAX_PLIES:
+        validMoves = gs.getValidMoves()
+        termination = getGameOver(gs, validMoves)
+        if termination is not None:
+            if termination == 'checkmate':
+                result = '0-1' if gs.whiteToMove else '1-0'
+            break
+        engine = whiteEngine if gs.whiteToMove else 1 - whiteEngine
+        table, killers, history = engineTables[engine]
+        SmartMoveFinder.useTranspositionTable(table)
+        SmartMoveFinder.useMoveOrderingTables(killers, history)
+        startTime = time.perf_counter()
+        move, nodes = searchMove(gs, validMoves, configurations[engine])
+        statistics[engine]['time'] += time.perf_counter() - startTime
+        statistics[engine]['nodes'] += nodes
+        statistics[engine]['moves'] += 1
+        moves.append(move.getChessNotation() + (move.promotionPiece.lower() if move.isPawnPromotion else ''))
+        gs.makeMove(move)
+    else:
+        termination = 'adjudication'
+
+    return {'game': gameIndex, 'white': 'AB'[whiteEngine], 'result': result, 'termination': termination,
+            'opening': opening, 'moves': moves, 'engineA': statistics[0], 'engineB': statistics[1]}
+
+
+def playGameTask(task):
+    return playGame(*task)
+
+
+"""
+Returns engine B's wins, draws and losses in the game records.
+"""
+def countResults(records):
+    wins = draws = losses = 0
+    for record in records:
+        if record['result'] == '1/2-1/2':
+            draws += 1
+        elif (record['result'] == '1-0') == (record['white'] == 'B'):
+            wins += 1
+        else:
+            losses += 1
+    return wins, draws, losses
+
+
+"""
+Returns the Elo difference corresponding to an expected score between 0 and 1.
+"""
+def getElo(score):
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+
+def getExpectedScore(elo):
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+"""
+Returns the Elo difference for the wins, draws and losses, and the half width of its 95% confidence interval.
+"""
+def getEloEstimate(wins, draws, losses):
+    games = wins + draws + losses
+    score = (wins + draws / 2) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    margin = 1.96 * math.sqrt(variance / games)
+    return getElo(score), (getElo(min(score + margin, 1)) - getElo(max(score - margin, 0))) / 2
+
+
+"""
+Returns the log likelihood ratio of the SPRT of Elo = elo1 against Elo = elo0, with the normal approximation of
+the game results. It is 0 until there are both decisive and drawn or lost games to estimate the variance from.
+"""
+def getLLR(wins, draws, losses, elo0, elo1):
+    games = wins + draws + losses
+    if games == 0:
+        return 0.0
+    score = (wins + draws / 2) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    if variance == 0:
+        return 0.0
+    score0 = getExpectedScore(elo0)
+    score1 = getExpectedScore(elo1)
+    return games * (score1 - score0) * (2 * score - score0 - score1) / (2 * variance)
+
+
+"""
+Returns the SPRT's lower and upper bounds of the log likelihood ratio for the error rates alpha and beta.
+"""
+def getSPRTBounds(alpha, beta):
+    return math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+
+
+"""
+Reads the game records of a results file. Raises ValueError if the file was written with other settings, or holds
+a line after the settings which is no game record.
+"""
+def readResults(path, settings):
+    records = []
+    if not os.path.exists(path):
+        return records
+    with open(path) as resultsFile:
+        settingsRead = False
+        for lineNumber, line in enumerate(resultsFile, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if not settingsRead:
+                if record != settings:
+                    raise ValueError(path + ' holds a run with other settings: ' + json.dumps(record))
+                settingsRead = True
+            elif 'game' not in record:
+                raise ValueError('{} line {} is no game record: {}'.format(path, lineNumber, line.strip()))
+            else:
+                records.append(record)
+    return records
+
+
+def printStatus(records, elo0, elo1, bounds):
+    wins, draws, losses = countResults(records)
+    elo, margin = getEloEstimate(wins, draws, losses)
+    print('Games {}: B +{} ={} -{}  Elo {:+.1f} +- {:.1f}  LLR {:.2f} ({:.2f}, {:.2f})'.format(
+        len(records), wins, draws, losses, elo, margin, getLLR(wins, draws, losses, elo0, elo1), *bounds))
+
+
+def printEngineStatistics(records):
+    for engine in ('A', 'B'):
+        moves = sum(record['engine' + engine]['moves'] for record in records)
+        nodes = sum(record['engine' + engine]['nodes'] for record in records)
+        seconds = sum(record['engine' + engine]['time'] for record in records)
+        print('Engine {}: {} moves, {:.0f} nps, {:.3f}s per move'.format(
+            engine, moves, nodes / seconds if seconds > 0 else 0, seconds / moves if moves > 0 else 0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Play self-play matches between two engine configurations.')
+    parser.add_argument('-a', '--engine-a', default='nodes=3000', help='Configuration of engine A (the baseline)')
+    parser.add_argument('-b', '--engine-b', default='nodes=3000', help='Configuration of engine B (the change)')
+    parser.add_argument('-g', '--games', type=int, default=100, help='Number of games (rounded up to pairs)')
+    parser.add_argument('-j', '--processes', type=int, default=os.cpu_count(), help='Number of worker processes')
+    parser.add_argument('-o', '--output', default='tournament.jsonl', help='Results file, appended to and resumed')
+    parser.add_argument('--opening-plies', type=int, default=8, help='Random book plies of the openings')
+    parser.add_argument('--seed', type=int, default=1, help='Seed of the opening choice')
+    parser.add_argument('--elo0', type=float, default=0.0, help='Elo of the SPRT null hypothesis')
+    parser.add_argument('--elo1', type=float, default=5.0, help='Elo of the SPRT alternative hypothesis')
+    parser.add_argument('--alpha', type=float, default=0.05, help='SPRT false positive rate')
+    parser.add_argument('--beta', type=float, default=0.05, help='SPRT false negative rate')
+    parser.add_argument('--no-sprt-stop', action='store_true', help='Play all the games even when the SPRT is done')
+    parser.add_argument('--bitboards', action='store_true', help='Use the bitboard GameState')
+    args = parser.parse_args()
+
+    try:
+        configurations = (parseConfiguration(args.engine_a), parseConfiguration(args.engine_b))
+    except ValueError as error:
+        parser.error(str(error))
+    games = args.games + args.games % 2
+    settings = {'engineA': configurations[0], 'engineB': configurations[1], 'openingPlies': args.opening_plies,
+                'seed': args.seed, 'bitboards': args.bitboards}
+    try:
+        records = readResults(args.output, settings)
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        sys.exit(1)
+    played = {record['game'] for record in records}
+    bounds = getSPRTBounds(args.alpha, args.beta)
+    if records:
+        print('Resuming with ' + str(len(records)) + ' games from ' + args.output)
+
+    gameStateClass = ChessEngineBitboard.GameState if args.bitboards else ChessEngineAdvanced.GameState
+    tasks = [(i, configurations, getOpening(i // 2, args.opening_plies, args.seed), gameStateClass)
+             for i in range(games) if i not in played]
+    startTime = time.perf_counter()
+    with open(args.output, 'a') as resultsFile:
+        if resultsFile.tell() == 0:  # A new file starts with the settings, also when no game was finished yet
+            resultsFile.write(json.dumps(settings) + '\n')
+        with Pool(args.processes, initializer=initTournamentWorker) as pool:
+            for record in pool.imap_unordered(playGameTask, tasks):
+                resultsFile.write(json.dumps(record) + '\n')
+                resultsFile.flush()
+                records.append(record)
+                printStatus(records, args.elo0, args.elo1, bounds)
+                llr = getLLR(*countResults(records), args.elo0, args.elo1)
+                if not args.no_sprt_stop and (llr <= bounds[0] or llr >= bounds[1]):
+                    pool.terminate()
+                    break
+
+    if not records:
+        return
+    print('Finished in {:.1f}s'.format(time.perf_counter() - startTime))
+    printStatus(records, args.elo0, args.elo1, bounds)
+    printEngineStatistics(records)
+    llr = getLLR(*countResults(records), args.elo0, args.elo1)
+    if llr >= bounds[1]:
+        print('SPRT: H1 accepted, engine B is at least {} Elo stronger'.format(args.elo1))
+    elif llr <= bounds[0]:
+        print('SPRT: H0 accepted, engine B is not {} Elo stronger'.format(args.elo1))
+    else:
+        print('SPRT: no verdict yet')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""
+Headless engine speaking the UCI (Universal Chess Interface) protocol on stdin / stdout, so SmartMoveFinder can be
+run by chess GUIs, match runners and test tools without pygame.
+
+Supported commands:
+    uci, isready, ucinewgame, quit
+    position startpos|fen <FEN> [moves <move> ...]      Moves in coordinate notation, e.g. e2e4 or e7e8q
+    go [depth N] [movetime MS] [nodes N] [wtime MS btime MS winc MS binc MS movestogo N] [infinite]
+    stop
+    setoption name Statistics value true|false         Search statistics (see SmartMoveFinder.SearchStatistics)
+The search runs in a thread, so stop and isready are answered while it runs. After every completed iteration it
+prints an info line with the depth, score, nodes, nodes per second, time and principal variation, followed by info
+string lines with the search statistics when they are enabled. go infinite sends its bestmove only after stop.
+
+Usage:
+    python UCI.py                           Start the engine (a GUI or match runner talks to it)
+    python UCI.py --bitboards               Use the bitboard GameState
+"""
+
+import argparse
+import sys
+import threading
+import time
+
+import ChessEngineAdvanced
+import ChessEngineBitboard
+import SmartMoveFinder
+from EngineWorker import findMoveByID
+
+ENGINE_NAME = 'Chess-Engine'
+ENGINE_AUTHOR = 'Chess-Engine contributors'
+DEFAULT_MOVES_TO_GO = 30  # Moves the remaining clock time is spread over when the GUI doesn't say
+MOVE_OVERHEAD = 0.05  # Seconds kept back on every move for the communication with the GUI
+
+
+"""
+The engine: its GameState, the search thread, and the handling of every command.
+"""
+class UCIEngine:
+    def __init__(self, gameStateClass=ChessEngineAdvanced.GameState, output=sys.stdout):
+        self.gameStateClass = gameStateClass
+        self.output = output
+        self.outputLock = threading.Lock()  # The search thread prints too
+        self.gs = gameStateClass()
+        self.positionFEN = ChessEngineAdvanced.STARTING_FEN
+        self.searchThread = None
+        self.stopRequested = threading.Event()
+        SmartMoveFinder.PRINT_ROOT_MOVES = False
+
+    def send(self, line):
+        with self.outputLock:
+            self.output.write(line + '\n')
+            self.output.flush()
+
+    """
+    Handles one command line. Returns False on quit.
+    """
+    def handleCommand(self, line):
+        tokens = line.split()
+        if len(tokens) == 0:
+            return True
+        command = tokens[0]
+        if command == 'uci':
+            self.send('id name ' + ENGINE_NAME)
+            self.send('id author ' + ENGINE_AUTHOR)
+            self.send('option name Statistics type check default false')
+            self.send('uciok')
+        elif command == 'isready':
+            self.send('readyok')
+        elif command == 'setoption':
+            self.stopSearch()
+            self.setOption(tokens[1:])
+        elif command == 'ucinewgame':
+            self.stopSearch()
+            SmartMoveFinder.transpositionTable.clear()
+            SmartMoveFinder.resetMoveOrdering()
+            self.gs = self.gameStateClass()
+            self.positionFEN = ChessEngineAdvanced.STARTING_FEN
+        elif command == 'position':
+            self.stopSearch()
+            self.setPosition(tokens[1:])
+        elif command == 'go':
+            self.stopSearch()
+            self.startSearch(tokens[1:])
+        elif command == 'stop':
+            self.stopSearch()
+        elif command == 'quit':
+            self.stopSearch()
+            return False
+        return True
+
+    """
+    Sets up the position of a position command. When it is the current position with moves added (as GUIs send
+    it on every move), only the new moves are played.
+    """
+    def setPosition(self, tokens):
+        if 'moves' in tokens:
+            moves = tokens[tokens.index('moves') + 1:]
+            tokens = tokens[:tokens.index('moves')]
+        else:
+            moves = []
+        fen = ChessEngineAdvanced.STARTING_FEN if tokens[:1] == ['startpos'] else ' '.join(tokens[1:])
+
+        playedMoves = [getUCINotation(move) for move in self.gs.moveLog]
+        if fen != self.positionFEN or moves[:len(playedMoves)] != playedMoves:
+            gs = self.gameStateClass()
+            try:
+                gs.loadFEN(fen)
+            except ValueError as error:
+                self.send('info string ' + str(error))
+                return
+            self.gs = gs
+            self.positionFEN = fen
+            playedMoves = []
+        for notation in moves[len(playedMoves):]:
+            move = findMove(self.gs.getValidMoves(), notation)
+            if move is None:
+                self.send('info string illegal move ' + notation)
+                break
+            self.gs.makeMove(move)
+
+    """
+    Sets an option of a setoption command: name <name> value <value>. Unknown options are ignored.
+    """
+    def setOption(self, tokens):
+        name = ' '.join(tokens[1:tokens.index('value')] if 'value' in tokens else tokens[1:])
+        value = ' '.join(tokens[tokens.index('value') + 1:]) if 'value' in tokens else ''
+        if name.lower() == 'statistics':
+            SmartMoveFinder.enableStatistics(value.lower() == 'true')
+
+    """
+    Starts the search of a go command in the search thread. An option without a valid number is reported and
+    ignored.
+    """
+    def startSearch(self, tokens):
+        options = {}
+        for i, token in enumerate(tokens):
+            if token in ('depth', 'movetime', 'nodes', 'wtime', 'btime', 'winc', 'binc', 'movestogo'):
+                try:
+                    options[token] = int(tokens[i + 1])
+                except (IndexError, ValueError):
+                    self.send('info string invalid value for ' + token)
+        infinite = 'infinite' in tokens
+
+        timeLimit = None
+        if 'movetime' in options:
+            timeLimit = max(options['movetime'] / 1000 - MOVE_OVERHEAD, 0.01)
+        elif ('wtime' if self.gs.whiteToMove else 'btime') in options:
+            remaining = options['wtime' if self.gs.whiteToMove else 'btime'] / 1000
+            increment = options.get('winc' if self.gs.whiteToMove else 'binc', 0) / 1000
+            timeLimit = remaining / options.get('movestogo', DEFAULT_MOVES_TO_GO) + increment * 0.8
+            timeLimit = max(min(timeLimit, remaining - MOVE_OVERHEAD), 0.01)
+        elif not infinite and 'depth' not in options and 'nodes' not in options:
+            timeLimit = SmartMoveFinder.TIME_LIMIT
+
+        self.stopRequested.clear()
+        self.searchThread = threading.Thread(
+            target=self.search,
+            args=(timeLimit, options.get('nodes'), max(options.get('depth', SmartMoveFinder.MAX_DEPTH), 1), infinite),
+            daemon=True)
+        self.searchThread.start()
+
+    """
+    The search thread: searches the current position and sends the best move. An infinite search only sends it
+    after stop, even when it finished searching before. A bestmove is always sent, 0000 if the search failed.
+    """
+    def search(self, timeLimit, nodeLimit, maxDepth, infinite=False):
+        startTime = time.perf_counter()
+
+        def reportIteration(depth, score, bestMove):
+            elapsed = max(time.perf_counter() - startTime, 1e-6)
+            nodes = SmartMoveFinder.nodesSearched
+            # Mate scores don't tell the distance to mate, so mates are sent as the CHECKMATE score, not as mate N
+            self.send('info depth {} score cp {} nodes {} nps {} time {} pv {}'.format(
+                depth, score, nodes, int(nodes / elapsed), int(elapsed * 1000),
+                ' '.join(getPrincipalVariation(self.gs, bestMove, depth))))
+            if SmartMoveFinder.searchStatistics is not None:
+                for statisticsLine in SmartMoveFinder.searchStatistics.getReport():
+                    self.send('info string ' + statisticsLine)
+
+        bestMove = None
+        movesMade = len(self.gs.moveLog)
+        try:
+            validMoves = self.gs.getValidMoves()
+            if len(validMoves) > 0:
+                bestMove = SmartMoveFinder.findBestMove(self.gs, validMoves, timeLimit=timeLimit, nodeLimit=nodeLimit,
+                                                        maxDepth=maxDepth, shouldStop=self.stopRequested.is_set,
+                                                        reportIteration=reportIteration)
+        except Exception as error:
+            bestMove = None
+            self.send('info string search failed: {!r}'.format(error))
+            while len(self.gs.moveLog) > movesMade:  # The failed search may have left its moves on the board
+                self.gs.undoMove()
+        finally:
+            if infinite:
+                self.stopRequested.wait()
+            self.send('bestmove ' + (getUCINotation(bestMove) if bestMove is not None else '0000'))
+
+    """
+    Stops the running search, if there is one, and waits for it to send its best move.
+    """
+    def stopSearch(self):
+        if self.searchThread is not None:
+            self.stopRequested.set()
+            self.searchThread.join()
+            self.searchThread = None
+
+
+"""
+Returns a move in UCI notation: coordinates, and the promotion piece in lower case.
+"""
+def getUCINotation(move):
+    return move.getChessNotation() + (move.promotionPiece.lower() if move.isPawnPromotion else '')
+
+
+"""
+Returns the move of validMoves written as notation in UCI notation, or None.
+"""
+def findMove(validMoves, notation):
+    for move in validMoves:
+        if getUCINotation(move) == notation:
+            return move
+    return None
+
+
+"""
+Returns the principal variation in UCI notation: bestMove, followed by the best moves the Transposition Table holds
+for the positions after it, up to maxLength moves. gs is left unchanged.
+"""
+def getPrincipalVariation(gs, bestMove, maxLength):
+    variation = []
+    move = bestMove
+    keys = set()
+    while move is not None and len(variation) < maxLength and gs.zobristKey not in keys:
+        keys.add(gs.zobristKey)
+        variation.append(move)
+        gs.makeMove(move)
+        entry = SmartMoveFinder.transpositionTable.probe(gs.zobristKey)
+        move = findMoveByID(gs.getValidMoves(), entry[4]) if entry is not None else None
+    for _ in variation:
+        gs.undoMove()
+    return [getUCINotation(move) for move in variation]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the engine with the UCI protocol on stdin / stdout.')
+    parser.add_argument('--bitboards', action='store_true', help='Use the bitboard GameState')
+    args = parser.parse_args()
+
+    engine = UCIEngine(ChessEngineBitboard.GameState if args.bitboards else ChessEngineAdvanced.GameState)
+    for line in sys.stdin:
+        if not engine.handleCommand(line):
+            break
+    engine.stopSearch()
+
+
+if __name__ == "__main__":
+    main()
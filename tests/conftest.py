@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The engine's modules import each other as top level modules, the way they are run from the CHESS directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'CHESS'))
@@ -0,0 +1,34 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+import BatchEvaluation  # noqa: E402
+import ChessEngineAdvanced  # noqa: E402
+
+FENS = [
+    ChessEngineAdvanced.STARTING_FEN,
+    'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+    '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+]
+
+
+def testScoresMatchGameStates():
+    gameStates = []
+    for fen in FENS:
+        gs = ChessEngineAdvanced.GameState()
+        gs.loadFEN(fen)
+        gameStates.append(gs)
+    scores = BatchEvaluation.evaluateBatch(BatchEvaluation.encodeFENs(FENS))
+    assert list(scores) == [gs.evalScore for gs in gameStates]
+    assert list(BatchEvaluation.evaluateGameStates(gameStates)) == list(scores)
+
+
+@pytest.mark.parametrize('badFEN', [
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNX w KQkq - 0 1',  # Unknown piece
+    'rnbqkbnr/pppppppp/9/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',  # Unknown digit
+    'rnbqkbnr/ppppppp/8/8/8/8/PPPPPPPPP/RNBQKBNR w KQkq - 0 1',  # Rows of 7 and 9 squares
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP w KQkq - 0 1',  # 7 rows
+])
+def testInvalidPlacementNamesTheFEN(badFEN):
+    with pytest.raises(ValueError, match=badFEN.split()[0]):
+        BatchEvaluation.encodeFENs(FENS[:1] + [badFEN] + FENS[1:])
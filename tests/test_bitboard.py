@@ -0,0 +1,49 @@
+import random
+
+import pytest
+
+import ChessEngineAdvanced
+import ChessEngineBitboard
+
+
+def getMoveKeys(moves):
+    return sorted((move.moveID, move.pieceMoved, move.pieceCaptured, move.castle, move.enPassant) for move in moves)
+
+
+def getState(gs):
+    return (gs.board, gs.getFEN(), gs.zobristKey, gs.evalScore, gs.pieceCount, gs.whiteKingLocation,
+            gs.blackKingLocation)
+
+
+# Random games, with some moves taken back, played on both GameStates at once: they must agree after every move
+@pytest.mark.parametrize('seed', range(8))
+def testBitboardsMatchTheStringBoard(seed):
+    rng = random.Random(seed)
+    gs = ChessEngineBitboard.GameState()
+    reference = ChessEngineAdvanced.GameState()
+    for _ in range(150):
+        validMoves = gs.getValidMoves()
+        assert getMoveKeys(validMoves) == getMoveKeys(reference.getValidMoves())
+        assert getMoveKeys(gs.getCaptureMoves()) == getMoveKeys(reference.getCaptureMoves())
+        if not validMoves:
+            break
+        if gs.moveLog and rng.random() < 0.3:
+            gs.undoMove()
+            reference.undoMove()
+        else:
+            move = rng.choice(validMoves)
+            gs.makeMove(move)
+            reference.makeMove(move)
+        assert getState(gs) == getState(reference)
+
+
+def testBoardIsBuiltFromTheBitboards():
+    gs = ChessEngineBitboard.GameState()
+    board = gs.board
+    assert gs.board is board  # Built once per position
+    move = ChessEngineAdvanced.Move((6, 4), (4, 4), gs.board)
+    gs.makeMove(move)
+    assert board[4][4] == '--'  # Earlier boards are copies
+    assert gs.board[4][4] == 'wp' and gs.board[6][4] == '--'
+    gs.undoMove()
+    assert gs.board == board
@@ -0,0 +1,39 @@
+import pytest
+
+import ChessEngineAdvanced
+import ChessEngineBitboard
+
+GAME_STATE_CLASSES = (ChessEngineAdvanced.GameState, ChessEngineBitboard.GameState)
+
+
+@pytest.mark.parametrize('gameStateClass', GAME_STATE_CLASSES)
+@pytest.mark.parametrize('fen', [
+    ChessEngineAdvanced.STARTING_FEN,
+    'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+    '4k3/8/8/3pP3/8/8/8/4K3 w - d6 0 2',
+    '4k3/8/8/8/3Pp3/8/8/4K3 b - d3 0 1',
+])
+def testValidFEN(gameStateClass, fen):
+    gs = gameStateClass()
+    gs.loadFEN(fen)
+    assert gs.getFEN().split()[:4] == fen.split()[:4]
+
+
+@pytest.mark.parametrize('gameStateClass', GAME_STATE_CLASSES)
+@pytest.mark.parametrize('fen', [
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNX w KQkq - 0 1',  # Unknown piece
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQ1BNR w kq - 0 1',  # No white King
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR x KQkq - 0 1',  # Side to move
+    '4k3/8/8/8/8/8/8/6K1 w K - 0 1',  # Castling right without the King on its square
+    '4k3/8/8/8/8/8/8/4K2R w KQ - 0 1',  # Castling right without the Rook on its square
+    'r5k1/8/8/8/8/8/8/4K3 w q - 0 1',
+    '4k3/8/8/8/8/8/8/p3K3 b - - 0 1',  # Pawn on the first rank
+    'P3k3/8/8/8/8/8/8/4K3 w - - 0 1',  # Pawn on the last rank
+    '4k3/8/8/3pP3/8/8/8/4K3 w - d3 0 1',  # En passant square on the wrong rank for the side to move
+    '4k3/8/8/8/3Pp3/8/8/4K3 b - d6 0 1',
+])
+def testInvalidFEN(gameStateClass, fen):
+    gs = gameStateClass()
+    with pytest.raises(ValueError):
+        gs.loadFEN(fen)
+    assert gs.getFEN() == ChessEngineAdvanced.STARTING_FEN  # Left unchanged
@@ -0,0 +1,95 @@
+import threading
+
+import pytest
+
+import ChessEngineAdvanced
+import SmartMoveFinder
+
+SmartMoveFinder.PRINT_ROOT_MOVES = False
+
+
+@pytest.mark.parametrize('fen', [
+    'rnb1kbnr/pppp1ppp/8/4p3/6Pq/5P2/PPPPP2P/RNBQKBNR w KQkq - 1 3',  # Checkmate
+    '7k/5Q2/6K1/8/8/8/8/8 b - - 0 1',  # Stalemate
+])
+def testFindBestMoveWithoutValidMoves(fen):
+    gs = ChessEngineAdvanced.GameState()
+    gs.loadFEN(fen)
+    validMoves = gs.getValidMoves()
+    assert validMoves == []
+    assert SmartMoveFinder.findBestMove(gs, validMoves, timeLimit=None, maxDepth=2, useBook=False) is None
+
+
+POSITIONS = [
+    'r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4',
+    'rnbqkb1r/pp2pppp/3p1n2/8/3NP3/8/PPP2PPP/RNBQKB1R w KQkq - 1 5',
+    '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+]
+
+
+def serialSearch(fen, depth):
+    gs = ChessEngineAdvanced.GameState()
+    gs.loadFEN(fen)
+    SmartMoveFinder.transpositionTable.clear()
+    move = SmartMoveFinder.findBestMove(gs, gs.getValidMoves(), timeLimit=None, maxDepth=depth, useBook=False)
+    return move.moveID, SmartMoveFinder.bestScore
+
+
+@pytest.mark.parametrize('fen', POSITIONS)
+def testParallelSearchMatchesSerialSearch(fen):
+    parallelSearch = SmartMoveFinder.ParallelSearch(processes=2)
+    try:
+        gs = ChessEngineAdvanced.GameState()
+        gs.loadFEN(fen)
+        SmartMoveFinder.transpositionTable.clear()
+        move = parallelSearch.findBestMove(gs, gs.getValidMoves(), depth=3, useBook=False)
+        result = move.moveID, SmartMoveFinder.bestScore
+    finally:
+        parallelSearch.close()
+    assert result == serialSearch(fen, 3)
+
+
+# Stands in for the shared alpha of a ParallelSearch pool: after the first read, it reads as the best root score, as
+# if another process had just found it
+class RisingAlpha:
+    def __init__(self, bestScore):
+        self.bestScore = bestScore
+        self.reads = 0
+
+    @property
+    def value(self):
+        self.reads += 1
+        return -SmartMoveFinder.CHECKMATE if self.reads == 1 else self.bestScore
+
+    @value.setter
+    def value(self, value):
+        self.bestScore = value
+
+    def get_lock(self):
+        return threading.Lock()
+
+
+@pytest.mark.parametrize('fen', POSITIONS[:2])  # The endgame has too few nodes for the alpha to be looked at
+def testRootMoveSearchRestartsWhenAlphaRises(fen):
+    depth = 4
+    bestMoveID, bestScore = serialSearch(fen, depth)
+    gs = ChessEngineAdvanced.GameState()
+    gs.loadFEN(fen)
+    SmartMoveFinder.transpositionTable.clear()
+    SmartMoveFinder.findBestMove(gs, gs.getValidMoves(), timeLimit=None, maxDepth=depth - 1, useBook=False)
+    rootMoves = SmartMoveFinder.orderedRootMoves
+
+    results = []
+    restarts = 0
+    try:
+        for move in rootMoves:
+            SmartMoveFinder.parallelAlpha = RisingAlpha(bestScore)
+            results.append(SmartMoveFinder.searchRootMove(type(gs), fen, move.moveID, depth, fen))
+            restarts += SmartMoveFinder.parallelAlpha.reads > 2
+    finally:
+        SmartMoveFinder.parallelAlpha = None
+    assert restarts > 0  # Some of the searches did see the alpha rise
+
+    scores = [score for score, _ in results]
+    bestIndex = scores.index(max(scores))
+    assert (rootMoves[bestIndex].moveID, scores[bestIndex]) == (bestMoveID, bestScore)
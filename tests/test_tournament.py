@@ -0,0 +1,37 @@
+import pytest
+
+import ChessEngineAdvanced
+import SmartMoveFinder
+import Tournament
+
+
+def testParseConfiguration():
+    assert Tournament.parseConfiguration('nodes=500 PRINT_ROOT_MOVES=false DELTA_MARGIN=150') == \
+        {'nodes': 500, 'PRINT_ROOT_MOVES': False, 'DELTA_MARGIN': 150}
+
+
+@pytest.mark.parametrize('text', [
+    'DELTA_MARGIN=150',  # No search limit
+    'nodes=500 TIME_LIMIT=1',  # Limits are set with depth, nodes and time
+    'nodes=500 MAX_DEPTH=3',
+    'nodes=500 PRINT_ROOT_MOVES=maybe',
+    'nodes=500 UNKNOWN=1',
+])
+def testInvalidConfiguration(text):
+    with pytest.raises(ValueError):
+        Tournament.parseConfiguration(text)
+
+
+def testEnginesKeepTheirOwnTables(monkeypatch):
+    monkeypatch.setattr(Tournament, 'MAX_PLIES', 6)
+    savedTables = SmartMoveFinder.transpositionTable, SmartMoveFinder.killerMoves, SmartMoveFinder.historyTable
+    try:
+        Tournament.initTournamentWorker()
+        configuration = {'depth': 2}
+        record = Tournament.playGame(0, (configuration, configuration), [], ChessEngineAdvanced.GameState)
+        tablesA, tablesB = Tournament.engineTables
+        assert all(tableA is not tableB for tableA, tableB in zip(tablesA, tablesB))
+        assert len(record['moves']) == 6
+    finally:
+        SmartMoveFinder.useTranspositionTable(savedTables[0])
+        SmartMoveFinder.useMoveOrderingTables(*savedTables[1:])
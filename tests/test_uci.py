@@ -0,0 +1,27 @@
+import io
+
+import SmartMoveFinder
+import UCI
+
+
+def testMalformedGoIsReported():
+    output = io.StringIO()
+    engine = UCI.UCIEngine(output=output)
+    engine.handleCommand('position fen 6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1')
+    assert engine.handleCommand('go depth x nodes 100')
+    engine.stopSearch()
+    lines = output.getvalue().splitlines()
+    assert 'info string invalid value for depth' in lines
+    assert lines[-1] == 'bestmove d1d8'
+
+
+def testFailedSearchSendsBestmove(monkeypatch):
+    def failingSearch(*args, **kwargs):
+        raise RuntimeError('search failed')
+
+    monkeypatch.setattr(SmartMoveFinder, 'findBestMove', failingSearch)
+    output = io.StringIO()
+    engine = UCI.UCIEngine(output=output)
+    engine.handleCommand('go depth 2')
+    engine.stopSearch()
+    assert output.getvalue().splitlines()[-1] == 'bestmove 0000'